@@ -0,0 +1,730 @@
+"""
+Admission Control for Tarot Readings
+
+A reading that misses the cache costs a Gemini call and part of our quota.
+This module decides which readings may make one:
+- a token bucket per client (IP address, or session with RATE_LIMIT_KEY=session)
+  limits how often one visitor can start a model call
+- a bounded queue caps the readings waiting for one of the model call slots
+  of this process; when it is full, or a reading waits too long, the reading
+  is shed and served from the cache or the offline engine instead
+- single-flight coalescing lets concurrent requests for the same spread (the
+  same prompt) share one model call, streamed or not
+
+Rejected readings are not errors: TarotBot answers them with a fallback
+reading straight away.
+
+Rate limit buckets are kept in memory, per process, or in a SQLite file
+shared by all worker processes (RATE_LIMIT_BACKEND=sqlite), so a client gets
+the same allowance whichever worker serves it. With the memory backend each of
+N workers keeps its own buckets and a client can get up to N times the
+allowance, so manage_server.py and supervisor.py default to sqlite when they
+start more than one worker. The SQLite calls block, so the asynchronous path
+makes them on a worker thread (AdmissionControl.begin_async).
+
+Settings (environment variables):
+    RATE_LIMIT_BACKEND: "memory" (default), "sqlite" or "none"
+    RATE_LIMIT_PATH: SQLite file used by the sqlite backend (default
+        rate_limit.sqlite3 in the data directory, see data_dir.py)
+    RATE_LIMIT_RATE: Model readings per second a client regains (default 0.2)
+    RATE_LIMIT_BURST: Model readings a client can start at once (default 5)
+    RATE_LIMIT_KEY: "ip" (default) or "session" (the X-Session-ID header, else the IP)
+    RATE_LIMIT_TRUST_PROXY: Number of proxies in front of the server that add
+        to X-Forwarded-For; the IP is taken that many entries from the right,
+        as the entries to the left of it come from the client (default 0:
+        use the address of the connection)
+    ADMISSION_MAX_ACTIVE: Model calls at once per process (default MAX_CONCURRENT_READINGS or 32)
+    ADMISSION_MAX_QUEUE: Readings waiting for a model call slot (default 64)
+    ADMISSION_QUEUE_TIMEOUT: Seconds a reading waits for a slot before it is shed (default 5)
+    COALESCE_TIMEOUT: Seconds a coalesced request waits for the shared call (default 30)
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from data_dir import data_path, ensure_parent
+
+logger = logging.getLogger('tarot_bot')
+
+DEFAULT_RATE = 0.2
+DEFAULT_BURST = 5
+DEFAULT_MAX_CLIENTS = 10000
+DEFAULT_SQLITE_PATH = data_path('rate_limit.sqlite3')
+
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", os.getenv("MAX_CONCURRENT_READINGS", 32)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 5))
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", 30))
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip").lower()
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", 0))
+
+# Longest session ID kept as a rate limit key
+MAX_SESSION_LENGTH = 128
+
+
+class AdmissionRejected(Exception):
+    """Raised when a reading may not call the model; reason is the metrics label"""
+
+    reason = "rejected"
+
+
+class RateLimitedError(AdmissionRejected):
+    """Raised when the client has used up its model readings for now"""
+
+    reason = "rate_limited"
+
+
+class OverloadedError(AdmissionRejected):
+    """Raised when the queue for model call slots is full or too slow"""
+
+    reason = "overloaded"
+
+
+class FlightAbandonedError(Exception):
+    """Raised to coalesced requests when the request making the call went away"""
+
+
+def client_key(address, session=None, forwarded_for=None):
+    """
+    Identify the client a request is rate limited as
+
+    Args:
+        address (str): IP address of the connection
+        session (str): X-Session-ID header, used with RATE_LIMIT_KEY=session
+        forwarded_for (str): X-Forwarded-For header (all of its values, comma
+            separated), used with RATE_LIMIT_TRUST_PROXY
+
+    Returns:
+        str: Rate limit key, e.g. "ip:203.0.113.5" or "session:abc"
+    """
+    if RATE_LIMIT_KEY == "session" and session:
+        return "session:" + session[:MAX_SESSION_LENGTH]
+    if RATE_LIMIT_TRUST_PROXY > 0 and forwarded_for:
+        # Each proxy appends the address it got the request from, so only the
+        # entries our own proxies added can be trusted; the client may have
+        # sent any number of entries before them
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= RATE_LIMIT_TRUST_PROXY and hops[-RATE_LIMIT_TRUST_PROXY]:
+            return "ip:" + hops[-RATE_LIMIT_TRUST_PROXY]
+    return "ip:" + (address or "unknown")
+
+
+class MemoryRateLimiter:
+    """
+    Per-process token buckets, least recently seen clients forgotten first
+    """
+
+    # allow() returns without waiting on the disk or other processes
+    blocking = False
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_clients=DEFAULT_MAX_CLIENTS):
+        """
+        Args:
+            rate (float): Tokens a client regains per second
+            burst (float): Bucket size, the readings a client can start at once
+            max_clients (int): Buckets kept before the least recently seen is dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, client):
+        """
+        Take a token from a client's bucket
+
+        Args:
+            client (str): Key from client_key
+
+        Returns:
+            bool: True if the client may start a model call
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            self._buckets.move_to_end(client)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteRateLimiter:
+    """
+    Token buckets in an on-disk database, shared between worker processes
+    """
+
+    # allow() can wait up to the busy timeout for another worker's write lock
+    blocking = True
+
+    # Allowed calls between sweeps of buckets that have filled up again
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            rate (float): Tokens a client regains per second
+            burst (float): Bucket size, the readings a client can start at once
+        """
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._calls = 0
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " client TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated_at)")
+
+    def _connect(self):
+        """
+        Return this thread's connection, opening it on first use
+
+        Returns:
+            sqlite3.Connection: Connection in autocommit mode, so each
+                bucket update can take the write lock before reading
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            ensure_parent(self.path)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def allow(self, client):
+        """
+        Take a token from a client's bucket
+
+        The read and update run under SQLite's write lock, so two workers
+        cannot both spend the client's last token.
+
+        Args:
+            client (str): Key from client_key
+
+        Returns:
+            bool: True if the client may start a model call
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE client = ?", (client,)).fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            allowed = tokens >= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+                (client, tokens - 1 if allowed else tokens, now)
+            )
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0 and self.rate > 0:
+                # A bucket untouched this long is full again, the same as no row
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.burst / self.rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class _Waiter:
+    """A reading queued for a model call slot"""
+
+    __slots__ = ('event', 'loop', 'granted')
+
+    def __init__(self, event, loop=None):
+        self.event = event
+        self.loop = loop
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+
+class AdmissionGate:
+    """
+    Model call slots with a bounded first-in, first-out queue
+
+    Threads and asyncio tasks share the same slots and queue, so the Flask
+    and ASGI routes of one process are limited together.
+    """
+
+    def __init__(self, max_active=ADMISSION_MAX_ACTIVE, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        """
+        Args:
+            max_active (int): Model calls allowed at once
+            max_queue (int): Readings allowed to wait for a slot; more are shed
+            queue_timeout (float): Seconds a reading waits before it is shed
+        """
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.shed = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _enter(self, waiter_factory):
+        """
+        Take a free slot, or join the queue
+
+        Returns:
+            _Waiter or None: The queued waiter, or None if a slot was taken
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        with self._lock:
+            if self.active < self.max_active and not self._waiters:
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.shed += 1
+                raise OverloadedError(f"{len(self._waiters)} readings already waiting for the model")
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter):
+        """
+        Give up waiting, unless a slot was handed over in the meantime
+
+        Returns:
+            bool: True if the waiter holds a slot after all
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        """Free a slot, handing it straight to the longest waiting reading"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self.active -= 1
+
+    def acquire(self):
+        """
+        Wait for a model call slot
+
+        Raises:
+            OverloadedError: If the queue is full or the wait times out
+        """
+        waiter = self._enter(lambda: _Waiter(threading.Event()))
+        if waiter is None:
+            return
+        waiter.event.wait(self.queue_timeout)
+        if not self._leave_queue(waiter):
+            self._timed_out()
+
+    async def acquire_async(self):
+        """
+        Wait for a model call slot without blocking the event loop
+
+        Raises:
+            OverloadedError: If the queue is full or the wait times out
+        """
+        waiter = self._enter(lambda: _Waiter(asyncio.Event(), asyncio.get_running_loop()))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(waiter.event.wait(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._leave_queue(waiter):
+                self.release()
+            raise
+        if not self._leave_queue(waiter):
+            self._timed_out()
+
+    def _timed_out(self):
+        with self._lock:
+            self.shed += 1
+        raise OverloadedError(f"No model call slot within {self.queue_timeout:g}s")
+
+    @contextmanager
+    def slot(self):
+        """Hold a model call slot for the duration of the block"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Asynchronous version of slot"""
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def waiting(self):
+        """int: Readings queued for a slot"""
+        return len(self._waiters)
+
+
+class Flight:
+    """
+    One model call whose reading is shared with the requests that joined it
+
+    The request making the call publishes the cleaned reading, in one piece
+    or as it streams in; joined requests read the pieces as they arrive.
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self.done = False
+        self.error = None
+        # Set by the request making the call when the model cut the reading
+        # off at its token limit
+        self.truncated = False
+        self._condition = threading.Condition()
+        self._async_waiters = []
+
+    def publish(self, piece):
+        """
+        Share the next piece of the reading
+
+        Args:
+            piece (str): Cleaned text
+        """
+        with self._condition:
+            self.pieces.append(piece)
+            self._wake()
+
+    def _finish(self, error=None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self._wake()
+
+    def _wake(self):
+        """Wake every waiting request (the condition is held)"""
+        self._condition.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # That event loop has closed
+        self._async_waiters.clear()
+
+    def follow(self, timeout=COALESCE_TIMEOUT):
+        """
+        Yield the pieces of the reading as they are published
+
+        Args:
+            timeout (float): Seconds to wait for the whole reading
+
+        Yields:
+            str: Pieces of the reading, in order
+
+        Raises:
+            Exception: The error the call failed with
+            TimeoutError: If the reading is not finished in time
+        """
+        deadline = time.monotonic() + timeout
+        seen = 0
+        while True:
+            with self._condition:
+                while len(self.pieces) == seen and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"Coalesced reading not finished within {timeout:g}s")
+                    self._condition.wait(remaining)
+                pieces, done, error = self.pieces[seen:], self.done, self.error
+            seen += len(pieces)
+            yield from pieces
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def follow_async(self, timeout=COALESCE_TIMEOUT):
+        """
+        Asynchronous version of follow
+
+        Yields:
+            str: Pieces of the reading, in order
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        seen = 0
+        while True:
+            event = None
+            with self._condition:
+                pieces, done, error = self.pieces[seen:], self.done, self.error
+                if not pieces and not done:
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Coalesced reading not finished within {timeout:g}s") from None
+                continue
+
+            seen += len(pieces)
+            for piece in pieces:
+                yield piece
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def result(self, timeout=COALESCE_TIMEOUT):
+        """
+        Wait for the whole reading
+
+        Returns:
+            str: The reading
+        """
+        return ''.join(self.follow(timeout))
+
+    async def result_async(self, timeout=COALESCE_TIMEOUT):
+        """
+        Asynchronous version of result
+
+        Returns:
+            str: The reading
+        """
+        return ''.join([piece async for piece in self.follow_async(timeout)])
+
+
+class SingleFlight:
+    """
+    In-flight model calls of this process, keyed by reading cache key
+    """
+
+    def __init__(self):
+        self.led = 0
+        self.joined = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """
+        Join the call in flight for a key, or start one
+
+        Args:
+            key (str): Reading cache key of the spread
+
+        Returns:
+            tuple: (Flight, True if the caller makes the call and must lead it)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.led += 1
+            return flight, True
+
+    def join(self, key):
+        """
+        Join the call in flight for a key, if there is one
+
+        Args:
+            key (str): Reading cache key of the spread
+
+        Returns:
+            Flight or None: The flight to follow
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+            return flight
+
+    @contextmanager
+    def lead(self, key, flight):
+        """
+        Make the call for a flight; joined requests are released when the block ends
+
+        Args:
+            key (str): Key passed to begin
+            flight (Flight): Flight returned by begin
+        """
+        try:
+            yield flight
+        except BaseException as e:
+            # GeneratorExit or cancellation: the leading request went away
+            error = e if isinstance(e, Exception) else FlightAbandonedError("The request making the call went away")
+            self._end(key, flight, error)
+            raise
+        self._end(key, flight, None)
+
+    def _end(self, key, flight, error):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight._finish(error)
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class AdmissionControl:
+    """
+    Rate limiter, model call slots and request coalescing used by TarotBot
+    """
+
+    def __init__(self, limiter=None, gate=None, coalesce=True):
+        """
+        Args:
+            limiter: MemoryRateLimiter or SqliteRateLimiter, or None for no per-client limit
+            gate (AdmissionGate): Model call slots. Default uses the ADMISSION_* settings
+            coalesce (bool): Share model calls between identical concurrent readings
+        """
+        self.limiter = limiter
+        self.gate = gate or AdmissionGate()
+        self.flights = SingleFlight() if coalesce else None
+        self.rate_limited = 0
+
+    def begin(self, key, client=None):
+        """
+        Decide how a reading that missed the cache is produced
+
+        A request for a spread already being read joins that call without
+        spending a rate limit token.
+
+        Args:
+            key (str): Reading cache key of the spread
+            client (str): Key from client_key, or None for internal callers
+
+        Returns:
+            tuple: (Flight, leader). The leader makes the model call (inside
+                a gate slot and flights.lead); others follow the flight.
+
+        Raises:
+            RateLimitedError: If the client may not start a model call now
+        """
+        flight = self.flights.join(key) if self.flights is not None else None
+        if flight is not None:
+            return flight, False
+        if client is not None and self.limiter is not None:
+            self._check_allowed(self.limiter.allow(client), client)
+        return self._start(key)
+
+    async def begin_async(self, key, client=None):
+        """
+        Asynchronous version of begin
+
+        A limiter that can wait on SQLite (up to its busy timeout while
+        another worker holds the lock) is asked on a worker thread, so the
+        event loop keeps serving other requests meanwhile.
+        """
+        flight = self.flights.join(key) if self.flights is not None else None
+        if flight is not None:
+            return flight, False
+        if client is not None and self.limiter is not None:
+            if self.limiter.blocking:
+                allowed = await asyncio.to_thread(self.limiter.allow, client)
+            else:
+                allowed = self.limiter.allow(client)
+            self._check_allowed(allowed, client)
+        return self._start(key)
+
+    def _check_allowed(self, allowed, client):
+        """Raise RateLimitedError if the limiter refused the client"""
+        if not allowed:
+            self.rate_limited += 1
+            raise RateLimitedError(client)
+
+    def _start(self, key):
+        """Start the flight of an admitted reading"""
+        if self.flights is None:
+            return Flight(), True
+        # Another request may have started the call meanwhile; then this one joins it
+        return self.flights.begin(key)
+
+    @contextmanager
+    def lead(self, key, flight):
+        """Make the model call for a flight (see SingleFlight.lead)"""
+        if self.flights is None:
+            yield flight
+            return
+        with self.flights.lead(key, flight):
+            yield flight
+
+    def stats(self):
+        """
+        Report admission counters
+
+        Returns:
+            dict: Slots in use, queued readings, shed, rate limited and coalesced counts
+        """
+        return {
+            "rate_limiter": type(self.limiter).__name__ if self.limiter else None,
+            "clients": len(self.limiter) if self.limiter else 0,
+            "active": self.gate.active,
+            "max_active": self.gate.max_active,
+            "waiting": self.gate.waiting,
+            "max_queue": self.gate.max_queue,
+            "shed": self.gate.shed,
+            "rate_limited": self.rate_limited,
+            "in_flight": len(self.flights) if self.flights is not None else 0,
+            "coalesced": self.flights.joined if self.flights is not None else 0,
+        }
+
+
+def create_admission_control():
+    """
+    Build the admission control configured through environment variables
+
+    Returns:
+        AdmissionControl: The admission control
+    """
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    rate = float(os.getenv("RATE_LIMIT_RATE", DEFAULT_RATE))
+    burst = float(os.getenv("RATE_LIMIT_BURST", DEFAULT_BURST))
+
+    if backend_name == "none":
+        limiter = None
+    elif backend_name == "sqlite":
+        limiter = SqliteRateLimiter(os.getenv("RATE_LIMIT_PATH", DEFAULT_SQLITE_PATH), rate=rate, burst=burst)
+    else:
+        limiter = MemoryRateLimiter(rate=rate, burst=burst)
+
+    gate = AdmissionGate()
+    if limiter is not None:
+        logger.info(f"Rate limit: {burst:g} model readings per client, then one every {1 / rate:.0f}s ({backend_name})"
+                    if rate > 0 else f"Rate limit: {burst:g} model readings per client ({backend_name})")
+    logger.info(f"Admission: {gate.max_active} model calls at once, {gate.max_queue} queued")
+    return AdmissionControl(limiter, gate)
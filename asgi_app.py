@@ -0,0 +1,434 @@
+"""
+Asynchronous (ASGI) serving mode for the Tarot Bot API
+
+This module serves POST /api/tarot-reading and its streaming variant
+/api/tarot-reading/stream from an asyncio event loop, so a worker awaits the
+Gemini call instead of blocking a thread for several seconds. Every other
+route is passed through to the Flask app, on a pool of threads: a long
+batch response does not hold up /api/ready or /metrics in the same worker.
+
+Run it under an ASGI server, for example:
+    uvicorn asgi_app:app --port 5000 --workers 4
+
+Model calls are limited per client and per worker by admission.py, which
+also lets identical concurrent readings share one call.
+
+Settings (environment variables):
+    MAX_CONCURRENT_READINGS: Model calls allowed at once per worker (default 32;
+        ADMISSION_MAX_ACTIVE takes precedence)
+    READING_TIMEOUT: Seconds before a reading falls back to the offline engine (default 30)
+    PASSTHROUGH_THREADS: Flask requests handled at once per worker (default 16)
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from admission import client_key
+from card_store import get_card_store
+from instrumentation import start_request, finish_request, stage
+from tarot_bot import (
+    app as flask_app,
+    get_tarot_bot,
+    close_tarot_bot,
+    format_sse,
+    NO_CARDS_MESSAGE,
+    STARS_MISALIGNED_MESSAGE,
+    COSMIC_DISTURBANCE_MESSAGE,
+)
+
+logger = logging.getLogger('tarot_bot')
+
+READING_TIMEOUT = float(os.getenv("READING_TIMEOUT", 30))
+PASSTHROUGH_THREADS = int(os.getenv("PASSTHROUGH_THREADS", 16))
+
+READING_PATH = '/api/tarot-reading'
+STREAM_PATH = '/api/tarot-reading/stream'
+
+# Threads that run the Flask routes; created on first use, so none exist
+# in the supervisor before it forks the workers
+_passthrough_pool = ThreadPoolExecutor(max_workers=PASSTHROUGH_THREADS, thread_name_prefix='flask')
+
+
+class _PassthroughInstance(WsgiToAsgiInstance):
+    """
+    One Flask request, run on the passthrough pool
+
+    asgiref runs every WSGI request of the process on one shared thread
+    (thread_sensitive=True), so a streaming batch response would block all
+    other Flask routes until it finished.
+    """
+
+    # The undecorated method (class attribute access would bind the wrapper)
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=_passthrough_pool)
+
+
+class _Passthrough(WsgiToAsgi):
+    """WsgiToAsgi that runs the WSGI app on the passthrough pool"""
+
+    async def __call__(self, scope, receive, send):
+        await _PassthroughInstance(self.wsgi_application)(scope, receive, send)
+
+
+# Everything except the reading endpoint is handled by Flask
+_flask_asgi = _Passthrough(flask_app)
+
+
+def _request_id_header(context):
+    """
+    Build the X-Request-ID response header
+
+    Args:
+        context (RequestContext): Value returned by start_request, or None
+
+    Returns:
+        list: The header, or nothing when requests are not being tracked
+    """
+    return [(b'x-request-id', context.request_id.encode('latin-1'))] if context is not None else []
+
+
+def _header(scope, name):
+    """
+    Read a request header
+
+    Args:
+        scope (dict): ASGI connection scope
+        name (bytes): Lower-case header name
+
+    Returns:
+        str or None: The first value of the header, or None if absent
+    """
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _start_request(scope, route):
+    """
+    Start timing an ASGI request, using the client's X-Request-ID if sent
+
+    Args:
+        scope (dict): ASGI connection scope
+        route (str): Name of the endpoint, used as the metrics label
+
+    Returns:
+        RequestContext or None: See instrumentation.start_request
+    """
+    return start_request(route, _header(scope, b'x-request-id'))
+
+
+def _client(scope):
+    """
+    Rate limit key of the client making a request
+
+    Args:
+        scope (dict): ASGI connection scope
+
+    Returns:
+        str: See admission.client_key
+    """
+    address = scope.get('client')
+    # A proxy may add its own X-Forwarded-For line after the client's
+    forwarded_for = ','.join(value.decode('latin-1') for key, value in scope.get('headers', ())
+                             if key == b'x-forwarded-for')
+    return client_key(address[0] if address else None, _header(scope, b'x-session-id'), forwarded_for or None)
+
+
+async def _send_json(send, payload, status=200, context=None):
+    """
+    Send a JSON response
+
+    Args:
+        send: ASGI send callable
+        payload (dict): Response body
+        status (int): HTTP status code
+        context (RequestContext): Request being answered, for its ID and status
+    """
+    with stage("serialize"):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    if context is not None:
+        context.status = status
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            (b'access-control-allow-origin', b'*'),
+            *_request_id_header(context),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    """
+    Read the full request body
+
+    Args:
+        receive: ASGI receive callable
+
+    Returns:
+        bytes or None: The body, or None if the client disconnected
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _wait_for_disconnect(receive):
+    """
+    Return once the client has gone away
+
+    Args:
+        receive: ASGI receive callable (request body already consumed)
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _generate_reading(cards_data, mode=None, client=None, focus=None):
+    """
+    Generate a reading within the timeout
+
+    Args:
+        cards_data (list): Cards sent by the client
+        mode (str): "gemini" or "offline", or None for the bot's mode
+        client (str): Rate limit key of the requester
+        focus (str): What the reading concentrates on, e.g. "love"
+
+    Returns:
+        tuple: (reading, source), see tarot_bot.READING_SOURCES
+    """
+    try:
+        bot = get_tarot_bot()
+        return await asyncio.wait_for(bot.generate_reading_async(cards_data, mode, client, focus), READING_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Reading timed out after {READING_TIMEOUT:g}s, using the offline reading")
+        reading = get_tarot_bot().offline_reading(cards_data, focus)
+        return reading, "message" if reading == COSMIC_DISTURBANCE_MESSAGE else "fallback_offline"
+    except ValueError:
+        return STARS_MISALIGNED_MESSAGE, "message"
+
+
+async def tarot_reading(scope, receive, send):
+    """
+    Handle POST /api/tarot-reading
+
+    The model call is cancelled if the client disconnects before it finishes.
+    """
+    context = _start_request(scope, 'tarot_reading')
+    try:
+        await _tarot_reading(receive, send, context, _client(scope), _header(scope, b'x-session-id'))
+    finally:
+        finish_request(context)
+
+
+async def _tarot_reading(receive, send, context, client, session):
+    body = await _read_body(receive)
+    if body is None:
+        return
+
+    try:
+        with stage("parse"):
+            data = json.loads(body or b'{}')
+            cards_data = data.get('cards', [])
+            mode = data.get('mode')
+            focus = data.get('focus')
+    except (ValueError, AttributeError):
+        await _send_json(send, {"reading": STARS_MISALIGNED_MESSAGE, "source": "message"}, context=context)
+        return
+
+    if not cards_data:
+        await _send_json(send, {"reading": NO_CARDS_MESSAGE, "source": "message"}, context=context)
+        return
+
+    reading_task = asyncio.create_task(_generate_reading(cards_data, mode, client, focus))
+    disconnect_task = asyncio.create_task(_wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({reading_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    if reading_task not in done:
+        # Client went away; stop waiting on the model
+        reading_task.cancel()
+        logger.info("Client disconnected, reading cancelled")
+        return
+
+    disconnect_task.cancel()
+    try:
+        reading, source = reading_task.result()
+        bot = get_tarot_bot()
+        combinations = bot.find_combinations(cards_data)
+        bot.remember_reading(session, cards_data, focus, reading, source)
+    except Exception:
+        reading, source, combinations = COSMIC_DISTURBANCE_MESSAGE, "message", []
+
+    await _send_json(send, {"reading": reading, "source": source, "combinations": combinations}, context=context)
+
+
+async def _stream_events(cards_data, send, mode=None, client=None, focus=None, session=None):
+    """
+    Generate a reading and send each piece as a Server-Sent Event
+
+    Args:
+        cards_data (list): Cards sent by the client
+        send: ASGI send callable (response already started)
+        mode (str): "gemini" or "offline", or None for the bot's mode
+        client (str): Rate limit key of the requester
+        focus (str): What the reading concentrates on, e.g. "love"
+        session (str): X-Session-ID of the visitor, for the reading history
+    """
+    started = time.perf_counter()
+    first_chunk_ms = None
+    pieces = []
+    outcome = {}
+
+    async def send_event(data, event=None, more_body=True):
+        await send({
+            'type': 'http.response.body',
+            'body': format_sse(data, event).encode('utf-8'),
+            'more_body': more_body,
+        })
+
+    async def produce():
+        nonlocal first_chunk_ms
+        bot = get_tarot_bot()
+        async for piece in bot.stream_reading_summary_async(cards_data, mode, client, focus, outcome):
+            if first_chunk_ms is None:
+                first_chunk_ms = (time.perf_counter() - started) * 1000
+            pieces.append(piece)
+            await send_event({"text": piece})
+
+    try:
+        await asyncio.wait_for(produce(), READING_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Streamed reading timed out after {READING_TIMEOUT:g}s")
+        if first_chunk_ms is None:
+            pieces = [get_tarot_bot().offline_reading(cards_data, focus)]
+            outcome["source"] = "message" if pieces[0] == COSMIC_DISTURBANCE_MESSAGE else "fallback_offline"
+            await send_event({"text": pieces[0]})
+        else:
+            outcome["source"] = "partial"
+    except ValueError:
+        outcome["source"] = "message"
+        await send_event({"text": STARS_MISALIGNED_MESSAGE})
+    get_tarot_bot().remember_reading(session, cards_data, focus, ''.join(pieces), outcome.get("source"))
+
+    total_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Streamed reading: first chunk {first_chunk_ms or 0:.0f} ms, total {total_ms:.0f} ms")
+    await send_event(
+        {
+            "first_chunk_ms": round(first_chunk_ms or 0, 1),
+            "total_ms": round(total_ms, 1),
+            "source": outcome.get("source"),
+            "combinations": get_tarot_bot().find_combinations(cards_data),
+        },
+        event="done",
+        more_body=False,
+    )
+
+
+async def tarot_reading_stream(scope, receive, send):
+    """
+    Handle POST /api/tarot-reading/stream
+
+    The reading is sent as Server-Sent Events while the model writes it.
+    Generation stops if the client disconnects.
+    """
+    context = _start_request(scope, 'tarot_reading_stream')
+    try:
+        await _tarot_reading_stream(receive, send, context, _client(scope), _header(scope, b'x-session-id'))
+    finally:
+        finish_request(context)
+
+
+async def _tarot_reading_stream(receive, send, context, client, session):
+    body = await _read_body(receive)
+    if body is None:
+        return
+
+    try:
+        with stage("parse"):
+            data = json.loads(body or b'{}')
+            cards_data = data.get('cards', [])
+            mode = data.get('mode')
+            focus = data.get('focus')
+    except (ValueError, AttributeError):
+        cards_data, mode, focus = [], None, None
+
+    if context is not None:
+        context.status = 200
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'access-control-allow-origin', b'*'),
+            *_request_id_header(context),
+        ],
+    })
+
+    if not cards_data:
+        await send({
+            'type': 'http.response.body',
+            'body': (format_sse({"text": NO_CARDS_MESSAGE}) + format_sse({"source": "message"}, event="done")).encode('utf-8'),
+        })
+        return
+
+    stream_task = asyncio.create_task(_stream_events(cards_data, send, mode, client, focus, session))
+    disconnect_task = asyncio.create_task(_wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    if stream_task not in done:
+        stream_task.cancel()
+        logger.info("Client disconnected, streamed reading cancelled")
+        return
+
+    disconnect_task.cancel()
+
+
+async def lifespan(scope, receive, send):
+    """
+    Load the card store and tarot bot before the worker accepts requests, and
+    write out the buffered reading history when the worker stops
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_card_store()
+            try:
+                get_tarot_bot()
+            except ValueError as e:
+                logger.warning(f"Tarot bot not initialized at startup: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, close_tarot_bot)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == READING_PATH and scope['method'] == 'POST':
+        await tarot_reading(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == STREAM_PATH and scope['method'] == 'POST':
+        await tarot_reading_stream(scope, receive, send)
+    else:
+        await _flask_asgi(scope, receive, send)
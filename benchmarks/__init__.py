@@ -0,0 +1,6 @@
+"""
+Benchmarks for the Tarot Bot
+
+Run a benchmark from the project root, for example:
+    python -m benchmarks.card_lookup
+"""
@@ -0,0 +1,69 @@
+"""
+Admission control benchmark
+
+Simulates a burst of visitors drawing at the same moment: 64 concurrent
+readings over 8 distinct spreads, against a fake model with 300 ms latency
+and no reading cache. Compares model calls and latency with and without
+single-flight coalescing, then overloads the model call slots to show how
+quickly shed readings are answered.
+
+Usage:
+    python -m benchmarks.admission
+"""
+
+import time
+import asyncio
+import logging
+
+from admission import AdmissionControl, AdmissionGate
+from fake_gemini import FakeGenerativeModel
+from reading_cache import ReadingCache, MemoryBackend
+from tarot_bot import TarotBot
+
+NAMES = ["The Fool", "The Magician", "The High Priestess", "The Empress", "The Emperor",
+         "The Lovers", "The Chariot", "Strength", "The Hermit", "Death", "The Star"]
+
+
+def spread(index):
+    return [{"name": NAMES[(index + k) % len(NAMES)], "position": f"{k + 1}", "isReversed": False}
+            for k in range(3)]
+
+
+async def burst(bot, requests, spreads):
+    async def one(index):
+        started = time.perf_counter()
+        reading = await bot.generate_reading_summary_async(spread(index % spreads))
+        return time.perf_counter() - started, reading
+
+    return await asyncio.gather(*[one(index) for index in range(requests)])
+
+
+def run(name, gate, coalesce, requests=64, spreads=8):
+    model = FakeGenerativeModel(latency=0.3, jitter=0)
+    # A cache that never serves hits, so every request is a miss
+    cache = ReadingCache(MemoryBackend(), variants=10 ** 6)
+    bot = TarotBot(generative_model=model, reading_cache=cache,
+                   admission=AdmissionControl(None, gate, coalesce=coalesce))
+
+    started = time.perf_counter()
+    results = asyncio.run(burst(bot, requests, spreads))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _ in results)
+    from_model = sum(reading == model.text for _, reading in results)
+    print(f"  {name:34s} {model.calls:5d} calls  {from_model:3d}/{requests} from the model  "
+          f"p50 {latencies[len(latencies) // 2] * 1000:6.0f} ms  "
+          f"max {latencies[-1] * 1000:6.0f} ms  wall {wall * 1000:6.0f} ms")
+
+
+def main():
+    logging.getLogger('tarot_bot').setLevel(logging.WARNING)
+    print("64 concurrent readings of 8 spreads, fake model at 300 ms:")
+    run("no coalescing, 64 slots", AdmissionGate(64, 64), coalesce=False)
+    run("coalescing, 64 slots", AdmissionGate(64, 64), coalesce=True)
+    run("no coalescing, 4 slots, queue 8", AdmissionGate(4, 8, queue_timeout=5), coalesce=False)
+    run("coalescing, 4 slots, queue 8", AdmissionGate(4, 8, queue_timeout=5), coalesce=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Card meaning lookup benchmark
+
+Compares the compiled card table (card_table.py) with the original approach of
+walking the raw JSON dictionaries on every lookup, and times loading the
+binary table against parsing newtarot.json.
+
+Usage:
+    python -m benchmarks.card_lookup
+"""
+
+import json
+import time
+import timeit
+import random
+
+from card_store import DEFAULT_DATA_PATH
+from card_table import CardTable, table_path_for, build
+
+
+def legacy_meaning(tarot_data, card_name, is_reversed):
+    """
+    Card meaning lookup as originally done in TarotBot._get_card_meaning
+    """
+    if not tarot_data or card_name not in tarot_data:
+        return "ไม่พบข้อมูลไพ่"
+
+    card_data = tarot_data[card_name]
+
+    if is_reversed:
+        if 'reversed_meanings' in card_data and 'general' in card_data['reversed_meanings']:
+            return card_data['reversed_meanings']['general']
+        elif 'keywords' in card_data and 'reversed' in card_data['keywords']:
+            return card_data['keywords']['reversed']
+    else:
+        if 'upright_meanings' in card_data and 'general' in card_data['upright_meanings']:
+            return card_data['upright_meanings']['general']
+        elif 'keywords' in card_data and 'upright' in card_data['keywords']:
+            return card_data['keywords']['upright']
+
+    return "ไม่พบความหมายของไพ่"
+
+
+def legacy_keyword(tarot_data, card_name, is_reversed):
+    """
+    Keyword lookup as originally done in TarotBot._create_tarot_prompt
+    """
+    if card_name in tarot_data:
+        card_data = tarot_data[card_name]
+        if is_reversed and 'keywords' in card_data and 'reversed' in card_data['keywords']:
+            return card_data['keywords']['reversed']
+        elif not is_reversed and 'keywords' in card_data and 'upright' in card_data['keywords']:
+            return card_data['keywords']['upright']
+    return None
+
+
+def main():
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as file:
+        cards = json.load(file)
+    tarot_data = {card['name']: card for card in cards}
+
+    table_path = table_path_for(DEFAULT_DATA_PATH)
+    build(DEFAULT_DATA_PATH, table_path)
+    table = CardTable.load(table_path)
+
+    # A fixed sample of lookups, including an unknown card
+    rng = random.Random(0)
+    names = list(tarot_data) + ["Unknown Card"]
+    lookups = [(rng.choice(names), rng.random() < 0.5) for _ in range(1000)]
+
+    for name, is_reversed in lookups:
+        assert table.meaning(name, is_reversed) == legacy_meaning(tarot_data, name, is_reversed)
+        assert table.keyword(name, is_reversed) == legacy_keyword(tarot_data, name, is_reversed)
+
+    def run_legacy():
+        for name, is_reversed in lookups:
+            legacy_meaning(tarot_data, name, is_reversed)
+            legacy_keyword(tarot_data, name, is_reversed)
+
+    def run_table():
+        for name, is_reversed in lookups:
+            table.meaning(name, is_reversed)
+            table.keyword(name, is_reversed)
+
+    repeat = 200
+    legacy = min(timeit.repeat(run_legacy, number=repeat, repeat=5)) / (repeat * len(lookups))
+    compiled = min(timeit.repeat(run_table, number=repeat, repeat=5)) / (repeat * len(lookups))
+
+    print("Lookup (meaning + keywords), per card:")
+    print(f"  raw JSON dicts: {legacy * 1e9:8.0f} ns")
+    print(f"  compiled table: {compiled * 1e9:8.0f} ns  ({legacy / compiled:.1f}x)")
+
+    started = time.perf_counter()
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as file:
+        json.load(file)
+    parse_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    CardTable.load(table_path)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    print("Startup:")
+    print(f"  parse newtarot.json: {parse_ms:6.2f} ms")
+    print(f"  load binary table:   {load_ms:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
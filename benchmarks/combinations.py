@@ -0,0 +1,92 @@
+"""
+Card combination index benchmark
+
+Times building the combination index (combination_index.py) and finding the
+combinations in random 10-card spreads, compared with scanning every drawn
+card's suggested combination lists for each pair. Both approaches are
+checked to find the same pairs.
+
+Usage:
+    python -m benchmarks.combinations
+"""
+
+import json
+import time
+import timeit
+import random
+from itertools import combinations
+
+from card_store import DEFAULT_DATA_PATH
+from combination_index import CombinationIndex, _name_key
+
+
+def scan_combinations(tarot_data, cards_data):
+    """
+    Find combinations by scanning both cards' lists for every pair
+
+    Returns:
+        set: frozensets of the (name, is_reversed) sides of each matching pair
+    """
+    found = set()
+    for card_a, card_b in combinations(cards_data, 2):
+        for card, other in ((card_a, card_b), (card_b, card_a)):
+            data = tarot_data.get(card['name'])
+            if data is None:
+                continue
+            orientation = 'reversed' if card['isReversed'] else 'upright'
+            for entry in data.get(f'{orientation}_suggested_combinations') or ():
+                reference = _name_key(entry['card'])
+                is_reversed = reference.endswith(' reversed')
+                if is_reversed:
+                    reference = _name_key(reference[:-len(' reversed')])
+                if reference == _name_key(other['name']) and is_reversed == other['isReversed']:
+                    found.add(frozenset(((card['name'], card['isReversed']), (other['name'], other['isReversed']))))
+    return found
+
+
+def main():
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as file:
+        cards = json.load(file)
+    tarot_data = {card['name']: card for card in cards}
+
+    started = time.perf_counter()
+    index = CombinationIndex.from_cards(cards)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"Build index: {build_ms:.2f} ms ({len(index)} pairs, {index.unresolved} unresolved entries)")
+
+    rng = random.Random(0)
+    names = list(tarot_data)
+    spreads = [
+        [{"name": name, "isReversed": rng.random() < 0.5} for name in rng.sample(names, 10)]
+        for _ in range(500)
+    ]
+
+    matches = 0
+    for spread in spreads:
+        found = {
+            frozenset(zip(match['cards'], match['reversed']))
+            for match in index.find(spread)
+        }
+        assert found == scan_combinations(tarot_data, spread)
+        matches += len(found)
+    print(f"Average combinations per 10-card spread: {matches / len(spreads):.2f}")
+
+    def run_scan():
+        for spread in spreads:
+            scan_combinations(tarot_data, spread)
+
+    def run_index():
+        for spread in spreads:
+            index.find(spread)
+
+    repeat = 20
+    scan = min(timeit.repeat(run_scan, number=repeat, repeat=3)) / (repeat * len(spreads))
+    indexed = min(timeit.repeat(run_index, number=repeat, repeat=3)) / (repeat * len(spreads))
+
+    print("Find combinations in a 10-card spread:")
+    print(f"  scan card lists: {scan * 1e6:8.1f} us")
+    print(f"  indexed lookup:  {indexed * 1e6:8.1f} us  ({scan / indexed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare two benchmark result files
+
+Matches results by name and flags every one that got worse by more than
+the threshold (in the direction given by its "better" field). Exits with
+status 1 if any result regressed, so it can gate a CI job:
+
+    python -m benchmarks.micro --json baseline.json
+    ... change the code ...
+    python -m benchmarks.micro --json current.json
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.1]
+"""
+
+import sys
+import json
+import argparse
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare the results of two runs
+
+    Args:
+        baseline (dict): Earlier result file
+        current (dict): Later result file
+        threshold (float): Relative change treated as a regression, e.g. 0.1 for 10%
+
+    Returns:
+        list: (name, old value, new value, unit, relative change, regressed) for
+            results present in both files; a positive change is an improvement
+    """
+    previous = {entry["name"]: entry for entry in baseline["results"]}
+    rows = []
+    for entry in current["results"]:
+        old = previous.get(entry["name"])
+        if old is None:
+            continue
+        before, after = old["value"], entry["value"]
+        if before:
+            change = (after - before) / abs(before)
+        else:
+            change = 0.0 if after == before else float('inf')
+        if entry.get("better", "lower") == "lower":
+            change = -change
+        rows.append((entry["name"], before, after, entry["unit"], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find regressions between two benchmark runs")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative change treated as a regression")
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    if baseline.get("benchmark") != current.get("benchmark"):
+        print(f"Warning: comparing {baseline.get('benchmark')} with {current.get('benchmark')}")
+    for label, report in (("baseline", baseline), ("current", current)):
+        environment = report.get("environment", {})
+        print(f"{label:9s} {report.get('created')}  commit {environment.get('commit')}  "
+              f"{environment.get('cpus')} CPUs  Python {environment.get('python')}")
+
+    rows = compare(baseline, current, args.threshold)
+    regressions = 0
+    for name, before, after, unit, change, regressed in rows:
+        marker = "REGRESSION" if regressed else ("better" if change > args.threshold else "")
+        print(f"  {name:34s} {before:10.2f} -> {after:10.2f} {unit:9s} {change * 100:+7.1f}%  {marker}")
+        regressions += regressed
+
+    if regressions:
+        print(f"{regressions} of {len(rows)} results regressed by more than {args.threshold * 100:g}%")
+        return 1
+    print(f"No regressions in {len(rows)} results")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Instrumentation overhead benchmark
+
+Times a stage timer (instrumentation.stage) with metrics turned on and off,
+then the whole POST /api/tarot-reading path through the Flask test client
+with a zero-latency fake model and no reading cache, with metrics on, off,
+and with JSON request logs. Finally prints the stage breakdown recorded for
+those requests.
+
+Usage:
+    python -m benchmarks.instrumentation
+"""
+
+import os
+import time
+import timeit
+import logging
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+os.environ.setdefault("FAKE_GEMINI_LATENCY", "0")
+os.environ.setdefault("FAKE_GEMINI_JITTER", "0")
+os.environ.setdefault("READING_CACHE_BACKEND", "none")
+
+import instrumentation
+import tarot_bot
+from instrumentation import stage
+
+CARDS = [
+    {"name": "The Fool", "position": "Past", "isReversed": False},
+    {"name": "The Star", "position": "Present", "isReversed": True},
+    {"name": "Death", "position": "Future", "isReversed": False},
+    {"name": "Ace of Cups", "position": "Advice", "isReversed": False},
+    {"name": "Ten of Swords", "position": "Outcome", "isReversed": True},
+]
+
+
+def time_stage(number=200000):
+    def run():
+        with stage("bench"):
+            pass
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def time_requests(client, number=200):
+    def run():
+        client.post('/api/tarot-reading', json={"cards": CARDS})
+    run()
+    return timeit.timeit(run, number=number) / number
+
+
+def main():
+    logging.getLogger('tarot_bot').setLevel(logging.WARNING)
+    client = tarot_bot.app.test_client()
+
+    print("Stage timer (enter + exit):")
+    for enabled in (False, True):
+        instrumentation.METRICS_ENABLED = enabled
+        print(f"  metrics {'on ' if enabled else 'off'}  {time_stage() * 1e9:8.0f} ns")
+
+    print("POST /api/tarot-reading (fake model, no cache):")
+    configurations = (("metrics off", False, "text"), ("metrics on", True, "text"),
+                      ("metrics on, JSON logs", True, "json"))
+
+    # Log request lines to /dev/null for the JSON runs: measure formatting,
+    # not terminal output
+    logger = logging.getLogger('tarot_bot')
+    json_handler = logging.FileHandler(os.devnull)
+    json_handler.setFormatter(instrumentation.JsonFormatter())
+    logger.propagate = False
+
+    # Alternate the configurations so background noise affects them alike
+    results = {}
+    for _ in range(5):
+        for name, enabled, log_format in configurations:
+            instrumentation.METRICS_ENABLED = enabled
+            instrumentation.LOG_FORMAT = log_format
+            if log_format == "json":
+                logger.addHandler(json_handler)
+                logger.setLevel(logging.INFO)
+            elapsed = time_requests(client)
+            logger.removeHandler(json_handler)
+            logger.setLevel(logging.WARNING)
+            results[name] = min(results.get(name, elapsed), elapsed)
+    for name, _, _ in configurations:
+        print(f"  {name:24s} {results[name] * 1e6:8.1f} us/request")
+    overhead = results["metrics on"] - results["metrics off"]
+    print(f"  metrics overhead: {overhead * 1e6:.1f} us/request ({overhead / results['metrics off'] * 100:.1f}%)")
+
+    print("Stage breakdown (mean per request):")
+    for labels, (_, total, count) in sorted(instrumentation.STAGE_SECONDS._values.items()):
+        if labels[0] == "bench":
+            continue
+        print(f"  {labels[0]:10s} {total / count * 1e6:8.1f} us")
+
+    started = time.perf_counter()
+    page = instrumentation.render_metrics()
+    print(f"Render /metrics: {(time.perf_counter() - started) * 1000:.2f} ms, {len(page)} bytes")
+
+
+if __name__ == "__main__":
+    main()
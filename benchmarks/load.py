@@ -0,0 +1,306 @@
+"""
+End-to-end load test of POST /api/tarot-reading
+
+Starts the local fake Gemini API (fake_gemini_server.py) and the tarot API
+server pointed at it, then sends random 10-card spreads from a rising number
+of concurrent clients. For each concurrency level it reports throughput,
+latency percentiles (p50/p95/p99), HTTP errors, fallbacks (readings the
+server reports as coming from the cache, history or offline engine after a
+failed model call, or mystical messages) and the failures injected by the
+fake. With --stream the streaming endpoint
+is used and the time to the first event is reported too.
+
+The reading cache and the per-client rate limit are turned off so every
+request reaches the model.
+
+Usage:
+    python -m benchmarks.load [--server asgi|flask|URL] [--workers 1]
+        [--concurrency 1,8,32] [--requests N] [--stream]
+        [--latency lognormal:0.2,0.5] [--errors 503:0.01]
+        [--tokens-per-second 1000] [--json PATH]
+
+--server URL sends the requests to a server that is already running (it
+must be configured with GEMINI_API_ENDPOINT itself); the fake is then not
+started.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+from benchmarks import results
+from card_store import get_card_store
+from fake_gemini_server import start_in_thread, parse_errors
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values
+
+    Returns:
+        float: The percentile, or 0 for no values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def start_api_server(kind, port, endpoint, workers):
+    """
+    Start the tarot API server in a subprocess
+
+    Args:
+        kind (str): "asgi" (uvicorn with asgi_app) or "flask" (Flask's threaded server)
+        port (int): Port to listen on
+        endpoint (str): URL of the fake Gemini API
+        workers (int): uvicorn worker processes
+
+    Returns:
+        subprocess.Popen: The server process
+    """
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_API_ENDPOINT": endpoint,
+        "READING_CACHE_BACKEND": "none",
+        "RATE_LIMIT_BACKEND": "none",
+    }
+    env.pop("GEMINI_FAKE", None)
+    if kind == "asgi":
+        command = [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    else:
+        command = [sys.executable, '-c',
+                   f"from tarot_bot import app; app.run(port={port}, threaded=True)"]
+    return subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(host, port, timeout=60):
+    """Poll the health check until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('HEAD', '/api/tarot-reading')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The API server on port {port} did not start")
+
+
+def fallback_check(reading_sources, fallback_messages):
+    """
+    Build the test for a response that carried a fallback instead of a reading
+
+    Args:
+        reading_sources (frozenset): Sources of readings made as asked
+            (tarot_bot.READING_SOURCES)
+        fallback_messages (frozenset): Mystical messages, the only fallback
+            recognisable from a server that reports no source
+
+    Returns:
+        function: is_fallback(reading, source) -> bool
+    """
+    def is_fallback(reading, source):
+        if source is None:
+            return reading in fallback_messages
+        return source not in reading_sources
+    return is_fallback
+
+
+def run_level(host, port, concurrency, total, spreads, stream, is_fallback):
+    """
+    Send a fixed number of requests from several client threads
+
+    Args:
+        host (str): API server host
+        port (int): API server port
+        concurrency (int): Client threads, each with its own keep-alive connection
+        total (int): Requests to send
+        spreads (list): Spreads to send, in rotation
+        stream (bool): Use the streaming endpoint
+        is_fallback (function): Built by fallback_check
+
+    Returns:
+        dict: Latencies (and times to first event) in seconds, errors, fallbacks, wall time
+    """
+    path = '/api/tarot-reading/stream' if stream else '/api/tarot-reading'
+    latencies, first_events = [], []
+    counts = {"errors": 0, "fallbacks": 0}
+    lock = threading.Lock()
+    next_index = [0]
+
+    def take():
+        with lock:
+            index = next_index[0]
+            next_index[0] += 1
+        return index if index < total else None
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=120)
+        mine, mine_first, errors, fallbacks = [], [], 0, 0
+        while True:
+            index = take()
+            if index is None:
+                break
+            body = json.dumps({"cards": spreads[index % len(spreads)]})
+            started = time.perf_counter()
+            try:
+                connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                if stream:
+                    first = None
+                    text = []
+                    source = None
+                    for line in response:
+                        if first is None and line.startswith(b'data:'):
+                            first = time.perf_counter() - started
+                        if line.startswith(b'data:'):
+                            event = json.loads(line[5:])
+                            text.append(event.get('text', ''))
+                            source = event.get('source', source)
+                    reading = ''.join(text)
+                    if first is not None:
+                        mine_first.append(first)
+                else:
+                    payload = json.loads(response.read())
+                    reading, source = payload.get('reading', ''), payload.get('source')
+                elapsed = time.perf_counter() - started
+                if response.status != 200:
+                    errors += 1
+                elif is_fallback(reading, source):
+                    fallbacks += 1
+                mine.append(elapsed)
+                if response.will_close:
+                    connection.close()
+            except (OSError, ValueError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            first_events.extend(mine_first)
+            counts["errors"] += errors
+            counts["fallbacks"] += fallbacks
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "latencies": sorted(latencies),
+        "first_events": sorted(first_events),
+        "wall": wall,
+        **counts,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test POST /api/tarot-reading")
+    parser.add_argument('--server', default='asgi', help="asgi, flask or the URL of a running server")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers for --server asgi")
+    parser.add_argument('--concurrency', default='1,8,32', help="Comma-separated client counts")
+    parser.add_argument('--requests', type=int, default=0, help="Requests per level (default 10 per client, at least 40)")
+    parser.add_argument('--stream', action='store_true', help="Use /api/tarot-reading/stream")
+    parser.add_argument('--latency', default='lognormal:0.2,0.5', help="Fake model time to first token")
+    parser.add_argument('--errors', default='', help="Fake model failures, e.g. 503:0.01")
+    parser.add_argument('--tokens-per-second', type=float, default=1000.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', default=None, help="Write machine-readable results here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    # Imported here so the fake server and clients don't pay for it when unused
+    from tarot_bot import READING_SOURCES, FALLBACK_MESSAGES
+    is_fallback = fallback_check(READING_SOURCES, FALLBACK_MESSAGES)
+
+    fake = None
+    process = None
+    if args.server in ('asgi', 'flask'):
+        fake = start_in_thread(latency=args.latency, errors=parse_errors(args.errors),
+                               tokens_per_second=args.tokens_per_second, seed=args.seed)
+        endpoint = f"http://127.0.0.1:{fake.server_address[1]}"
+        host, port = '127.0.0.1', _free_port()
+        process = start_api_server(args.server, port, endpoint, args.workers)
+    else:
+        url = urlsplit(args.server)
+        host, port = url.hostname, url.port or 80
+
+    rng = random.Random(args.seed)
+    names = list(get_card_store().names)
+    spreads = [
+        [{"name": name, "position": f"{index + 1}", "isReversed": rng.random() < 0.5}
+         for index, name in enumerate(rng.sample(names, 10))]
+        for _ in range(500)
+    ]
+
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    measurements = []
+    try:
+        wait_until_ready(host, port)
+        # One request to warm up the bot and the connection pool
+        run_level(host, port, 1, 1, spreads, args.stream, is_fallback)
+
+        print(f"{args.server} server, {'streaming' if args.stream else 'JSON'} endpoint, "
+              f"fake latency {args.latency}, {args.tokens_per_second:g} tokens/s, errors {args.errors or 'none'}")
+        print("  clients  requests    req/s    p50 ms    p95 ms    p99 ms  first ms  errors  fallbacks  injected")
+        for concurrency in levels:
+            total = args.requests or max(40, 10 * concurrency)
+            injected_before = fake.stats()["errors"] if fake else 0
+            level = run_level(host, port, concurrency, total, spreads, args.stream, is_fallback)
+            injected = (fake.stats()["errors"] if fake else 0) - injected_before
+
+            latencies = level["latencies"]
+            throughput = len(latencies) / level["wall"] if level["wall"] else 0.0
+            p50, p95, p99 = (percentile(latencies, fraction) * 1000 for fraction in (0.5, 0.95, 0.99))
+            first = percentile(level["first_events"], 0.5) * 1000
+            print(f"  {concurrency:7d}  {total:8d}  {throughput:7.1f}  {p50:8.1f}  {p95:8.1f}  {p99:8.1f}  "
+                  f"{first:8.1f}  {level['errors']:6d}  {level['fallbacks']:9d}  {injected:8d}")
+
+            prefix = f"c{concurrency}"
+            measurements += [
+                results.result(f"{prefix}_throughput", throughput, "req/s", better="higher"),
+                results.result(f"{prefix}_p50", p50, "ms"),
+                results.result(f"{prefix}_p95", p95, "ms"),
+                results.result(f"{prefix}_p99", p99, "ms"),
+                results.result(f"{prefix}_errors", level["errors"], "requests"),
+                results.result(f"{prefix}_fallbacks", level["fallbacks"], "requests"),
+            ]
+            if args.stream:
+                measurements.append(results.result(f"{prefix}_first_event_p50", first, "ms"))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if fake is not None:
+            fake.shutdown()
+
+    if args.json_path:
+        config = {key: value for key, value in vars(args).items() if key != 'json_path'}
+        results.write("load" + ("_stream" if args.stream else ""), measurements, args.json_path, config)
+
+
+if __name__ == "__main__":
+    main()
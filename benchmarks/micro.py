@@ -0,0 +1,93 @@
+"""
+Micro-benchmarks of the reading pipeline
+
+Times the steps TarotBot runs for every reading, without the model:
+- loading the card data (CardStore) and _load_tarot_data
+- _get_card_meaning
+- _create_tarot_prompt for 3- and 10-card spreads, and with a love focus
+- remove_special_characters on a clean and a dirty model response
+
+Usage:
+    python -m benchmarks.micro [--json PATH]
+"""
+
+import sys
+import timeit
+import random
+import logging
+
+from benchmarks import results
+from card_store import CardStore
+from fake_gemini import FakeGenerativeModel, FAKE_READING
+from tarot_bot import TarotBot
+from text_utils import remove_special_characters
+
+# A long reading with the control characters and model tokens the sanitizer removes
+DIRTY_READING = (FAKE_READING * 4).replace("ค่ะ", "ค่ะ<|im_end|>​") + "<|endoftext|>"
+
+
+def per_call(function, number):
+    """
+    Best time of one call over three rounds
+
+    Returns:
+        float: Seconds per call
+    """
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+def random_spread(rng, names, size):
+    return [
+        {"name": name, "position": f"{index + 1}", "isReversed": rng.random() < 0.5}
+        for index, name in enumerate(rng.sample(names, size))
+    ]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logging.getLogger('tarot_bot').setLevel(logging.WARNING)
+
+    bot = TarotBot(generative_model=FakeGenerativeModel(latency=0, jitter=0))
+    rng = random.Random(0)
+    names = list(bot.card_table.names)
+    lookups = [(rng.choice(names), rng.random() < 0.5) for _ in range(1000)]
+    spreads = {size: [random_spread(rng, names, size) for _ in range(50)] for size in (3, 10)}
+    for spread_list in spreads.values():
+        for spread in spread_list:
+            for card in spread:
+                card['meaning'] = bot._get_card_meaning(card['name'], card['isReversed'])
+
+    def lookup_all():
+        for name, is_reversed in lookups:
+            bot._get_card_meaning(name, is_reversed)
+
+    def prompts(size, section='general'):
+        def run():
+            for spread in spreads[size]:
+                bot._create_tarot_prompt(spread, section)
+        return run
+
+    measurements = [
+        results.result("card_store_load", per_call(CardStore, 5) * 1000, "ms"),
+        results.result("load_tarot_data", per_call(bot._load_tarot_data, 100000) * 1e6, "us"),
+        results.result("get_card_meaning", per_call(lookup_all, 20) / len(lookups) * 1e6, "us"),
+        results.result("create_tarot_prompt_3_cards", per_call(prompts(3), 20) / len(spreads[3]) * 1e6, "us"),
+        results.result("create_tarot_prompt_10_cards", per_call(prompts(10), 20) / len(spreads[10]) * 1e6, "us"),
+        results.result("create_tarot_prompt_10_cards_love",
+                       per_call(prompts(10, 'relationships_love'), 20) / len(spreads[10]) * 1e6, "us"),
+        results.result("remove_special_characters_clean",
+                       per_call(lambda: remove_special_characters(FAKE_READING * 4), 20000) * 1e6, "us"),
+        results.result("remove_special_characters_dirty",
+                       per_call(lambda: remove_special_characters(DIRTY_READING), 20000) * 1e6, "us"),
+    ]
+
+    for measurement in measurements:
+        print(f"  {measurement['name']:34s} {measurement['value']:10.2f} {measurement['unit']}")
+
+    path = results.json_path(argv)
+    if path:
+        results.write("micro", measurements, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Offline reading engine benchmark
+
+Times building the offline engine (offline_reading.py) from the card store and
+composing readings for random 3- and 10-card spreads, and checks that the same
+spread always gives the same reading.
+
+Usage:
+    python -m benchmarks.offline_reading
+"""
+
+import time
+import random
+
+from card_store import CardStore
+from offline_reading import OfflineReadingEngine, OFFLINE_COLUMNS
+
+
+def random_spread(rng, names, size):
+    """
+    Draw a spread of distinct cards with random orientations
+    """
+    return [
+        {"name": name, "position": f"{index + 1}", "isReversed": rng.random() < 0.5}
+        for index, name in enumerate(rng.sample(names, size))
+    ]
+
+
+def main():
+    store = CardStore()
+
+    started = time.perf_counter()
+    engine = OfflineReadingEngine(store.table.card_data(OFFLINE_COLUMNS), store.combinations)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"Build engine: {build_ms:.2f} ms for {len(engine.entries)} card orientations")
+
+    rng = random.Random(0)
+    names = list(store.names)
+
+    for size in (3, 10):
+        spreads = [random_spread(rng, names, size) for _ in range(2000)]
+        for spread in spreads[:50]:
+            assert engine.compose(spread) == engine.compose(spread)
+            assert engine.compose(spread, focus='relationships_love') != engine.compose(spread)
+
+        timings = []
+        for spread in spreads:
+            started = time.perf_counter()
+            engine.compose(spread)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+
+        p50 = timings[len(timings) // 2] * 1e6
+        p99 = timings[int(len(timings) * 0.99)] * 1e6
+        print(f"Compose {size:2d}-card reading: p50 {p50:6.1f} us  p99 {p99:6.1f} us  max {timings[-1] * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Reading history benchmark
+
+Records readings into a throwaway history database (reading_history.py)
+and reports what a request pays to record one (the buffered append), how
+fast the writer thread commits them, how long a visitor's recent readings
+and a spread's latest reading take to look up in a full store, and the
+time and file size saved by a compaction.
+
+Usage:
+    python -m benchmarks.reading_history [--rows 20000] [--json PATH]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from benchmarks import results
+from card_store import CardStore
+from reading_history import ReadingHistory, spread_hash
+
+# A reading is about this long in characters (Thai, three to five paragraphs)
+READING_LENGTH = 1500
+
+
+def random_spread(rng, names, size=3):
+    """
+    Draw a spread of distinct cards with random orientations
+    """
+    return [
+        {"name": name, "position": f"{index + 1}", "isReversed": rng.random() < 0.5}
+        for index, name in enumerate(rng.sample(names, size))
+    ]
+
+
+def file_size(path):
+    """
+    Size of the database with its write-ahead log
+    """
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the reading history store")
+    parser.add_argument('--rows', type=int, default=20000, help="Readings recorded")
+    parser.add_argument('--sessions', type=int, default=2000, help="Distinct visitors")
+    parser.add_argument('--json', dest='json_path', default=None, help="Write machine-readable results here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    names = list(CardStore().names)
+    reading = "ไพ่ใบนี้บอกว่า " * (READING_LENGTH // 15)
+    spreads = [random_spread(rng, names) for _ in range(args.rows)]
+    sessions = [f"session-{rng.randrange(args.sessions)}" for _ in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.sqlite3')
+        history = ReadingHistory(path, max_rows=args.rows // 2, max_pending=args.rows)
+
+        # What the request thread pays; the writer commits in the background
+        started = time.perf_counter()
+        for session, spread in zip(sessions, spreads):
+            history.record(session, spread, 'general', reading)
+        record_us = (time.perf_counter() - started) / args.rows * 1e6
+
+        started = time.perf_counter()
+        history.flush()
+        while history.stats()["pending"] or history.written < args.rows:
+            time.sleep(0.01)
+        write_s = time.perf_counter() - started
+        print(f"record(): {record_us:.1f} us per reading; {args.rows} readings committed "
+              f"in {write_s * 1000:.0f} ms ({args.rows / write_s:,.0f} per second)")
+
+        lookups = 1000
+        started = time.perf_counter()
+        for index in range(lookups):
+            history.recent(sessions[index], 10)
+        recent_us = (time.perf_counter() - started) / lookups * 1e6
+        started = time.perf_counter()
+        for index in range(lookups):
+            history.latest(spread_hash(spreads[index], 'general'))
+        latest_us = (time.perf_counter() - started) / lookups * 1e6
+        print(f"recent(): {recent_us:.1f} us, latest(): {latest_us:.1f} us with {args.rows} readings stored")
+
+        size_before = file_size(path)
+        started = time.perf_counter()
+        deleted = history.compact()
+        compact_ms = (time.perf_counter() - started) * 1000
+        size_after = file_size(path)
+        print(f"compact(): {deleted} readings removed in {compact_ms:.0f} ms, "
+              f"file {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+        history.close()
+
+    if args.json_path:
+        results.write("reading_history", [
+            results.result("record", record_us, "us"),
+            results.result("write_throughput", args.rows / write_s, "readings/s", better="higher"),
+            results.result("recent", recent_us, "us"),
+            results.result("latest", latest_us, "us"),
+            results.result("compact", compact_ms, "ms"),
+            results.result("file_before_compact", size_before, "bytes"),
+            results.result("file_after_compact", size_after, "bytes"),
+        ], args.json_path, {"rows": args.rows, "sessions": args.sessions})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Gemini resilience scenarios against the fake model
+
+Runs the ResilientModel wrapper (gemini_client.py) against FakeGenerativeModel
+with injected latency and failures, and reports how retries, hedging and the
+circuit breaker behave. It also checks that:
+- a half-open trial call cancelled by its caller (client disconnect or
+  READING_TIMEOUT) frees the trial slot
+- a streamed reply that stalls is abandoned at the deadline, and an error in
+  the middle of a stream reaches the breaker
+- a half-open trial rejected as a bad request leaves the breaker half-open
+
+Usage:
+    python -m benchmarks.resilience
+"""
+
+import sys
+import time
+import random
+import asyncio
+
+from fake_gemini import FakeGenerativeModel, FakeResponse
+from gemini_client import ResilientModel, CircuitBreaker, CircuitOpenError, DeadlineExceededError
+
+
+def run(name, model, calls):
+    """
+    Make a number of calls and print the outcome
+
+    Args:
+        name (str): Scenario name
+        model (ResilientModel): Wrapped fake model
+        calls (int): Number of calls to make
+    """
+    latencies, errors = [], {}
+    for _ in range(calls):
+        started = time.monotonic()
+        try:
+            model.generate_content("prompt")
+            latencies.append(time.monotonic() - started)
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0
+    p99 = latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else 0
+    print(f"{name}:")
+    print(f"  ok={len(latencies)} errors={errors} p95={p95:.0f} ms p99={p99:.0f} ms")
+    print(f"  client={model.stats()}")
+
+
+def main():
+    random.seed(0)
+
+    # 30% transient failures: retries turn most of them into successes
+    run("Retries (30% failures)",
+        ResilientModel(FakeGenerativeModel(latency=0.01, jitter=0.01, failure_rate=0.3, seed=1),
+                       timeout=2, retries=3, backoff_base=0.01),
+        100)
+
+    # Long-tail latency (3% of calls are slow): hedging caps the tail at
+    # roughly p95 plus one fast call
+    class TailModel(FakeGenerativeModel):
+        def _next_call(self):
+            self.calls += 1
+            slow = self.random.random() < 0.03
+            return (0.5 if slow else 0.02), False
+
+    for hedge in (False, True):
+        run(f"Long tail, hedge={hedge}",
+            ResilientModel(TailModel(seed=2), timeout=2, hedge=hedge, hedge_min_samples=10),
+            200)
+
+    # Upstream down: the breaker opens and later calls fail fast
+    breaker = CircuitBreaker(failure_threshold=5, cooldown=60)
+    run("Upstream down (breaker)",
+        ResilientModel(FakeGenerativeModel(latency=0.02, jitter=0, failure_rate=1.0, seed=3),
+                       timeout=1, retries=1, backoff_base=0.01, breaker=breaker),
+        50)
+
+    # Hard deadline: a hung upstream is abandoned after the timeout
+    run("Hung upstream (deadline 0.2s)",
+        ResilientModel(FakeGenerativeModel(latency=5, jitter=0, seed=4), timeout=0.2, retries=0),
+        3)
+
+    try:
+        ResilientModel(FakeGenerativeModel(), breaker=breaker).generate_content("prompt")
+    except CircuitOpenError:
+        print("Open breaker rejects calls immediately")
+
+    checks = {
+        "Cancelled half-open trial frees the breaker": asyncio.run(cancelled_trial()),
+        "Stalled stream is abandoned at the deadline": stalled_stream(),
+        "Stalled async stream is abandoned at the deadline": asyncio.run(stalled_stream_async()),
+        "Error in the middle of a stream opens the breaker": broken_stream(),
+        "Half-open trial rejected as a bad request keeps the breaker half-open": rejected_trial(),
+    }
+    for name, passed in checks.items():
+        print(f"{name}: {'yes' if passed else 'NO'}")
+    if not all(checks.values()):
+        return 1
+
+
+class StallingModel:
+    """
+    Model whose streamed reply sends one chunk, then fails or hangs
+    """
+
+    def __init__(self, error=None, stall=5.0):
+        self.error = error
+        self.stall = stall
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if self.error is not None and not stream:
+            raise self.error
+        return self._chunks()
+
+    def _chunks(self):
+        yield FakeResponse("ไพ่ใบแรก")
+        if self.error is not None:
+            raise self.error
+        time.sleep(self.stall)
+        yield FakeResponse("ไพ่ใบที่สอง")
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        return self._chunks_async()
+
+    async def _chunks_async(self):
+        yield FakeResponse("ไพ่ใบแรก")
+        await asyncio.sleep(self.stall)
+        yield FakeResponse("ไพ่ใบที่สอง")
+
+
+def stalled_stream():
+    """
+    Read a stream that hangs after its first chunk, with a 0.2s deadline
+
+    Returns:
+        bool: True if reading it ended with DeadlineExceededError in time
+    """
+    model = ResilientModel(StallingModel(), timeout=0.2)
+    started = time.monotonic()
+    try:
+        for _ in model.generate_content("prompt", stream=True):
+            pass
+    except DeadlineExceededError:
+        return time.monotonic() - started < 1 and model.stats()["timeouts"] == 1
+    return False
+
+
+async def stalled_stream_async():
+    """
+    Asynchronous version of stalled_stream
+    """
+    model = ResilientModel(StallingModel(), timeout=0.2)
+    started = time.monotonic()
+    try:
+        async for _ in await model.generate_content_async("prompt", stream=True):
+            pass
+    except DeadlineExceededError:
+        return time.monotonic() - started < 1 and model.stats()["timeouts"] == 1
+    return False
+
+
+def broken_stream():
+    """
+    Read a stream that fails after its first chunk
+
+    Returns:
+        bool: True if the failure opened a breaker with a threshold of one
+    """
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    model = ResilientModel(StallingModel(error=ConnectionError("reset")), breaker=breaker)
+    try:
+        for _ in model.generate_content("prompt", stream=True):
+            pass
+    except ConnectionError:
+        pass
+    return breaker.state == "open"
+
+
+def rejected_trial():
+    """
+    Answer the half-open trial with a bad-request error
+
+    Returns:
+        bool: True if the breaker stays half-open and lets the next call try
+    """
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    model = ResilientModel(StallingModel(error=ValueError("400 Bad Request")), breaker=breaker)
+    try:
+        model.generate_content("prompt")
+    except ValueError:
+        pass
+    return breaker.state == "half-open" and not breaker.trial_in_flight
+
+
+async def cancelled_trial():
+    """
+    Cancel the half-open trial call and check the breaker lets the next one through
+
+    Returns:
+        bool: True if the call after the cancelled trial reached the model
+    """
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+
+    slow = ResilientModel(FakeGenerativeModel(latency=5, jitter=0), timeout=10, breaker=breaker)
+    try:
+        await asyncio.wait_for(slow.generate_content_async("prompt"), timeout=0.05)
+    except asyncio.TimeoutError:
+        pass
+
+    fast = ResilientModel(FakeGenerativeModel(latency=0.01, jitter=0), breaker=breaker)
+    try:
+        await fast.generate_content_async("prompt")
+    except CircuitOpenError:
+        return False
+    return breaker.state == "closed"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Machine-readable benchmark results
+
+Benchmarks that support --json write a file of this shape, which
+benchmarks.compare reads to find regressions between two runs:
+
+    {
+      "benchmark": "micro",
+      "created": "2024-01-01T12:00:00Z",
+      "environment": {"python": ..., "platform": ..., "cpus": ..., "commit": ...},
+      "config": {...},
+      "results": [
+        {"name": "get_card_meaning", "value": 0.42, "unit": "us", "better": "lower"},
+        ...
+      ]
+    }
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+
+def environment():
+    """
+    Describe the machine and code the benchmark ran on
+
+    Returns:
+        dict: Python version, platform, CPU count and git commit (if known)
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def result(name, value, unit, better="lower", **extra):
+    """
+    Build one result entry
+
+    Args:
+        name (str): Unique name of the measurement
+        value (float): Measured value
+        unit (str): Unit of the value, e.g. "us", "ms", "req/s"
+        better (str): "lower" or "higher", for regression checks
+        **extra: Additional fields stored with the result
+
+    Returns:
+        dict: The result
+    """
+    return {"name": name, "value": round(value, 4), "unit": unit, "better": better, **extra}
+
+
+def write(benchmark, results, path, config=None):
+    """
+    Write results as JSON
+
+    Args:
+        benchmark (str): Benchmark name
+        results (list): Entries built with result()
+        path (str): Output file, or "-" for stdout
+        config (dict): Settings the benchmark ran with
+    """
+    report = {
+        "benchmark": benchmark,
+        "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "environment": environment(),
+        "config": config or {},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2) + "\n"
+    if path == '-':
+        sys.stdout.write(text)
+    else:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Results written to {path}")
+
+
+def json_path(argv):
+    """
+    Find the value of a --json PATH option
+
+    Args:
+        argv (list): Command-line arguments
+
+    Returns:
+        str or None: The path, or None if the option is absent
+    """
+    for index, arg in enumerate(argv):
+        if arg == '--json':
+            return argv[index + 1] if index + 1 < len(argv) else '-'
+        if arg.startswith('--json='):
+            return arg.split('=', 1)[1]
+    return None
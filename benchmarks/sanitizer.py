@@ -0,0 +1,148 @@
+"""
+Text sanitizer benchmark and equivalence check
+
+Fuzzes text_utils.remove_special_characters against the original
+replace-per-character implementation to confirm the output is identical,
+checks that StreamingSanitizer gives the same result for chunked input
+(tests/test_text_utils.py runs the same checks under pytest), and times both
+implementations on long Thai texts. The original is timed without its
+print() call, which the current version replaces with a debug log.
+
+Usage:
+    python -m benchmarks.sanitizer [fuzz_cases]
+"""
+
+import sys
+import json
+import timeit
+import random
+
+from card_store import DEFAULT_DATA_PATH
+from text_utils import remove_special_characters, StreamingSanitizer
+
+
+def reference_remove_special_characters(text):
+    """
+    Original implementation of remove_special_characters (without the print)
+
+    Its repair of a garbled Thai error message is not in the current version:
+    it looked for "<|im_start|>" after every "<|im_start|>" had been removed,
+    so it could only match text where removing tokens created new ones.
+    """
+    if not text:
+        return ""
+
+    replacements = {
+        '\u200b': '',
+        '\u200c': '',
+        '\u200d': '',
+        '\u200e': '',
+        '\u200f': '',
+        '\u2028': ' ',
+        '\u2029': ' ',
+        '\ufffd': '',
+        '<|im_start|>': '',
+        '<|im_end|>': '',
+        '<|im_sep|>': '',
+        '<|endoftext|>': '',
+        '\u0000': '',
+        '\u001f': '',
+    }
+
+    for char, replacement in replacements.items():
+        if char in text:
+            text = text.replace(char, replacement)
+
+    if "ขออ<|im_start|> ไม่สามารถเชื่อมต่อกับหมอดูได้ในขณะ<|im_start|>้ โปรดลองใหม่<|im_start|>ครั้งในภาย<|im_start|>" in text:
+        text = text.replace(
+            "ขออ<|im_start|> ไม่สามารถเชื่อมต่อกับหมอดูได้ในขณะ<|im_start|>้ โปรดลองใหม่<|im_start|>ครั้งในภาย<|im_start|>",
+            "ขออภัย ไม่สามารถเชื่อมต่อกับหมอดูได้ในขณะนี้ โปรดลองใหม่อีกครั้งในภายหลัง"
+        )
+
+    return text
+
+
+# Pieces the fuzzer joins together; includes partial tokens so that removing
+# characters or tokens can create new tokens
+SPECIAL_PIECES = [
+    '\u200b', '\u200c', '\u200d', '\u200e', '\u200f', '\u2028', '\u2029', '\ufffd', '\u0000', '\u001f',
+    '<|im_start|>', '<|im_end|>', '<|im_sep|>', '<|endoftext|>',
+    '<', '<|', '|', '|>', '>', 'im_', 'start', 'end', 'sep', 'endoftext',
+    "ขออ<|im_start|> ไม่สามารถเชื่อมต่อกับหมอดูได้ในขณะ<|\u0000im_start|>้ โปรดลองใหม่<|im_start|>ครั้งในภาย<|im_start|>",
+]
+PLAIN_PIECES = ['ดวงดาว', 'ไพ่ทาโร่ ', 'ค่ะ\n\n', 'The Fool ', 'a', ' ']
+
+
+
+def fuzz_equivalence(cases, rng):
+    """
+    Compare both implementations on random texts
+
+    Returns:
+        int: Number of texts checked
+    """
+    pieces = SPECIAL_PIECES + PLAIN_PIECES
+    for _ in range(cases):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 40)))
+        expected = reference_remove_special_characters(text)
+        actual = remove_special_characters(text)
+        if actual != expected:
+            raise AssertionError(f"Mismatch for {text!r}: {actual!r} != {expected!r}")
+    return cases
+
+
+def fuzz_streaming(cases, rng):
+    """
+    Compare StreamingSanitizer on random chunkings with the one-shot result
+
+    Returns:
+        int: Number of texts checked
+    """
+    for _ in range(cases):
+        text = ''.join(rng.choice(SPECIAL_PIECES + PLAIN_PIECES) for _ in range(rng.randint(0, 40)))
+        sanitizer = StreamingSanitizer()
+        output = []
+        position = 0
+        while position < len(text):
+            size = rng.randint(1, 8)
+            output.append(sanitizer.feed(text[position:position + size]))
+            position += size
+        output.append(sanitizer.flush())
+        if ''.join(output) != remove_special_characters(text):
+            raise AssertionError(f"Streaming mismatch for {text!r}")
+    return cases
+
+
+def long_thai_texts():
+    """
+    Build long Thai texts from the card descriptions
+
+    Returns:
+        dict: Name -> text
+    """
+    with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as file:
+        cards = json.load(file)
+    clean = '\n\n'.join(card['description'] for card in cards[:10])
+    dirty = clean.replace('ค่ะ', 'ค่ะ\u200b').replace('\n\n', '<|im_end|>\n\n\u2028')
+    return {"clean": clean, "dirty": dirty}
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(0)
+
+    print(f"Equivalence: {fuzz_equivalence(cases, rng)} random texts match the original")
+    print(f"Streaming:   {fuzz_streaming(cases // 4, rng)} random chunkings match one-shot output")
+
+    for name, text in long_thai_texts().items():
+        assert remove_special_characters(text) == reference_remove_special_characters(text)
+        number = 200
+        reference = min(timeit.repeat(lambda: reference_remove_special_characters(text), number=number, repeat=5)) / number
+        current = min(timeit.repeat(lambda: remove_special_characters(text), number=number, repeat=5)) / number
+        print(f"{name} text ({len(text)} chars):")
+        print(f"  original: {reference * 1e6:8.1f} us")
+        print(f"  current:  {current * 1e6:8.1f} us  ({reference / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
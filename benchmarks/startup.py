@@ -0,0 +1,165 @@
+"""
+Startup time benchmark
+
+Measures what it costs to start the tarot bot's processes, each in a fresh
+interpreter:
+- the import time of tarot_bot, asgi_app, manage_server and supervisor,
+  read from `python -X importtime`, with the heaviest imports of each, and
+  of google.generativeai, which tarot_bot only imports for a real client
+- the wall time of `python manage_server.py help` and of a worker boot
+  (import asgi_app, load the card store and build the bot with the fake
+  model), next to a bare interpreter
+- opening the marshalled card table against parsing newtarot.json
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--json PATH]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from benchmarks import results
+from card_store import DEFAULT_DATA_PATH
+from card_table import CardTable, table_path_for
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('tarot_bot', 'asgi_app', 'manage_server', 'supervisor', 'google.generativeai')
+
+WORKER_BOOT = (
+    "import asgi_app\n"
+    "from card_store import get_card_store\n"
+    "from tarot_bot import get_tarot_bot\n"
+    "get_card_store()\n"
+    "get_tarot_bot()\n"
+)
+
+# Workers started by the benchmark use the fake model and keep no history
+ENV = {**os.environ, "GEMINI_FAKE": "1", "READING_HISTORY": "0"}
+
+
+def parse_importtime(stderr, module):
+    """
+    Read a module's import time from `python -X importtime` output
+
+    Args:
+        stderr (str): Output of the interpreter
+        module (str): Module imported at the top level
+
+    Returns:
+        tuple: (cumulative microseconds, list of (microseconds, name) of
+            the module's direct imports)
+    """
+    children = []
+    for line in stderr.splitlines():
+        # "import time:   self [us] |  cumulative |   name", two spaces per nesting level
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative_us, name = parts[1], parts[2]
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                return int(cumulative_us), children
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative_us), name.strip()))
+    return None, []
+
+
+def import_time(module, runs):
+    """
+    Median import time of a module over fresh interpreters
+
+    Returns:
+        tuple: (median milliseconds or None if it cannot be imported,
+            heaviest direct imports of the last run)
+    """
+    times, children = [], []
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                 cwd=BASE_DIR, env=ENV, capture_output=True, text=True)
+        cumulative_us, children = parse_importtime(process.stderr, module)
+        if process.returncode != 0 or cumulative_us is None:
+            return None, []
+        times.append(cumulative_us / 1000)
+    return statistics.median(times), sorted(children, reverse=True)[:4]
+
+
+def wall_time(command, runs):
+    """
+    Median wall time of a command in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=BASE_DIR, env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def card_data_load(runs):
+    """
+    Best time to open the marshalled card table and to parse the JSON
+
+    Returns:
+        tuple: (table milliseconds, JSON parse and compile milliseconds)
+    """
+    table_path = table_path_for(DEFAULT_DATA_PATH)
+    table_ms, json_ms = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        CardTable.load(table_path)
+        table_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        with open(DEFAULT_DATA_PATH, 'r', encoding='utf-8') as file:
+            CardTable.from_cards(json.load(file))
+        json_ms.append((time.perf_counter() - started) * 1000)
+    return min(table_ms), min(json_ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and startup times")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument('--json', dest='json_path', default=None, help="Write machine-readable results here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    measurements = []
+    print(f"Import time, median of {args.runs} runs (python -X importtime):")
+    for module in MODULES:
+        milliseconds, heaviest = import_time(module, args.runs)
+        if milliseconds is None:
+            print(f"  {module:22s}  not importable here")
+            continue
+        details = ", ".join(f"{name} {us / 1000:.0f}" for us, name in heaviest)
+        print(f"  {module:22s} {milliseconds:8.1f} ms   ({details})")
+        measurements.append(results.result(f"import_{module.replace('.', '_')}", milliseconds, "ms"))
+
+    print("Wall time of a fresh process:")
+    for name, command in (
+        ("python", [sys.executable, '-c', 'pass']),
+        ("manage_server_help", [sys.executable, 'manage_server.py', 'help']),
+        ("worker_boot", [sys.executable, '-c', WORKER_BOOT]),
+    ):
+        milliseconds = wall_time(command, args.runs)
+        print(f"  {name:22s} {milliseconds:8.1f} ms")
+        measurements.append(results.result(f"wall_{name}", milliseconds, "ms"))
+
+    table_ms, json_ms = card_data_load(args.runs)
+    print(f"Card data: marshalled table {table_ms:.2f} ms, parsing newtarot.json {json_ms:.2f} ms")
+    measurements += [
+        results.result("card_table_load", table_ms, "ms"),
+        results.result("card_json_parse", json_ms, "ms"),
+    ]
+
+    if args.json_path:
+        results.write("startup", measurements, args.json_path, {"runs": args.runs})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
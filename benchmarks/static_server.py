@@ -0,0 +1,186 @@
+"""
+Static file server load benchmark
+
+Runs the original single-threaded server (socketserver.TCPServer with
+SimpleHTTPRequestHandler) and the current simple_server.py side by side, each
+in its own process, and drives them with concurrent clients requesting the
+page assets. Reports requests per second, latency percentiles and bytes
+transferred, for first visits and for revisits that revalidate with ETags.
+
+The clients share the machine with the server, so on small machines the
+numbers mostly reflect the CPU cost per request.
+
+Usage:
+    python -m benchmarks.static_server [seconds] [clients]
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+import http.client
+import http.server
+import socketserver
+import multiprocessing
+from functools import partial
+
+# Requested in rotation by every client, like a page load
+ASSETS = (
+    '/index.html',
+    '/styles.css',
+    '/script.js',
+    '/tarot_summary.js',
+    '/card-flip.js',
+    '/cards/index.json',
+    '/image/thefool.jpeg',
+    '/image/thestar.jpeg',
+)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_baseline(port):
+    """Serve the project the way simple_server.py originally did"""
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    with socketserver.TCPServer(('127.0.0.1', port), partial(QuietHandler, directory=directory)) as httpd:
+        httpd.serve_forever()
+
+
+def run_current(port):
+    """Serve the project with simple_server.py"""
+    os.environ["STATIC_ACCESS_LOG"] = os.devnull
+    import simple_server
+
+    manifest = simple_server.ensure_built()
+    if manifest:
+        simple_server.prime_etags(manifest)
+    with simple_server.StaticServer(('127.0.0.1', port), simple_server.MyHttpRequestHandler) as httpd:
+        httpd.serve_forever()
+
+
+def _wait_for(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def load(port, seconds, clients, headers, revalidate=False):
+    """
+    Request the assets from several client threads for a fixed time
+
+    Args:
+        port (int): Server port
+        seconds (float): Duration of the run
+        clients (int): Concurrent clients, each with its own connection
+        headers (dict): Request headers sent by every client
+        revalidate (bool): Send If-None-Match with the last ETag seen for
+            each asset, like a browser revisiting the page
+
+    Returns:
+        dict: Requests per second, latency percentiles, errors and bytes
+    """
+    latencies, errors, received = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        mine, mine_bytes, mine_errors = [], 0, 0
+        etags = {}
+        index = offset
+        while time.monotonic() < stop_at:
+            path = ASSETS[index % len(ASSETS)]
+            index += 1
+            started = time.perf_counter()
+            request_headers = dict(headers)
+            if revalidate and path in etags:
+                request_headers['If-None-Match'] = etags[path]
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+                mine_bytes += len(response.read())
+                if response.status >= 400:
+                    mine_errors += 1
+                if response.getheader('ETag'):
+                    etags[path] = response.getheader('ETag')
+                if response.will_close:
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                mine_errors += 1
+                connection.close()
+                continue
+            mine.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            received[0] += mine_bytes
+            errors[0] += mine_errors
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    count = len(latencies)
+
+    def percentile(fraction):
+        return latencies[min(count - 1, int(fraction * count))] * 1000 if count else 0.0
+
+    return {
+        "rps": count / seconds,
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "errors": errors[0],
+        "mb": received[0] / 1e6,
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    compressed = {"Accept-Encoding": "gzip, br"}
+    scenarios = (
+        ("baseline", run_baseline, {}, False),
+        ("baseline, revisit", run_baseline, compressed, True),
+        ("simple_server.py", run_current, {}, False),
+        ("simple_server.py, gzip/br", run_current, compressed, False),
+        ("simple_server.py, revisit", run_current, compressed, True),
+    )
+
+    print(f"{clients} clients, {seconds:g}s per run, {len(ASSETS)} assets in rotation")
+    for name, target, headers, revalidate in scenarios:
+        port = _free_port()
+        server = multiprocessing.Process(target=target, args=(port,), daemon=True)
+        server.start()
+        try:
+            _wait_for(port)
+            result = load(port, seconds, clients, headers, revalidate)
+        finally:
+            server.terminate()
+            server.join()
+        print(
+            f"  {name:28s} {result['rps']:8.0f} req/s  p50 {result['p50_ms']:6.2f} ms  "
+            f"p99 {result['p99_ms']:7.2f} ms  {result['mb']:8.1f} MB  errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
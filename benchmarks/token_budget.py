@@ -0,0 +1,87 @@
+"""
+Prompt token budget benchmark
+
+Builds prompts for random 3-, 5- and 10-card spreads, general and with a
+love focus, with and without the token budget (token_budget.py), and
+reports the estimated input tokens (median and max), the time to build a
+prompt, and the max_output_tokens each spread size gets.
+
+Usage:
+    python -m benchmarks.token_budget [--budget 4000] [--json PATH]
+"""
+
+import sys
+import time
+import random
+import argparse
+
+from benchmarks import results
+from card_store import CardStore
+from prompt_template import PromptTemplate
+from token_budget import PROMPT_TOKEN_BUDGET, output_token_limit
+
+
+def random_spread(rng, names, size):
+    """
+    Draw a spread of distinct cards with random orientations
+    """
+    return [
+        {"name": name, "position": f"{index + 1}", "isReversed": rng.random() < 0.5}
+        for index, name in enumerate(rng.sample(names, size))
+    ]
+
+
+def measure(template, combinations, spreads, section, budget):
+    """
+    Build the prompt of every spread
+
+    Returns:
+        tuple: (sorted input token counts, mean microseconds per prompt)
+    """
+    tokens = []
+    started = time.perf_counter()
+    for spread in spreads:
+        prompt = template.render(spread, combinations.find(spread), section, budget)
+        tokens.append(template.input_tokens(prompt))
+    elapsed = time.perf_counter() - started
+    return sorted(tokens), elapsed / len(spreads) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure prompt tokens with and without the budget")
+    parser.add_argument('--budget', type=int, default=PROMPT_TOKEN_BUDGET or 4000)
+    parser.add_argument('--json', dest='json_path', default=None, help="Write machine-readable results here ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    store = CardStore()
+    template = PromptTemplate(store.table)
+    rng = random.Random(0)
+    names = list(store.names)
+
+    print(f"Estimated input tokens per prompt, budget {args.budget}:")
+    print("  cards  focus     unlimited p50/max    budgeted p50/max    build us   max_output_tokens")
+    measurements = []
+    for size in (3, 5, 10):
+        spreads = [random_spread(rng, names, size) for _ in range(200)]
+        for section, label in (('general', 'general'), ('relationships_love', 'love')):
+            # Render once first so lazily built sections are not timed
+            measure(template, store.combinations, spreads[:1], section, args.budget)
+            full, _ = measure(template, store.combinations, spreads, section, None)
+            fitted, build_us = measure(template, store.combinations, spreads, section, args.budget)
+            p50, p50_fitted = full[len(full) // 2], fitted[len(fitted) // 2]
+            print(f"  {size:5d}  {label:8s}  {p50:8d} / {full[-1]:6d}     {p50_fitted:7d} / {fitted[-1]:6d}  "
+                  f"{build_us:10.1f}   {output_token_limit(size)}")
+            prefix = f"{size}_cards_{label}"
+            measurements += [
+                results.result(f"{prefix}_input_tokens_p50", p50_fitted, "tokens"),
+                results.result(f"{prefix}_input_tokens_max", fitted[-1], "tokens"),
+                results.result(f"{prefix}_build", build_us, "us"),
+            ]
+    print(f"Prompts shortened: {template.truncated}")
+
+    if args.json_path:
+        results.write("token_budget", measurements, args.json_path, {"budget": args.budget})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
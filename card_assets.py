@@ -0,0 +1,275 @@
+"""
+Card Data Assets for the Web Page
+
+script.js used to download the whole 2 MB newtarot.json before the deck could
+be drawn. This module splits it into:
+- cards/index.json: name, keywords, image path and detail URL of every card
+- cards/<card>.<hash>.json: the full data of one card, fetched when its
+  details are opened
+
+When image_assets.py has built resized AVIF/WebP/JPEG variants of the card
+images, the index also lists them as srcset values by format.
+
+Every file is also written precompressed (.gz, and .br when the brotli
+module is installed). cards/manifest.json records a content-hash ETag for
+each file so the static server can answer conditional requests without
+hashing on every request. Shard names contain their content hash, so they
+never change and can be cached forever.
+
+The assets are rebuilt automatically by simple_server.py when newtarot.json
+changes, or explicitly with:
+    python card_assets.py
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import logging
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logger = logging.getLogger('tarot_bot')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JSON_PATH = os.path.join(BASE_DIR, 'newtarot.json')
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, 'cards')
+IMAGE_DIR = os.path.join(BASE_DIR, 'image')
+
+INDEX_NAME = 'index.json'
+MANIFEST_NAME = 'manifest.json'
+
+# Bump when the layout of the generated files changes
+ASSETS_VERSION = 2
+
+# Precompressed variants, as (Content-Encoding, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def content_hash(data):
+    """
+    Hash file contents for ETags and file names
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _encode(value):
+    """Serialize JSON compactly, keeping Thai text unescaped"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _slug(name):
+    """
+    Turn a card name into the form used for file names
+
+    Args:
+        name (str): Card name, e.g. "Ace of Cups"
+
+    Returns:
+        str: e.g. "aceofcups"
+    """
+    return ''.join(name.lower().split())
+
+
+def find_image(name, image_files):
+    """
+    Find the image of a card
+
+    Image files are named after the card without spaces, sometimes with a
+    "the" prefix the card name lacks (thestrength.jpeg) and in mixed case
+    (TheLovers.jpg).
+
+    Args:
+        name (str): Card name
+        image_files (list): File names in the image directory
+
+    Returns:
+        str or None: Path of the image relative to the site root
+    """
+    by_stem = {os.path.splitext(file)[0].lower(): file for file in image_files}
+    slug = _slug(name)
+    for stem in (slug, 'the' + slug, slug[3:] if slug.startswith('the') else None):
+        if stem and stem in by_stem:
+            return f"image/{by_stem[stem]}"
+    return None
+
+
+def compress(data):
+    """
+    Precompress file contents
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        dict: Compressed bytes by file suffix (.gz always, .br if available)
+    """
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def _source_stamp(json_path, images=None):
+    stat = os.stat(json_path)
+    return [ASSETS_VERSION, stat.st_size, stat.st_mtime_ns, brotli is not None,
+            images.get("digest") if images else None]
+
+
+def image_variants(image_path, images):
+    """
+    Describe the built variants of a card image for the browser
+
+    Args:
+        image_path (str): Path of the original image relative to the site root
+        images (dict): Manifest returned by image_assets.build
+
+    Returns:
+        dict or None: {"width", "height", "srcset": {format: srcset value}},
+            or None if the image has no variants
+    """
+    entry = images.get("images", {}).get(image_path) if images and image_path else None
+    if not entry:
+        return None
+    srcset = {}
+    for variant in entry["variants"]:
+        srcset.setdefault(variant["format"], []).append(f"{images['path']}/{variant['file']} {variant['width']}w")
+    return {
+        "width": entry["width"],
+        "height": entry["height"],
+        "srcset": {name: ', '.join(candidates) for name, candidates in srcset.items()},
+    }
+
+
+def _write(path, data):
+    """Write a file atomically"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(json_path=DEFAULT_JSON_PATH, output_dir=DEFAULT_OUTPUT_DIR, images=None):
+    """
+    Generate the index, the card shards and their compressed variants
+
+    Args:
+        json_path (str): Path of newtarot.json
+        output_dir (str): Directory to write the assets to
+        images (dict): Manifest of the card image variants (optional)
+
+    Returns:
+        dict: The manifest: ETag and size of every generated file
+    """
+    with open(json_path, 'r', encoding='utf-8') as file:
+        cards = json.load(file)
+
+    try:
+        image_files = os.listdir(IMAGE_DIR)
+    except OSError:
+        image_files = []
+
+    site_dir = os.path.relpath(output_dir, BASE_DIR).replace(os.sep, '/')
+    files = {}
+    index = []
+    for card in cards:
+        data = _encode(card)
+        shard_name = f"{_slug(card['name'])}.{content_hash(data)[:12]}.json"
+        files[shard_name] = data
+        image = find_image(card['name'], image_files)
+        entry = {
+            "name": card['name'],
+            "keywords": card.get('keywords') or {},
+            "image": image,
+            "detail": f"{site_dir}/{shard_name}",
+        }
+        variants = image_variants(image, images)
+        if variants:
+            entry["images"] = variants
+        index.append(entry)
+    files[INDEX_NAME] = _encode(index)
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"source": _source_stamp(json_path, images), "files": {}}
+    for name, data in files.items():
+        _write(os.path.join(output_dir, name), data)
+        digest = content_hash(data)[:16]
+        manifest["files"][name] = {"etag": f'"{digest}"', "size": len(data)}
+        for suffix, compressed in compress(data).items():
+            _write(os.path.join(output_dir, name + suffix), compressed)
+            manifest["files"][name + suffix] = {"etag": f'"{digest}{suffix.replace(".", "-")}"', "size": len(compressed)}
+
+    # Remove shards left over from earlier builds
+    keep = set(manifest["files"]) | {MANIFEST_NAME}
+    for name in os.listdir(output_dir):
+        if name not in keep and name.endswith(('.json', '.json.gz', '.json.br')):
+            os.remove(os.path.join(output_dir, name))
+
+    _write(os.path.join(output_dir, MANIFEST_NAME), _encode(manifest))
+    return manifest
+
+
+def load_manifest(output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Read the manifest of a previous build
+
+    Args:
+        output_dir (str): Directory the assets were written to
+
+    Returns:
+        dict or None: The manifest, or None if there is no valid one
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_built(json_path=DEFAULT_JSON_PATH, output_dir=DEFAULT_OUTPUT_DIR, images=None):
+    """
+    Build the assets if they are missing, older than newtarot.json or
+    listing other image variants
+
+    Args:
+        json_path (str): Path of newtarot.json
+        output_dir (str): Directory to write the assets to
+        images (dict): Manifest of the card image variants (optional)
+
+    Returns:
+        dict or None: The current manifest, or None if newtarot.json is missing
+    """
+    if not os.path.exists(json_path):
+        return None
+    manifest = load_manifest(output_dir)
+    if manifest is not None and manifest.get("source") == _source_stamp(json_path, images):
+        return manifest
+    logger.info(f"Building card assets in {output_dir}")
+    return build(json_path, output_dir, images)
+
+
+if __name__ == "__main__":
+    from image_assets import load_manifest as load_image_manifest
+
+    manifest = build(images=load_image_manifest())
+    files = manifest["files"]
+    shards = [name for name in files if name.endswith('.json') and name != INDEX_NAME]
+    shard_sizes = [files[name]["size"] for name in shards]
+    print(f"Wrote {len(shards)} card shards and {INDEX_NAME} to {DEFAULT_OUTPUT_DIR}")
+    for suffix in ('', '.gz', '.br'):
+        if INDEX_NAME + suffix in files:
+            print(f"  {INDEX_NAME + suffix:16s} {files[INDEX_NAME + suffix]['size']:8d} bytes")
+    print(f"  average shard    {sum(shard_sizes) // max(1, len(shard_sizes)):8d} bytes"
+          f" ({sum(files[name + '.gz']['size'] for name in shards) // max(1, len(shards))} gzipped)")
+    print(f"  newtarot.json    {os.path.getsize(DEFAULT_JSON_PATH):8d} bytes")
+    if brotli is None:
+        print("  (install brotli to also write .br files)")
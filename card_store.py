@@ -0,0 +1,209 @@
+"""
+Tarot Card Store
+
+This module opens the compiled card table (card_table.py) once per process
+and shares it with every request, together with the index of suggested card
+combinations from combination_index.py. Only the columns a reading needs are
+kept in memory: the general meanings and keywords are read at startup, and
+other meaning sections, quotes and journaling prompts are read from the
+memory-mapped table file the first time a reading asks for them. The full
+JSON (descriptions and all) is parsed only if something reads
+CardStore.cards, which no reading does.
+
+The store records how long it took to load and roughly how much memory the
+loaded columns occupy so the cost of keeping them resident can be checked.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from types import MappingProxyType
+from card_table import load_card_table
+from combination_index import CombinationIndex
+
+logger = logging.getLogger('tarot_bot')
+
+# Default location of the card database, next to this module
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'newtarot.json')
+
+
+def _freeze(value):
+    """
+    Recursively convert parsed JSON into read-only containers
+
+    Args:
+        value: A value produced by json.load
+
+    Returns:
+        The same data with dicts wrapped in MappingProxyType and lists as tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _deep_sizeof(value, seen=None):
+    """
+    Estimate the memory used by a nested structure of containers and strings
+
+    Args:
+        value: The object to measure
+        seen (set): Object ids already counted
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, MappingProxyType):
+        value = dict(value)
+        size += sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(item, seen)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += _deep_sizeof(item, seen)
+    return size
+
+
+class CardStore:
+    """
+    Immutable, name-indexed view of the tarot card database
+    """
+
+    def __init__(self, path=DEFAULT_DATA_PATH):
+        """
+        Open the compiled card table, rebuilding it from the JSON if stale
+
+        Args:
+            path (str): Path to the tarot card JSON file
+        """
+        self.path = path
+        started = time.perf_counter()
+
+        # Compiled meanings and keywords used on the request path
+        self.table = load_card_table(path)
+        self.names = tuple(self.table.names)
+
+        # Suggested combinations, keyed on pairs of (card, orientation)
+        self.combinations = CombinationIndex.from_entries(self.names, self.table.column('combinations'))
+
+        self._cards = None
+        self._cards_lock = threading.Lock()
+
+        self.load_time = time.perf_counter() - started
+        self.loaded_at = time.time()
+
+        logger.info(
+            f"Loaded {len(self.names)} tarot cards in {self.load_time * 1000:.1f} ms "
+            f"(~{self.memory_bytes / 1024:.0f} KiB resident)"
+        )
+
+    @property
+    def cards(self):
+        """
+        Mapping: Full card data indexed by card name, parsed from the JSON on
+        first use. Readings do not need it; it is kept for tools and scripts.
+        """
+        if self._cards is None:
+            with self._cards_lock:
+                if self._cards is None:
+                    try:
+                        with open(self.path, 'r', encoding='utf-8') as file:
+                            tarot_cards = json.load(file)
+                    except Exception as e:
+                        logger.error(f"Error loading tarot data: {e}")
+                        tarot_cards = []
+                    self._cards = MappingProxyType({card['name']: _freeze(card) for card in tarot_cards})
+        return self._cards
+
+    @property
+    def memory_bytes(self):
+        """int: Approximate size of the card data held in memory"""
+        return _deep_sizeof((self.names, self.table.loaded_columns(), self._cards))
+
+    def __contains__(self, card_name):
+        return card_name in self.table
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, card_name):
+        """
+        Look up a card by name
+
+        Args:
+            card_name (str): The name of the tarot card
+
+        Returns:
+            Mapping or None: The card data, or None if the card is unknown
+        """
+        return self.cards.get(card_name)
+
+    def stats(self):
+        """
+        Describe the cost of the loaded store
+
+        Returns:
+            dict: Card and combination counts, load time in milliseconds,
+                approximate memory use and the table columns in memory
+        """
+        return {
+            "cards": len(self.names),
+            "combinations": len(self.combinations),
+            "load_time_ms": round(self.load_time * 1000, 3),
+            "memory_bytes": self.memory_bytes,
+            "columns_loaded": sorted(self.table.loaded_columns()),
+            "loaded_at": self.loaded_at,
+            "path": self.path,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_card_store():
+    """
+    Return the process-wide card store, loading it on first use
+
+    Returns:
+        CardStore: The shared card store
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CardStore()
+    return _store
+
+
+def reload_card_store(path=DEFAULT_DATA_PATH):
+    """
+    Rebuild the process-wide card store from disk
+
+    The new store is built before it replaces the old one, so requests that
+    are already running keep a consistent view of the data.
+
+    Args:
+        path (str): Path to the tarot card JSON file
+
+    Returns:
+        CardStore: The freshly loaded store
+    """
+    global _store
+    store = CardStore(path)
+    with _store_lock:
+        _store = store
+    return store
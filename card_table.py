@@ -0,0 +1,558 @@
+"""
+Compiled Card Meaning Table
+
+This module compiles the tarot card database into a flat, indexed table used
+on the request path. Each card gets an integer id, and the meaning and keyword
+strings for both orientations are resolved once at build time, so a lookup is
+a single dictionary access plus a list index instead of nested checks on the
+raw JSON.
+
+The table is split into columns: keywords, one column per meaning section
+(general, relationships_love, career_work_finances, ...), descriptions,
+quotes, journaling prompts and suggested combinations. It is saved to a
+compact versioned binary file (newtarot.cards.bin) in which every column is
+stored separately. Opening the table memory-maps the file and reads only the
+names, keywords, general meanings and combinations; any other column is read
+the first time it is used. A worker serving general readings therefore never
+keeps the other sections, descriptions or quotes in memory.
+
+The file records the size and modification time of the JSON it was built
+from and is rebuilt automatically when stale.
+
+Build it explicitly with:
+    python card_table.py
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import marshal
+import logging
+import threading
+
+logger = logging.getLogger('tarot_bot')
+
+# File header: magic bytes followed by the format version
+TABLE_MAGIC = b'TAROTTBL'
+TABLE_VERSION = 2
+
+CARD_NOT_FOUND = "ไม่พบข้อมูลไพ่"
+MEANING_NOT_FOUND = "ไม่พบความหมายของไพ่"
+
+# Meaning sections given for each orientation in newtarot.json
+MEANING_SECTIONS = (
+    'general',
+    'relationships_love',
+    'career_work_finances',
+    'well_being_health',
+    'spirituality',
+    'personality_types',
+)
+
+# Reading focus names accepted by the API and the meaning section each reads
+FOCUS_SECTIONS = {
+    'general': 'general',
+    'love': 'relationships_love',
+    'relationships': 'relationships_love',
+    'career': 'career_work_finances',
+    'work': 'career_work_finances',
+    'finance': 'career_work_finances',
+    'finances': 'career_work_finances',
+    'money': 'career_work_finances',
+    'health': 'well_being_health',
+    'wellbeing': 'well_being_health',
+    'spirituality': 'spirituality',
+    'spiritual': 'spirituality',
+    'personality': 'personality_types',
+}
+
+# Per-card columns (one value per card); every other column has one value
+# per card and orientation
+CARD_COLUMNS = ('description', 'quotes', 'journaling_prompts', 'combinations')
+
+# Columns read when a saved table is opened; the rest are read on first use
+EAGER_COLUMNS = ('keywords', 'meanings:general', 'combinations')
+
+_DIRECTORY_SIZE = struct.Struct('<Q')
+
+
+def resolve_focus(focus):
+    """
+    Map a reading focus to the meaning section it reads
+
+    Args:
+        focus (str): Focus name (e.g. "love", "career") or section name
+            (e.g. "relationships_love"), or None
+
+    Returns:
+        str: A MEANING_SECTIONS entry; "general" for no or an unknown focus
+    """
+    if not isinstance(focus, str):
+        return 'general'
+    key = focus.strip().lower().replace('-', '_')
+    if key in MEANING_SECTIONS:
+        return key
+    return FOCUS_SECTIONS.get(key.replace('_', ''), 'general')
+
+
+class CardRecord:
+    """
+    Pre-resolved strings for one card
+    """
+
+    __slots__ = ('id', 'name', 'meanings', 'keywords')
+
+    def __init__(self, card_id, name, meanings, keywords):
+        """
+        Args:
+            card_id (int): Position of the card in the table
+            name (str): Card name
+            meanings (tuple): (upright meaning, reversed meaning)
+            keywords (tuple): (upright keywords, reversed keywords), entries may be None
+        """
+        self.id = card_id
+        self.name = name
+        self.meanings = meanings
+        self.keywords = keywords
+
+
+def _resolve_meaning(card, orientation):
+    """
+    Pick the meaning shown for a card in one orientation
+
+    Uses the general meaning, falling back to the keywords.
+
+    Args:
+        card (Mapping): Raw card data
+        orientation (str): "upright" or "reversed"
+
+    Returns:
+        str: The meaning text
+    """
+    meanings = card.get(f'{orientation}_meanings') or {}
+    if 'general' in meanings:
+        return meanings['general']
+    keywords = card.get('keywords') or {}
+    if orientation in keywords:
+        return keywords[orientation]
+    return MEANING_NOT_FOUND
+
+
+def _combination_entries(card, orientation):
+    """
+    Extract the suggested combinations of a card in one orientation
+
+    Args:
+        card (Mapping): Raw card data
+        orientation (str): "upright" or "reversed"
+
+    Returns:
+        tuple: (card reference, meaning) pairs
+    """
+    return tuple(
+        (entry.get('card') or '', entry.get('meaning') or '')
+        for entry in card.get(f'{orientation}_suggested_combinations') or ()
+    )
+
+
+class _ColumnFile:
+    """
+    Memory-mapped table file from which columns are read on demand
+    """
+
+    def __init__(self, data, directory, base):
+        """
+        Args:
+            data (mmap.mmap): The mapped file
+            directory (dict): Column name -> (offset, length) after base
+            base (int): Offset of the first column
+        """
+        self.data = data
+        self.directory = directory
+        self.base = base
+
+    def read(self, name):
+        """
+        Decode one column
+
+        Args:
+            name (str): Column name
+
+        Returns:
+            list: The column's values
+        """
+        offset, length = self.directory[name]
+        start = self.base + offset
+        return marshal.loads(self.data[start:start + length])
+
+
+class CardTable:
+    """
+    Flat, integer-indexed table of card meanings, keywords and other columns
+    """
+
+    def __init__(self, names, columns, source_stamp=None, column_file=None):
+        """
+        Args:
+            names (list): Card names, indexed by card id
+            columns (dict): Columns already in memory. Meanings and keywords
+                are indexed by card_id * 2 + is_reversed, per-card columns
+                by card_id
+            source_stamp (tuple): (size, mtime_ns) of the JSON the table was built from
+            column_file (_ColumnFile): File the remaining columns are read from
+        """
+        self.names = names
+        self.source_stamp = source_stamp
+        self.ids = {name: card_id for card_id, name in enumerate(names)}
+        self._columns = dict(columns)
+        self._column_file = column_file
+        self._lock = threading.Lock()
+
+        # The default reading path reads these on every request
+        self.meanings = self.column('meanings:general')
+        self.keywords = self.column('keywords')
+
+    @classmethod
+    def from_cards(cls, cards, source_stamp=None):
+        """
+        Compile a table from raw card data
+
+        Args:
+            cards (iterable): Card dictionaries as stored in newtarot.json
+            source_stamp (tuple): (size, mtime_ns) of the source file
+
+        Returns:
+            CardTable: The compiled table, with every column in memory
+        """
+        names = []
+        columns = {'keywords': [], **{f'meanings:{section}': [] for section in MEANING_SECTIONS},
+                   **{name: [] for name in CARD_COLUMNS}}
+        for card in cards:
+            names.append(card['name'])
+            card_keywords = card.get('keywords') or {}
+            for orientation in ('upright', 'reversed'):
+                meanings = card.get(f'{orientation}_meanings') or {}
+                columns['meanings:general'].append(_resolve_meaning(card, orientation))
+                for section in MEANING_SECTIONS[1:]:
+                    columns[f'meanings:{section}'].append(meanings.get(section) or None)
+                columns['keywords'].append(card_keywords.get(orientation))
+            columns['description'].append(card.get('description') or '')
+            columns['quotes'].append(tuple(card.get('quotes') or ()))
+            columns['journaling_prompts'].append(tuple(card.get('journaling_prompts') or ()))
+            columns['combinations'].append((_combination_entries(card, 'upright'),
+                                            _combination_entries(card, 'reversed')))
+        return cls(names, columns, source_stamp)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, card_name):
+        return card_name in self.ids
+
+    def column(self, name):
+        """
+        Return a column, reading it from the table file on first use
+
+        Args:
+            name (str): Column name, e.g. "keywords", "meanings:relationships_love" or "quotes"
+
+        Returns:
+            list: The column's values
+
+        Raises:
+            KeyError: If the table has no such column
+        """
+        values = self._columns.get(name)
+        if values is None:
+            with self._lock:
+                values = self._columns.get(name)
+                if values is None:
+                    if self._column_file is None:
+                        raise KeyError(name)
+                    values = self._columns[name] = self._column_file.read(name)
+        return values
+
+    def loaded_columns(self):
+        """
+        Return the columns currently held in memory
+
+        Returns:
+            dict: Column name -> values
+        """
+        return dict(self._columns)
+
+    def card_id(self, card_name):
+        """
+        Return the integer id of a card
+
+        Args:
+            card_name (str): The name of the tarot card
+
+        Returns:
+            int or None: The card id, or None if the card is unknown
+        """
+        return self.ids.get(card_name)
+
+    def meaning(self, card_name, is_reversed, section='general'):
+        """
+        Return the meaning of a card in the given orientation
+
+        Args:
+            card_name (str): The name of the tarot card
+            is_reversed (bool): Whether the card is reversed
+            section (str): Meaning section (see MEANING_SECTIONS); falls back
+                to the general meaning when the card has none for it
+
+        Returns:
+            str: The meaning, or a "not found" message for unknown cards
+        """
+        card_id = self.ids.get(card_name)
+        if card_id is None:
+            return CARD_NOT_FOUND
+        index = card_id * 2 + bool(is_reversed)
+        if section != 'general':
+            text = self.column(f'meanings:{section}')[index]
+            if text:
+                return text
+        return self.meanings[index]
+
+    def section_meanings(self, section):
+        """
+        Return the meanings of every card for one section
+
+        Args:
+            section (str): Meaning section (see MEANING_SECTIONS)
+
+        Returns:
+            list: Meanings indexed by card_id * 2 + is_reversed, with the
+                general meaning where the card has none for the section
+        """
+        if section == 'general':
+            return self.meanings
+        return [text or general for text, general in zip(self.column(f'meanings:{section}'), self.meanings)]
+
+    def keyword(self, card_name, is_reversed):
+        """
+        Return the keywords of a card in the given orientation
+
+        Args:
+            card_name (str): The name of the tarot card
+            is_reversed (bool): Whether the card is reversed
+
+        Returns:
+            str or None: The keywords, or None if unavailable
+        """
+        card_id = self.ids.get(card_name)
+        if card_id is None:
+            return None
+        return self.keywords[card_id * 2 + bool(is_reversed)]
+
+    def record(self, card_name):
+        """
+        Return all pre-resolved strings for a card
+
+        Args:
+            card_name (str): The name of the tarot card
+
+        Returns:
+            CardRecord or None: The record, or None if the card is unknown
+        """
+        card_id = self.ids.get(card_name)
+        if card_id is None:
+            return None
+        return CardRecord(
+            card_id,
+            card_name,
+            (self.meanings[card_id * 2], self.meanings[card_id * 2 + 1]),
+            (self.keywords[card_id * 2], self.keywords[card_id * 2 + 1]),
+        )
+
+    def card_data(self, columns):
+        """
+        Rebuild partial card dictionaries in the layout of newtarot.json
+
+        Only the given columns are read, so callers that need a few fields
+        of every card do not load the rest.
+
+        Args:
+            columns (iterable): Column names to include
+
+        Returns:
+            dict: Card name -> card dictionary with those fields
+        """
+        columns = list(columns)
+        cards = {name: {'name': name} for name in self.names}
+        for column in columns:
+            values = self.column(column)
+            for card_id, name in enumerate(self.names):
+                card = cards[name]
+                if column in CARD_COLUMNS:
+                    card[column] = values[card_id]
+                    continue
+                for is_reversed, orientation in ((0, 'upright'), (1, 'reversed')):
+                    value = values[card_id * 2 + is_reversed]
+                    if column == 'keywords':
+                        card.setdefault('keywords', {})[orientation] = value
+                    elif value is not None:
+                        section = column.split(':', 1)[1]
+                        card.setdefault(f'{orientation}_meanings', {})[section] = value
+        return cards
+
+    def save(self, path):
+        """
+        Write the table to a versioned binary file, one block per column
+
+        Args:
+            path (str): Destination path
+        """
+        names = ['keywords', *(f'meanings:{section}' for section in MEANING_SECTIONS), *CARD_COLUMNS]
+        blobs, directory, offset = [], {}, 0
+        for name in names:
+            blob = marshal.dumps(self.column(name))
+            directory[name] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+        header = marshal.dumps((self.source_stamp, self.names, directory))
+
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as file:
+            file.write(TABLE_MAGIC)
+            file.write(bytes((TABLE_VERSION, marshal.version)))
+            file.write(_DIRECTORY_SIZE.pack(len(header)))
+            file.write(header)
+            for blob in blobs:
+                file.write(blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Open a table written by save()
+
+        Args:
+            path (str): Path of the binary table
+
+        Returns:
+            CardTable or None: The table, or None if the file is missing or
+                was written by an incompatible version
+        """
+        try:
+            with open(path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        header_size = len(TABLE_MAGIC) + 2
+        if data[:len(TABLE_MAGIC)] != TABLE_MAGIC or tuple(data[len(TABLE_MAGIC):header_size]) != (TABLE_VERSION, marshal.version):
+            data.close()
+            return None
+
+        try:
+            (directory_size,) = _DIRECTORY_SIZE.unpack_from(data, header_size)
+            start = header_size + _DIRECTORY_SIZE.size
+            source_stamp, names, directory = marshal.loads(data[start:start + directory_size])
+            column_file = _ColumnFile(data, directory, start + directory_size)
+            columns = {name: column_file.read(name) for name in EAGER_COLUMNS}
+        except (EOFError, ValueError, TypeError, KeyError, struct.error):
+            data.close()
+            return None
+        return cls(names, columns, source_stamp, column_file)
+
+
+def source_stamp(json_path):
+    """
+    Identify a version of the card database by its size and modification time
+
+    Args:
+        json_path (str): Path of newtarot.json
+
+    Returns:
+        tuple or None: (size, mtime_ns), or None if the file is missing
+    """
+    try:
+        stat = os.stat(json_path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def table_path_for(json_path):
+    """
+    Return the binary table path that belongs to a JSON card database
+
+    Args:
+        json_path (str): Path of the JSON file (e.g. newtarot.json)
+
+    Returns:
+        str: Path of its compiled table (e.g. newtarot.cards.bin)
+    """
+    return os.path.splitext(json_path)[0] + '.cards.bin'
+
+
+def load_card_table(json_path, table_path=None):
+    """
+    Open the compiled table, rebuilding it if it is missing or stale
+
+    The JSON is only parsed when the table has to be rebuilt.
+
+    Args:
+        json_path (str): Path of the JSON card database
+        table_path (str): Path of the binary table
+            Default is derived from json_path
+
+    Returns:
+        CardTable: The table for the current card data
+    """
+    table_path = table_path or table_path_for(json_path)
+    stamp = source_stamp(json_path)
+    table = CardTable.load(table_path)
+    if table is not None and stamp is not None and tuple(table.source_stamp or ()) == stamp:
+        return table
+
+    try:
+        with open(json_path, 'r', encoding='utf-8') as file:
+            cards = json.load(file)
+    except Exception as e:
+        logger.error(f"Error loading tarot data: {e}")
+        return CardTable.from_cards([])
+
+    table = CardTable.from_cards(cards, stamp)
+    try:
+        table.save(table_path)
+    except OSError as e:
+        logger.warning(f"Could not save card table to {table_path}: {e}")
+        return table
+
+    # Reopen the saved file so the columns not needed yet leave memory
+    return CardTable.load(table_path) or table
+
+
+def build(json_path, table_path=None):
+    """
+    Compile newtarot.json into the binary table
+
+    Args:
+        json_path (str): Path of newtarot.json
+        table_path (str): Destination path
+            Default is derived from json_path
+
+    Returns:
+        CardTable: The compiled table
+    """
+    table_path = table_path or table_path_for(json_path)
+    with open(json_path, 'r', encoding='utf-8') as file:
+        cards = json.load(file)
+    table = CardTable.from_cards(cards, source_stamp(json_path))
+    table.save(table_path)
+    return table
+
+
+if __name__ == "__main__":
+    from card_store import DEFAULT_DATA_PATH
+
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA_PATH
+    table_path = sys.argv[2] if len(sys.argv) > 2 else table_path_for(json_path)
+    table = build(json_path, table_path)
+    print(f"Compiled {len(table)} cards from {json_path} into {table_path} ({os.path.getsize(table_path)} bytes)")
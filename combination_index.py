@@ -0,0 +1,192 @@
+"""
+Tarot Card Combination Index
+
+Each card in newtarot.json lists suggested combinations with other cards for
+both of its orientations. This module resolves those entries once into a
+symmetric index keyed on the pair of (card id, is_reversed) sides, so finding
+every known combination in a spread is one dictionary lookup per pair of
+drawn cards instead of a scan of each card's lists.
+
+Combination entries use short names ("Star", "Six of Cups reversed"). They
+are normalized to the canonical card names: matching ignores case and a
+leading "The", a trailing "reversed" selects the reversed orientation, and
+an entry without it refers to the upright card.
+"""
+
+import logging
+from itertools import combinations
+
+logger = logging.getLogger('tarot_bot')
+
+# Alternative spellings used in tarot literature
+NAME_ALIASES = {
+    'judgment': 'judgement',
+}
+
+
+def _name_key(name):
+    """
+    Reduce a card name to the form used for matching
+
+    Args:
+        name (str): Card name, e.g. "The Star" or "star"
+
+    Returns:
+        str: Lowercase name without a leading "the" and extra spaces
+    """
+    key = ' '.join(name.lower().split())
+    if key.startswith('the '):
+        key = key[4:]
+    return NAME_ALIASES.get(key, key)
+
+
+class CombinationIndex:
+    """
+    Symmetric index of suggested card combinations
+    """
+
+    def __init__(self, names):
+        """
+        Args:
+            names (list): Canonical card names, indexed by card id
+                (the same order as CardTable.names)
+        """
+        self.names = names
+        self.ids = {name: card_id for card_id, name in enumerate(names)}
+        self.name_keys = {_name_key(name): card_id for card_id, name in enumerate(names)}
+        self.pairs = {}
+        self.unresolved = 0
+
+    @staticmethod
+    def _pair_key(side_a, side_b):
+        """Order two (card id, is_reversed) sides so (a, b) and (b, a) share a key"""
+        return (side_a, side_b) if side_a <= side_b else (side_b, side_a)
+
+    def resolve(self, reference):
+        """
+        Normalize a card reference from a combination entry
+
+        Args:
+            reference (str): e.g. "Star", "The Star" or "Six of Cups reversed"
+
+        Returns:
+            tuple or None: (card id, is_reversed), or None for an unknown card
+        """
+        key = _name_key(reference)
+        is_reversed = key.endswith(' reversed')
+        if is_reversed:
+            key = _name_key(key[:-len(' reversed')])
+        card_id = self.name_keys.get(key)
+        if card_id is None:
+            return None
+        return (card_id, is_reversed)
+
+    def add(self, side_a, side_b, meaning):
+        """
+        Record the meaning of a combination
+
+        Args:
+            side_a (tuple): (card id, is_reversed) of one card
+            side_b (tuple): (card id, is_reversed) of the other card
+            meaning (str): Meaning of the two cards together
+        """
+        meanings = self.pairs.setdefault(self._pair_key(side_a, side_b), [])
+        if meaning not in meanings:
+            meanings.append(meaning)
+
+    @classmethod
+    def from_cards(cls, cards):
+        """
+        Build the index from raw card data
+
+        Args:
+            cards (iterable): Card dictionaries as stored in newtarot.json
+
+        Returns:
+            CombinationIndex: The index
+        """
+        cards = list(cards)
+        entries = [
+            tuple(
+                tuple((entry.get('card') or '', entry.get('meaning') or '')
+                      for entry in card.get(f'{orientation}_suggested_combinations') or ())
+                for orientation in ('upright', 'reversed')
+            )
+            for card in cards
+        ]
+        return cls.from_entries([card['name'] for card in cards], entries)
+
+    @classmethod
+    def from_entries(cls, names, entries):
+        """
+        Build the index from the combinations column of a CardTable
+
+        Args:
+            names (list): Canonical card names, indexed by card id
+            entries (list): Per card id, (upright, reversed) tuples of
+                (card reference, meaning) pairs
+
+        Returns:
+            CombinationIndex: The index
+        """
+        index = cls(list(names))
+        for card_id, orientations in enumerate(entries):
+            for is_reversed, card_entries in zip((False, True), orientations):
+                for reference, meaning in card_entries:
+                    partner = index.resolve(reference)
+                    if partner is None or not meaning:
+                        index.unresolved += 1
+                        continue
+                    index.add((card_id, is_reversed), partner, meaning)
+
+        index.pairs = {key: tuple(meanings) for key, meanings in index.pairs.items()}
+        if index.unresolved:
+            logger.warning(f"{index.unresolved} card combinations refer to unknown cards")
+        return index
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def lookup(self, card_a, card_b):
+        """
+        Return the combined meanings of two cards
+
+        Args:
+            card_a (tuple): (card name, is_reversed) of one card
+            card_b (tuple): (card name, is_reversed) of the other card
+
+        Returns:
+            tuple: Meanings of the combination (empty if there are none)
+        """
+        id_a, id_b = self.ids.get(card_a[0]), self.ids.get(card_b[0])
+        if id_a is None or id_b is None:
+            return ()
+        return self.pairs.get(self._pair_key((id_a, bool(card_a[1])), (id_b, bool(card_b[1]))), ())
+
+    def find(self, cards_data):
+        """
+        Find every known combination among the cards of a spread
+
+        Args:
+            cards_data (list): Cards with name and isReversed, in spread order
+
+        Returns:
+            list: One dict per matching pair, in spread order:
+                {"cards": [name, name], "reversed": [bool, bool], "meanings": [...]}
+        """
+        sides = []
+        for card in cards_data:
+            card_id = self.ids.get(card.get('name'))
+            if card_id is not None:
+                sides.append((card_id, bool(card.get('isReversed', False))))
+
+        matches = []
+        for side_a, side_b in combinations(sides, 2):
+            meanings = self.pairs.get(self._pair_key(side_a, side_b))
+            if meanings:
+                matches.append({
+                    "cards": [self.names[side_a[0]], self.names[side_b[0]]],
+                    "reversed": [side_a[1], side_b[1]],
+                    "meanings": list(meanings),
+                })
+        return matches
@@ -0,0 +1,40 @@
+"""
+Runtime Data Directory
+
+The SQLite files the API writes while it runs (reading cache, rate limits,
+reading history) are kept together in one directory instead of beside the
+code, because simple_server.py serves the project directory to browsers.
+simple_server.py refuses to serve this directory, dotfiles and SQLite files.
+
+Settings (environment variables):
+    TAROT_DATA_DIR: Directory for the runtime data files (default var/ in
+        the project directory)
+"""
+
+import os
+
+DATA_DIR = os.path.abspath(os.getenv("TAROT_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'var')))
+
+
+def data_path(name):
+    """
+    Return the default path of a runtime data file
+
+    Args:
+        name (str): File name, e.g. "reading_history.sqlite3"
+
+    Returns:
+        str: Path of the file in DATA_DIR
+    """
+    return os.path.join(DATA_DIR, name)
+
+
+def ensure_parent(path):
+    """
+    Create the directory a data file goes in, if it does not exist yet
+
+    Args:
+        path (str): Path of the data file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,169 @@
+"""
+Fake Gemini Model
+
+A local stand-in for google.generativeai.GenerativeModel with configurable
+latency and failure injection. It lets the tarot bot, the resilience layer
+and the benchmarks run without a GEMINI_API_KEY or network access.
+
+TarotBot uses it when GEMINI_FAKE=1. The fake is configured with:
+    FAKE_GEMINI_LATENCY: Mean latency per call in seconds (default 0.5)
+    FAKE_GEMINI_JITTER: Random extra latency, up to this many seconds (default 0.2)
+    FAKE_GEMINI_FAILURE_RATE: Fraction of calls that fail (default 0)
+"""
+
+import os
+import time
+import random
+import asyncio
+from token_budget import truncate_to_tokens
+
+FAKE_READING = (
+    "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\n"
+    "ไพ่ที่ออกมาบอกว่า ช่วงนี้คุณกำลังเผชิญกับความท้าทายในชีวิต แต่อย่ากังวลไปค่ะ "
+    "ดวงดาวกำลังส่งพลังงานดีๆ มาให้คุณ ไพ่บ่งบอกว่าคุณมีพลังภายในที่แข็งแกร่ง\n\n"
+    "สุดท้ายนี้ หมอขอฝากไว้ว่า จงเชื่อมั่นในตัวเอง ทุกอย่างจะผ่านไปด้วยดีค่ะ"
+)
+
+
+class FakeCandidate:
+    """
+    Minimal stand-in for a response candidate
+    """
+
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+
+class FakeResponse:
+    """
+    Minimal stand-in for GenerateContentResponse
+    """
+
+    def __init__(self, text, finish_reason="STOP"):
+        self.text = text
+        self.candidates = [FakeCandidate(finish_reason)]
+
+
+class FakeStreamResponse:
+    """
+    Streamed response that yields the reading in chunks with a delay between them
+
+    The last chunk carries the finish reason, as in the real API.
+    """
+
+    def __init__(self, text, chunk_size, chunk_delay, finish_reason="STOP"):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.chunk_delay = chunk_delay
+        self.finish_reason = finish_reason
+
+    def _response(self, index):
+        last = index == len(self.chunks) - 1
+        return FakeResponse(self.chunks[index], self.finish_reason if last else None)
+
+    def __iter__(self):
+        for index in range(len(self.chunks)):
+            time.sleep(self.chunk_delay)
+            yield self._response(index)
+
+    async def __aiter__(self):
+        for index in range(len(self.chunks)):
+            await asyncio.sleep(self.chunk_delay)
+            yield self._response(index)
+
+
+class FakeServiceUnavailable(ConnectionError):
+    """Injected transient failure"""
+
+
+class FakeGenerativeModel:
+    """
+    GenerativeModel look-alike with injected latency and failures
+    """
+
+    def __init__(self, latency=0.5, jitter=0.2, failure_rate=0.0, text=FAKE_READING,
+                 error=FakeServiceUnavailable, chunk_size=40, seed=None):
+        """
+        Args:
+            latency (float): Base latency per call in seconds
+            jitter (float): Random extra latency, uniformly up to this many seconds
+            failure_rate (float): Fraction of calls that raise `error`
+            text (str): Reading returned by every call
+            error (type): Exception raised for injected failures
+            chunk_size (int): Characters per chunk for streamed responses
+            seed (int): Random seed, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.text = text
+        self.error = error
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a fake configured from the FAKE_GEMINI_* environment variables
+
+        Returns:
+            FakeGenerativeModel: The configured fake
+        """
+        return cls(
+            latency=float(os.getenv("FAKE_GEMINI_LATENCY", 0.5)),
+            jitter=float(os.getenv("FAKE_GEMINI_JITTER", 0.2)),
+            failure_rate=float(os.getenv("FAKE_GEMINI_FAILURE_RATE", 0)),
+        )
+
+    def _next_call(self):
+        """
+        Draw this call's latency and whether it fails
+
+        Returns:
+            tuple: (delay in seconds, fails)
+        """
+        self.calls += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        return delay, self.random.random() < self.failure_rate
+
+    def _reply(self, generation_config=None):
+        """
+        Return the reading, cut short at max_output_tokens if one is given
+
+        Args:
+            generation_config (dict): Generation settings of the call, if any
+
+        Returns:
+            tuple: (text to send, finish reason: "MAX_TOKENS" if it was cut short)
+        """
+        if isinstance(generation_config, dict):
+            limit = generation_config.get('max_output_tokens')
+        else:
+            limit = getattr(generation_config, 'max_output_tokens', None)
+        text = truncate_to_tokens(self.text, limit) if limit else self.text
+        return text, "STOP" if text == self.text else "MAX_TOKENS"
+
+    def _stream(self, reply, delay):
+        text, finish_reason = reply
+        chunk_count = max(1, -(-len(text) // self.chunk_size))
+        return FakeStreamResponse(text, self.chunk_size, delay / chunk_count, finish_reason)
+
+    def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+        delay, fails = self._next_call()
+        if fails:
+            time.sleep(delay / 2)
+            raise self.error("Injected failure from FakeGenerativeModel")
+        if stream:
+            return self._stream(self._reply(generation_config), delay)
+        time.sleep(delay)
+        return FakeResponse(*self._reply(generation_config))
+
+    async def generate_content_async(self, contents, stream=False, generation_config=None, **kwargs):
+        delay, fails = self._next_call()
+        if fails:
+            await asyncio.sleep(delay / 2)
+            raise self.error("Injected failure from FakeGenerativeModel")
+        if stream:
+            return self._stream(self._reply(generation_config), delay)
+        await asyncio.sleep(delay)
+        return FakeResponse(*self._reply(generation_config))
@@ -0,0 +1,399 @@
+"""
+Fake Gemini API Server
+
+A local HTTP server that answers the Gemini REST API (generateContent and
+streamGenerateContent) with a canned reading, so the whole stack — the
+google-generativeai client, the resilience layer and the web servers — can be
+load-tested without a GEMINI_API_KEY or network access. For each request it:
+- waits for a time to first token drawn from a latency distribution
+- writes the reading token by token at a fixed rate (streamed requests
+  receive each chunk as it is "generated")
+- fails a configurable fraction of requests with HTTP errors
+- stops at the request's maxOutputTokens and reports usageMetadata, with
+  the prompt's tokens estimated as in token_budget.py
+
+Point the tarot bot at it with:
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python tarot_bot.py
+
+Latency distributions (--latency), in seconds:
+    constant:S            always S
+    uniform:A,B           between A and B
+    normal:MEAN,SD        normal, clipped at 0
+    lognormal:MEDIAN,SIGMA
+    tail:BASE,SLOW,P      BASE, except a fraction P of requests take SLOW
+
+Errors (--errors) are given as STATUS:RATE pairs, e.g. 503:0.02,429:0.01.
+
+GET /stats reports request, error and token counters as JSON.
+
+Usage:
+    python fake_gemini_server.py [--port 8089] [--latency lognormal:0.8,0.4]
+        [--errors 503:0.02] [--tokens-per-second 150] [--seed 1]
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import http.server
+
+from fake_gemini import FAKE_READING
+from token_budget import estimate_tokens
+
+DEFAULT_PORT = 8089
+
+# Characters per generated token (Thai text averages about 3)
+TOKEN_CHARS = 3
+
+# Tokens sent per streamed chunk
+CHUNK_TOKENS = 8
+
+_GENERATE_PATH = re.compile(r'^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$')
+
+# google.rpc status names for the injected HTTP errors
+ERROR_STATUSES = {
+    400: "INVALID_ARGUMENT",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+class LatencyDistribution:
+    """
+    Random time to first token
+    """
+
+    KINDS = {
+        'constant': 1,
+        'uniform': 2,
+        'normal': 2,
+        'lognormal': 2,
+        'tail': 3,
+    }
+
+    def __init__(self, kind, params, seed=None):
+        """
+        Args:
+            kind (str): One of KINDS
+            params (tuple): Parameters of the distribution (see the module docstring)
+            seed (int): Random seed, for repeatable runs
+        """
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Unknown latency distribution: {kind}:{','.join(map(str, params))}")
+        self.kind = kind
+        self.params = tuple(params)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """
+        Build a distribution from a spec such as "lognormal:0.8,0.4"
+
+        Args:
+            spec (str): Distribution spec
+            seed (int): Random seed
+
+        Returns:
+            LatencyDistribution: The distribution
+        """
+        kind, _, params = spec.partition(':')
+        return cls(kind.strip().lower(), [float(value) for value in params.split(',') if value.strip()], seed)
+
+    def sample(self):
+        """
+        Draw a latency
+
+        Returns:
+            float: Seconds
+        """
+        with self._lock:
+            if self.kind == 'constant':
+                return self.params[0]
+            if self.kind == 'uniform':
+                return self.random.uniform(*self.params)
+            if self.kind == 'normal':
+                return max(0.0, self.random.gauss(*self.params))
+            if self.kind == 'lognormal':
+                median, sigma = self.params
+                return self.random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+            base, slow, fraction = self.params
+            return slow if self.random.random() < fraction else base
+
+    def __str__(self):
+        return f"{self.kind}:{','.join(f'{value:g}' for value in self.params)}"
+
+
+def parse_errors(spec):
+    """
+    Parse an error spec such as "503:0.02,429:0.01"
+
+    Args:
+        spec (str): Comma-separated STATUS:RATE pairs (may be empty)
+
+    Returns:
+        list: (status, rate) pairs
+    """
+    errors = []
+    for part in (spec or '').split(','):
+        if part.strip():
+            status, _, rate = part.partition(':')
+            errors.append((int(status), float(rate)))
+    return errors
+
+
+def tokenize(text, token_chars=TOKEN_CHARS):
+    """
+    Split text into fake tokens of a few characters
+
+    Args:
+        text (str): The reading
+        token_chars (int): Characters per token
+
+    Returns:
+        list: Token strings
+    """
+    return [text[i:i + token_chars] for i in range(0, len(text), token_chars)]
+
+
+def response_chunk(text, finished, finish_reason="STOP", usage=None):
+    """
+    Build one GenerateContentResponse
+
+    Args:
+        text (str): Text of this response (or chunk)
+        finished (bool): Whether generation has ended
+        finish_reason (str): Why generation ended ("STOP" or "MAX_TOKENS")
+        usage (tuple): (prompt tokens, reply tokens), sent with the last response
+
+    Returns:
+        dict: The response, in the REST API's JSON form
+    """
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    response = {"candidates": [candidate]}
+    if finished:
+        candidate["finishReason"] = finish_reason
+        if usage is not None:
+            response["usageMetadata"] = {"promptTokenCount": usage[0], "candidatesTokenCount": usage[1],
+                                         "totalTokenCount": usage[0] + usage[1]}
+    return response
+
+
+def prompt_tokens(request):
+    """
+    Estimate the input tokens of a generateContent request
+
+    Args:
+        request (dict): The request body
+
+    Returns:
+        int: Estimated tokens of the contents and system instruction
+    """
+    contents = list(request.get('contents') or [])
+    if request.get('systemInstruction'):
+        contents.append(request['systemInstruction'])
+    return sum(estimate_tokens(part.get('text', '')) for content in contents
+               for part in content.get('parts') or ())
+
+
+class FakeGeminiServer(http.server.ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the fake's settings and counters
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency, errors=(), tokens_per_second=150.0, text=FAKE_READING, seed=None):
+        """
+        Args:
+            address (tuple): (host, port) to listen on
+            latency (LatencyDistribution): Time to first token
+            errors (list): (HTTP status, rate) pairs of injected failures
+            tokens_per_second (float): Generation speed after the first token
+                (0 sends the whole text at once)
+            text (str): Reading returned by every request
+            seed (int): Random seed for the injected failures
+        """
+        super().__init__(address, FakeGeminiHandler)
+        self.latency = latency
+        self.errors = list(errors)
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokenize(text)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "streamed": 0, "errors": 0, "in_flight": 0, "request_bytes": 0, "tokens": 0}
+
+    def draw_error(self):
+        """
+        Decide whether the next request fails
+
+        Returns:
+            int or None: HTTP status to fail with, or None
+        """
+        with self.lock:
+            roll = self.random.random()
+        for status, rate in self.errors:
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "latency": str(self.latency),
+                "tokens_per_second": self.tokens_per_second,
+                "errors_injected": {str(status): rate for status, rate in self.errors},
+            }
+
+
+class FakeGeminiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        match = _GENERATE_PATH.match(self.path.split('?')[0])
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            request = {}
+
+        server = self.server
+        streamed = match.group(2) == 'streamGenerateContent'
+        server.count(requests=1, streamed=int(streamed), in_flight=1, request_bytes=len(body))
+        try:
+            delay = server.latency.sample()
+            status = server.draw_error()
+            time.sleep(delay)
+            if status is not None:
+                server.count(errors=1)
+                self._send_json(status, {"error": {
+                    "code": status,
+                    "message": "Injected failure from the fake Gemini server",
+                    "status": ERROR_STATUSES.get(status, "UNKNOWN"),
+                }})
+                return
+
+            tokens = server.tokens
+            limit = (request.get('generationConfig') or {}).get('maxOutputTokens')
+            finish_reason = "STOP"
+            if limit and len(tokens) > limit:
+                tokens, finish_reason = tokens[:limit], "MAX_TOKENS"
+            usage = (prompt_tokens(request), len(tokens))
+
+            if streamed:
+                self._stream(server, tokens, finish_reason, usage)
+            else:
+                if server.tokens_per_second:
+                    time.sleep(len(tokens) / server.tokens_per_second)
+                server.count(tokens=len(tokens))
+                self._send_json(200, response_chunk(''.join(tokens), True, finish_reason, usage))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            server.count(in_flight=-1)
+
+    def _stream(self, server, tokens, finish_reason, usage):
+        """Send the reading as a JSON array of responses, one chunk at a time"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        interval = CHUNK_TOKENS / server.tokens_per_second if server.tokens_per_second else 0.0
+        for start in range(0, len(tokens), CHUNK_TOKENS):
+            if start and interval:
+                time.sleep(interval)
+            finished = start + CHUNK_TOKENS >= len(tokens)
+            chunk = response_chunk(''.join(tokens[start:start + CHUNK_TOKENS]), finished, finish_reason, usage)
+            prefix = b'[' if start == 0 else b',\r\n'
+            self._write_chunk(prefix + json.dumps(chunk, ensure_ascii=False).encode('utf-8'))
+            server.count(tokens=len(tokens[start:start + CHUNK_TOKENS]))
+        self._write_chunk(b']')
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_in_thread(port=0, **options):
+    """
+    Run a fake server on a background thread
+
+    Args:
+        port (int): Port to listen on (0 picks a free one)
+        **options: Arguments of FakeGeminiServer; latency may be a spec string
+
+    Returns:
+        FakeGeminiServer: The running server (call shutdown() to stop it)
+    """
+    latency = options.pop('latency', 'constant:0')
+    if isinstance(latency, str):
+        latency = LatencyDistribution.parse(latency, options.get('seed'))
+    server = FakeGeminiServer(('127.0.0.1', port), latency, **options)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Gemini API server for load tests")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', default='lognormal:0.8,0.4', help="Time to first token distribution")
+    parser.add_argument('--errors', default='', help="Injected failures, e.g. 503:0.02,429:0.01")
+    parser.add_argument('--tokens-per-second', type=float, default=150.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    latency = LatencyDistribution.parse(args.latency, args.seed)
+    server = FakeGeminiServer(('127.0.0.1', args.port), latency, parse_errors(args.errors),
+                              args.tokens_per_second, seed=args.seed)
+    print(f"Fake Gemini API on http://127.0.0.1:{server.server_address[1]} "
+          f"(latency {latency}, {args.tokens_per_second:g} tokens/s, errors {args.errors or 'none'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
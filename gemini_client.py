@@ -0,0 +1,579 @@
+"""
+Resilient Gemini Client
+
+This module wraps a Gemini GenerativeModel so that calls from TarotBot:
+- share one model object (and the library's pooled gRPC channel) per process
+- retry transient errors with exponential backoff and jitter
+- never run longer than a hard per-call deadline, streamed replies included
+- optionally send a second (hedged) request when the first one is slower
+  than the recent 95th percentile latency
+- fail fast through a circuit breaker while the upstream keeps failing
+
+The wrapper has the same generate_content / generate_content_async methods as
+GenerativeModel, so it can also wrap the local fake in fake_gemini.py.
+
+Settings (environment variables):
+    GEMINI_TIMEOUT: Hard deadline per reading in seconds, retries included (default 25)
+    GEMINI_RETRIES: Retries after the first attempt for transient errors (default 2)
+    GEMINI_HEDGE: Set to 1 to enable hedged requests (default 0)
+    GEMINI_BREAKER_THRESHOLD: Consecutive failures that open the breaker (default 5)
+    GEMINI_BREAKER_COOLDOWN: Seconds the breaker stays open (default 30)
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger('tarot_bot')
+
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 25))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", 2))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", 30))
+
+# Errors worth retrying: rate limits, overload and network trouble
+_NETWORK_ERRORS = (ConnectionError, TimeoutError)
+_API_ERROR_NAMES = (
+    'ServiceUnavailable',
+    'DeadlineExceeded',
+    'ResourceExhausted',
+    'TooManyRequests',
+    'InternalServerError',
+    'BadGateway',
+    'GatewayTimeout',
+)
+_transient_errors = None
+
+
+def _transient_error_types():
+    """
+    Return the error classes worth retrying
+
+    The google.api_core errors are only looked up once the client library
+    has been imported (by the first real Gemini client), so this module
+    stays cheap to import; an error of those classes cannot exist before.
+
+    Returns:
+        tuple: Exception classes
+    """
+    global _transient_errors
+    if _transient_errors is not None:
+        return _transient_errors
+    api_exceptions = sys.modules.get('google.api_core.exceptions')
+    if api_exceptions is None:
+        return _NETWORK_ERRORS
+    _transient_errors = _NETWORK_ERRORS + tuple(getattr(api_exceptions, name) for name in _API_ERROR_NAMES)
+    return _transient_errors
+
+# Threads that run blocking model calls so they can be abandoned at the deadline
+_call_pool = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_MAX_WORKERS", 32)), thread_name_prefix='gemini')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a model call does not finish before its deadline"""
+
+
+def is_transient_error(error):
+    """
+    Decide whether a failed call is worth retrying
+
+    Args:
+        error (Exception): The error raised by the model call
+
+    Returns:
+        bool: True for rate limits, overload, timeouts and connection errors
+    """
+    return isinstance(error, _transient_error_types())
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed: calls go through. After failure_threshold consecutive failures the
+    breaker opens and calls fail immediately for cooldown seconds. Then one
+    trial call is let through (half-open); success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold=GEMINI_BREAKER_THRESHOLD, cooldown=GEMINI_BREAKER_COOLDOWN):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker
+            cooldown (float): Seconds to stay open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """str: "closed", "open" or "half-open" """
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def before_call(self):
+        """
+        Check that a call may go ahead
+
+        Returns:
+            bool: True if the call is the half-open trial, which must end in
+                record_success, record_failure or release_trial
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or a half-open trial is running
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+        raise CircuitOpenError("Gemini circuit breaker is open")
+
+    def release_trial(self, trial):
+        """
+        Free the half-open trial slot of a call that ended without telling
+        whether the upstream works (cancelled, e.g. the client disconnected,
+        or the request was rejected as invalid), so a later call can try
+
+        Args:
+            trial (bool): Value returned by before_call for that call
+        """
+        if trial:
+            with self._lock:
+                self.trial_in_flight = False
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Gemini circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Count a failed call, opening the breaker at the threshold"""
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.times_opened += 1
+                    logger.warning(f"Gemini circuit breaker opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies
+    """
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """
+        Return a latency percentile of the window
+
+        Args:
+            fraction (float): e.g. 0.95 for the 95th percentile
+
+        Returns:
+            float or None: Latency in seconds, or None without samples
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _ChunkIterator:
+    """Async iterator over a blocking stream, reading each chunk on _call_pool"""
+
+    _END = object()
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        chunk = await loop.run_in_executor(_call_pool, next, self._chunks, self._END)
+        if chunk is self._END:
+            raise StopAsyncIteration
+        return chunk
+
+
+class BlockingModelAdapter:
+    """
+    Async interface for a model that only supports blocking calls
+
+    The google-generativeai REST transport, used to reach a custom endpoint
+    such as fake_gemini_server.py, has no async client. Its blocking calls
+    run on _call_pool here so async callers don't block the event loop.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self.model.generate_content(contents, stream=stream, **kwargs)
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            _call_pool, lambda: self.model.generate_content(contents, stream=stream, **kwargs)
+        )
+        return _ChunkIterator(response) if stream else response
+
+
+class ResilientModel:
+    """
+    GenerativeModel wrapper with retries, deadline, hedging and a circuit breaker
+    """
+
+    def __init__(self, model, timeout=GEMINI_TIMEOUT, retries=GEMINI_RETRIES, hedge=GEMINI_HEDGE,
+                 breaker=None, backoff_base=0.5, backoff_max=8.0, hedge_min_samples=20):
+        """
+        Args:
+            model: The wrapped GenerativeModel (or a compatible fake)
+            timeout (float): Hard deadline per call in seconds, retries included
+            retries (int): Retries after the first attempt for transient errors
+            hedge (bool): Send a second request when the first is slower than p95
+            breaker (CircuitBreaker): Breaker to use (a new one by default)
+            backoff_base (float): First retry delay in seconds, doubled each retry
+            backoff_max (float): Largest retry delay in seconds
+            hedge_min_samples (int): Latency samples needed before hedging starts
+        """
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "failures": 0, "timeouts": 0, "rejected": 0}
+
+    def __getattr__(self, name):
+        # Anything not wrapped (e.g. count_tokens) goes to the model itself
+        return getattr(self.model, name)
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _hedge_delay(self):
+        """
+        Return how long to wait before sending a hedged request
+
+        Returns:
+            float or None: Seconds, or None if hedging is off or not yet calibrated
+        """
+        if not self.hedge or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    def _before_call(self):
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self.counters["rejected"] += 1
+            raise
+        self.counters["calls"] += 1
+        return trial
+
+    def _after_failure(self, error, trial):
+        if isinstance(error, TimeoutError):
+            self.counters["timeouts"] += 1
+        self.counters["failures"] += 1
+        if is_transient_error(error):
+            self.breaker.record_failure()
+        else:
+            # The request itself was rejected (e.g. a 400), which says nothing
+            # about whether the upstream has recovered
+            self.breaker.release_trial(trial)
+
+    def _deadline_error(self):
+        return DeadlineExceededError(f"Gemini call exceeded {self.timeout:g}s deadline")
+
+    def _stream_chunks(self, chunks, trial, deadline):
+        """
+        Yield the chunks of a streamed reply, waiting for each on the call pool
+        no later than the deadline, and tell the breaker how the stream ended
+
+        Args:
+            chunks: The streamed response of the model
+            trial (bool): Whether the call is the breaker's half-open trial
+            deadline (float): time.monotonic() by which the stream must end
+
+        Raises:
+            DeadlineExceededError: If a chunk does not arrive before the deadline
+        """
+        chunks = iter(chunks)
+        try:
+            while True:
+                future = _call_pool.submit(next, chunks, _ChunkIterator._END)
+                done, _ = wait([future], timeout=max(0, deadline - time.monotonic()))
+                if not done:
+                    raise self._deadline_error()
+                chunk = future.result()
+                if chunk is _ChunkIterator._END:
+                    break
+                yield chunk
+        except Exception as e:
+            self._after_failure(e, trial)
+            raise
+        except BaseException:
+            # Closed before the end (the client went away): frees the trial
+            self.breaker.release_trial(trial)
+            raise
+        self.breaker.record_success()
+
+    async def _stream_chunks_async(self, chunks, trial, deadline):
+        """
+        Asynchronous version of _stream_chunks
+        """
+        chunks = chunks.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise self._deadline_error() from None
+                yield chunk
+        except Exception as e:
+            self._after_failure(e, trial)
+            raise
+        except BaseException:
+            self.breaker.release_trial(trial)
+            raise
+        self.breaker.record_success()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        """
+        Call the model, retrying transient errors until the deadline
+
+        Streaming calls are not retried or hedged (the first chunk may already
+        have been shown), but still go through the circuit breaker, which
+        hears how the stream ended once it has been read. The whole stream
+        must arrive before the deadline; iterating it raises
+        DeadlineExceededError when the next chunk is late.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            DeadlineExceededError: If no attempt finished before the deadline
+        """
+        deadline = time.monotonic() + self.timeout
+        if stream:
+            trial = self._before_call()
+            try:
+                future = _call_pool.submit(self.model.generate_content, contents, stream=True, **kwargs)
+                done, _ = wait([future], timeout=self.timeout)
+                if not done:
+                    raise self._deadline_error()
+                response = future.result()
+            except Exception as e:
+                self._after_failure(e, trial)
+                raise
+            except BaseException:
+                # Cancelled: says nothing about the upstream, but frees the trial
+                self.breaker.release_trial(trial)
+                raise
+            return self._stream_chunks(response, trial, deadline)
+
+        attempt = 0
+        attempt = 0
+        while True:
+            trial = self._before_call()
+            try:
+                response = self._attempt(contents, kwargs, deadline)
+            except Exception as e:
+                self._after_failure(e, trial)
+                delay = self._backoff(attempt)
+                if not is_transient_error(e) or attempt >= self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"Gemini call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                self.counters["retries"] += 1
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: says nothing about the upstream, but frees the trial
+                self.breaker.release_trial(trial)
+                raise
+
+            self.breaker.record_success()
+            return response
+
+    def _attempt(self, contents, kwargs, deadline):
+        """
+        Run one (possibly hedged) blocking call on the call pool
+
+        Returns:
+            The model response from whichever request finished first
+        """
+        started = time.monotonic()
+        futures = [_call_pool.submit(self.model.generate_content, contents, **kwargs)]
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=max(0, min(hedge_delay, deadline - time.monotonic())))
+            if not done and time.monotonic() < deadline:
+                self.counters["hedges"] += 1
+                futures.append(_call_pool.submit(self.model.generate_content, contents, **kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self.latency.add(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            raise error
+        raise self._deadline_error()
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        """
+        Asynchronous version of generate_content
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            DeadlineExceededError: If no attempt finished before the deadline
+        """
+        deadline = time.monotonic() + self.timeout
+        if stream:
+            trial = self._before_call()
+            try:
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(contents, stream=True, **kwargs), self.timeout)
+            except asyncio.TimeoutError as e:
+                error = self._deadline_error()
+                self._after_failure(error, trial)
+                raise error from e
+            except Exception as e:
+                self._after_failure(e, trial)
+                raise
+            except BaseException:
+                # Cancelled: says nothing about the upstream, but frees the trial
+                self.breaker.release_trial(trial)
+                raise
+            return self._stream_chunks_async(response, trial, deadline)
+
+        attempt = 0
+        attempt = 0
+        while True:
+            trial = self._before_call()
+            try:
+                response = await self._attempt_async(contents, kwargs, deadline)
+            except Exception as e:
+                self._after_failure(e, trial)
+                delay = self._backoff(attempt)
+                if not is_transient_error(e) or attempt >= self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"Gemini call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                self.counters["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: says nothing about the upstream, but frees the trial
+                self.breaker.release_trial(trial)
+                raise
+
+            self.breaker.record_success()
+            return response
+
+    async def _attempt_async(self, contents, kwargs, deadline):
+        """
+        Run one (possibly hedged) asynchronous call
+
+        Returns:
+            The model response from whichever request finished first
+        """
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self.model.generate_content_async(contents, **kwargs))]
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=max(0, min(hedge_delay, deadline - time.monotonic())))
+                if not done and time.monotonic() < deadline:
+                    self.counters["hedges"] += 1
+                    tasks.append(asyncio.ensure_future(self.model.generate_content_async(contents, **kwargs)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.add(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+
+            if error is not None and not pending:
+                raise error
+            raise self._deadline_error()
+        finally:
+            # Cancel the losing or timed-out requests
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        """
+        Report call counters, latency percentiles and breaker state
+
+        Returns:
+            dict: Client statistics
+        """
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            **self.counters,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
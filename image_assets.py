@@ -0,0 +1,268 @@
+"""
+Card Image Variants for the Web Page
+
+The card artwork in image/ is loaded at full size as JPEG. This module
+generates, for every image:
+- resized copies at the widths in IMAGE_WIDTHS, never wider than the source
+- AVIF and WebP encodings next to a recompressed JPEG, so browsers pick the
+  smallest format they support
+
+Variants are written to cards/images/ with their content hash in the file
+name, so they never change and can be cached forever. cards/images/manifest.json
+records, for every source image, its hash and its variants. Builds are
+incremental: an image is only encoded again when its contents or the
+encoding settings change.
+
+card_assets.py adds each card's variants to cards/index.json as srcset
+lists for script.js.
+
+Needs Pillow; without it the site serves the original images (or the
+variants of an earlier build).
+
+The variants are rebuilt automatically by simple_server.py when an image
+changes, or explicitly with:
+    python image_assets.py
+"""
+
+import io
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+from card_assets import BASE_DIR, DEFAULT_OUTPUT_DIR, IMAGE_DIR, MANIFEST_NAME, content_hash, _encode, _write
+
+logger = logging.getLogger('tarot_bot')
+
+DEFAULT_IMAGE_OUTPUT_DIR = os.path.join(DEFAULT_OUTPUT_DIR, 'images')
+
+# Bump when the layout of the generated files changes
+IMAGES_VERSION = 1
+
+# Card images are shown about 100-150 CSS pixels wide in the spread and up
+# to 300 in the detail panel; 600 covers the detail panel on 2x screens.
+# Sources narrower than the largest width also keep their own width.
+IMAGE_WIDTHS = (100, 200, 300, 600)
+
+# Encoder settings by format, in order of preference
+IMAGE_FORMATS = (
+    ('avif', 'AVIF', {'quality': 50, 'speed': 8}),
+    ('webp', 'WEBP', {'quality': 70, 'method': 6}),
+    ('jpeg', 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+SOURCE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.webp')
+
+
+def available_formats():
+    """
+    List the formats the installed Pillow can encode
+
+    Returns:
+        list: Format names from IMAGE_FORMATS, e.g. ['avif', 'webp', 'jpeg']
+    """
+    if Image is None:
+        return []
+    return [name for name, _, _ in IMAGE_FORMATS if name == 'jpeg' or features.check(name)]
+
+
+def _settings():
+    """Everything that changes the encoded output, to detect stale variants"""
+    formats = available_formats()
+    return [IMAGES_VERSION, list(IMAGE_WIDTHS),
+            [[name, options] for name, _, options in IMAGE_FORMATS if name in formats]]
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def encode_variants(data, stem):
+    """
+    Resize and encode one image
+
+    Args:
+        data (bytes): Contents of the source image
+        stem (str): File name of the source without its extension
+
+    Returns:
+        tuple: (width, height, variants), where variants is a list of
+            (file name, format, width, height, bytes)
+    """
+    formats = available_formats()
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        source.load()
+        image = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+
+    width, height = image.size
+    widths = sorted({w for w in IMAGE_WIDTHS if w < width} | ({width} if width <= max(IMAGE_WIDTHS) else set()))
+    variants = []
+    for target_width in widths:
+        if target_width == width:
+            resized = image
+        else:
+            resized = image.resize((target_width, max(1, round(height * target_width / width))), Image.LANCZOS)
+        for name, pil_format, options in IMAGE_FORMATS:
+            if name not in formats:
+                continue
+            frame = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, format=pil_format, **options)
+            encoded = buffer.getvalue()
+            # Keep the original file if recompressing it doesn't help
+            if pil_format == source_format and target_width == width and len(encoded) >= len(data):
+                encoded = data
+            file_name = f"{stem}-{target_width}.{content_hash(encoded)[:12]}.{name}"
+            variants.append((file_name, name, target_width, resized.size[1], encoded))
+    return width, height, variants
+
+
+def _build_image(path, output_dir):
+    """Encode one source image and write its variants"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    stem = ''.join(os.path.splitext(os.path.basename(path))[0].lower().split())
+    width, height, variants = encode_variants(data, stem)
+
+    entry = {
+        "stat": _source_stat(path),
+        "hash": content_hash(data)[:16],
+        "width": width,
+        "height": height,
+        "variants": [],
+    }
+    for file_name, name, variant_width, variant_height, encoded in variants:
+        _write(os.path.join(output_dir, file_name), encoded)
+        entry["variants"].append({
+            "file": file_name,
+            "format": name,
+            "width": variant_width,
+            "height": variant_height,
+            "size": len(encoded),
+            "etag": f'"{content_hash(encoded)[:16]}"',
+        })
+    return entry
+
+
+def _is_current(entry, path, output_dir):
+    """Whether a manifest entry still describes a source image and its files"""
+    if not entry:
+        return False
+    if entry.get("stat") != _source_stat(path):
+        with open(path, 'rb') as file:
+            if content_hash(file.read())[:16] != entry.get("hash"):
+                return False
+        # Same contents, only touched
+        entry["stat"] = _source_stat(path)
+    return all(os.path.exists(os.path.join(output_dir, variant["file"])) for variant in entry.get("variants", ()))
+
+
+def build(image_dir=IMAGE_DIR, output_dir=DEFAULT_IMAGE_OUTPUT_DIR, max_workers=None):
+    """
+    Generate the variants of every image that changed since the last build
+
+    Args:
+        image_dir (str): Directory of the source images
+        output_dir (str): Directory to write the variants to
+        max_workers (int): Images encoded in parallel (default: CPU count)
+
+    Returns:
+        dict or None: The manifest. Without Pillow nothing is encoded and the
+            manifest of a previous build, if any, is returned.
+    """
+    if Image is None:
+        logger.info("Pillow is not installed; card image variants are not rebuilt")
+        return load_manifest(output_dir)
+
+    settings = _settings()
+    previous = load_manifest(output_dir) or {}
+    previous_data = _encode(previous)
+    previous_images = previous.get("images", {}) if previous.get("settings") == settings else {}
+
+    sources = sorted(
+        name for name in os.listdir(image_dir)
+        if name.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(image_dir, name))
+    )
+    site_dir = os.path.relpath(image_dir, BASE_DIR).replace(os.sep, '/')
+
+    images, stale = {}, []
+    for name in sources:
+        key = f"{site_dir}/{name}"
+        entry = previous_images.get(key)
+        if _is_current(entry, os.path.join(image_dir, name), output_dir):
+            images[key] = entry
+        else:
+            stale.append((key, name))
+
+    os.makedirs(output_dir, exist_ok=True)
+    if stale:
+        logger.info(f"Encoding {len(stale)} of {len(sources)} card images in {output_dir}")
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+            built = executor.map(lambda item: _build_image(os.path.join(image_dir, item[1]), output_dir), stale)
+            for (key, _), entry in zip(stale, built):
+                images[key] = entry
+
+    images = {key: images[key] for key in sorted(images)}
+    files = {
+        variant["file"]: {"etag": variant["etag"], "size": variant["size"]}
+        for entry in images.values() for variant in entry["variants"]
+    }
+
+    # Remove variants left over from earlier builds
+    for name in os.listdir(output_dir):
+        if name not in files and name != MANIFEST_NAME:
+            os.remove(os.path.join(output_dir, name))
+
+    manifest = {
+        "settings": settings,
+        "path": os.path.relpath(output_dir, BASE_DIR).replace(os.sep, '/'),
+        "digest": content_hash(_encode(files))[:16],
+        "images": images,
+        "files": files,
+    }
+    if _encode(manifest) != previous_data:
+        _write(os.path.join(output_dir, MANIFEST_NAME), _encode(manifest))
+    return manifest
+
+
+def load_manifest(output_dir=DEFAULT_IMAGE_OUTPUT_DIR):
+    """
+    Read the manifest of a previous build
+
+    Args:
+        output_dir (str): Directory the variants were written to
+
+    Returns:
+        dict or None: The manifest, or None if there is no valid one
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if Image is None:
+        raise SystemExit("Install Pillow to build the image variants")
+    manifest = build()
+
+    source_total = sum(os.path.getsize(os.path.join(BASE_DIR, key)) for key in manifest["images"])
+    print(f"{len(manifest['images'])} images, {len(manifest['files'])} variants in {DEFAULT_IMAGE_OUTPUT_DIR}")
+    print(f"  originals  {source_total // 1024:6d} KB")
+    for name in available_formats():
+        sizes = {}
+        for entry in manifest["images"].values():
+            for variant in entry["variants"]:
+                if variant["format"] == name:
+                    sizes[variant["width"]] = sizes.get(variant["width"], 0) + variant["size"]
+        columns = '  '.join(f"{width}w {sizes.get(width, 0) // 1024:5d} KB" for width in IMAGE_WIDTHS)
+        print(f"  {name:9s}  {columns}")
@@ -0,0 +1,488 @@
+"""
+Request Instrumentation for the Tarot Bot API
+
+Times each stage of a reading (request parsing, card enrichment, prompt
+building, cache lookup, the model call, sanitization and serialization) and
+keeps Prometheus-style metrics in memory:
+- latency histograms per request route and per stage
+- in-flight request gauges
+- reading error, fallback and admission counters
+- prompt and response size histograms, in characters and in tokens
+- input and output tokens spent on the model
+
+GET /metrics renders them in the Prometheus text format. Counters kept
+elsewhere (reading cache, model client) are read when the metrics are
+scraped, through collectors, instead of being updated on every request.
+
+With LOG_FORMAT=json every log line is a JSON object carrying the ID of the
+request it belongs to, and each request ends with one line listing its stage
+timings and the tokens its model call used. Request IDs come from the X-Request-ID header or are generated, and
+are sent back in the same header.
+
+Metrics are kept per process; with several workers, each reports its own.
+
+Settings (environment variables):
+    METRICS: "0" turns off timing and metrics (default "1")
+    LOG_FORMAT: "json" for structured logs, "text" otherwise (default "text")
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger('tarot_bot')
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets: seconds for latencies, characters for text sizes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Longest request ID accepted from a client
+MAX_REQUEST_ID_LENGTH = 64
+
+# Request being handled by the current thread or task
+_current_request = contextvars.ContextVar('tarot_request', default=None)
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    """
+    Render a Prometheus label set
+
+    Args:
+        names (tuple): Label names
+        values (tuple): Label values, in the same order
+        extra (tuple): Additional (name, value) pairs, e.g. the "le" of a bucket
+
+    Returns:
+        str: e.g. '{route="reading"}', or '' without labels
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of the metrics, holding one value per label combination
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        """
+        Args:
+            name (str): Metric name, e.g. "tarot_requests_in_flight"
+            help_text (str): Description shown in the metrics output
+            labelnames (tuple): Names of the labels; values are passed
+                positionally, in the same order, when recording
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text format
+
+        Returns:
+            list: Output lines
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down"""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the metrics output
+            labelnames (tuple): Names of the labels
+            buckets (tuple): Upper bounds of the buckets, ascending
+        """
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames, labels, (('le', _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics and collectors exposed on /metrics
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        """
+        Add a metric to the output
+
+        Args:
+            metric (Metric): The metric
+
+        Returns:
+            Metric: The same metric, for assignment
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """
+        Add a function that reports values kept elsewhere
+
+        Args:
+            collect (callable): Called on every scrape; returns an iterable of
+                (name, kind, help, samples) where samples is a list of
+                (labels dict, value)
+        """
+        self.collectors.append(collect)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format
+
+        Returns:
+            str: The metrics page
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                collected = list(collect())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {type(e).__name__}: {e}")
+                continue
+            for name, kind, help_text, samples in collected:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'tarot_request_duration_seconds', 'Time to handle a request, by route', ('route',)))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'tarot_requests_in_flight', 'Requests being handled, by route', ('route',)))
+STAGE_SECONDS = registry.register(Histogram(
+    'tarot_stage_duration_seconds', 'Time spent in each stage of a reading', ('stage',)))
+READING_ERRORS = registry.register(Counter(
+    'tarot_reading_errors_total', 'Readings that failed, by exception type', ('error',)))
+FALLBACKS = registry.register(Counter(
+    'tarot_fallback_readings_total', 'Fallback readings served after a failure, by source', ('source',)))
+CACHE_LOOKUPS = registry.register(Counter(
+    'tarot_cache_lookups_total', 'Reading cache lookups, by result', ('result',)))
+ADMISSION_DECISIONS = registry.register(Counter(
+    'tarot_admission_decisions_total',
+    'Cache misses served without a model call of their own, by reason (coalesced, rate_limited, overloaded)',
+    ('reason',)))
+PROMPT_CHARS = registry.register(Histogram(
+    'tarot_prompt_chars', 'Length of the prompts sent to the model', buckets=SIZE_BUCKETS))
+RESPONSE_CHARS = registry.register(Histogram(
+    'tarot_response_chars', 'Length of the readings returned by the model', buckets=SIZE_BUCKETS))
+PROMPT_TOKENS = registry.register(Histogram(
+    'tarot_prompt_tokens', 'Input tokens per model call, system instruction included', buckets=TOKEN_BUCKETS))
+RESPONSE_TOKENS = registry.register(Histogram(
+    'tarot_response_tokens', 'Output tokens per model call', buckets=TOKEN_BUCKETS))
+MODEL_TOKENS = registry.register(Counter(
+    'tarot_model_tokens_total', 'Tokens spent on model calls, by kind (input, output)', ('kind',)))
+
+
+def render_metrics():
+    """
+    Render all metrics for GET /metrics
+
+    Returns:
+        str: Prometheus text format
+    """
+    return registry.render()
+
+
+class RequestContext:
+    """
+    Request ID and stage timings of one request
+    """
+
+    __slots__ = ('request_id', 'route', 'started', 'stages', 'status', 'tokens', '_token')
+
+    def __init__(self, route, request_id):
+        self.route = route
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.status = None
+        self.tokens = None
+        self._token = None
+
+
+def _clean_request_id(request_id):
+    """Accept a client's request ID if it is short and printable, else make one"""
+    if request_id and len(request_id) <= MAX_REQUEST_ID_LENGTH and request_id.isprintable():
+        return request_id
+    return os.urandom(8).hex()
+
+
+def start_request(route, request_id=None):
+    """
+    Start timing a request
+
+    Args:
+        route (str): Name of the endpoint, used as the metrics label
+        request_id (str): ID sent by the client (X-Request-ID), if any
+
+    Returns:
+        RequestContext or None: The request context, or None when metrics and
+            JSON logs are both turned off
+    """
+    if not METRICS_ENABLED and LOG_FORMAT != 'json':
+        return None
+    context = RequestContext(route, _clean_request_id(request_id))
+    context._token = _current_request.set(context)
+    REQUESTS_IN_FLIGHT.inc(route)
+    return context
+
+
+def finish_request(context):
+    """
+    Record the duration of a request and log its stage timings
+
+    Args:
+        context (RequestContext): Value returned by start_request (None is ignored)
+    """
+    if context is None:
+        return
+    elapsed = time.perf_counter() - context.started
+    REQUESTS_IN_FLIGHT.dec(context.route)
+    REQUEST_SECONDS.observe(elapsed, context.route)
+
+    if LOG_FORMAT == 'json':
+        fields = {
+            "route": context.route,
+            "status": context.status,
+            "duration_ms": round(elapsed * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in context.stages.items()},
+        }
+        if context.tokens:
+            fields["tokens"] = context.tokens
+        logger.info("Request finished", extra={"fields": fields})
+
+    try:
+        _current_request.reset(context._token)
+    except ValueError:
+        # Finished from another context (e.g. a different asyncio task)
+        _current_request.set(None)
+
+
+def current_request():
+    """
+    Return the request being handled
+
+    Returns:
+        RequestContext or None: The current request, if one is being timed
+    """
+    return _current_request.get()
+
+
+def record_tokens(input_tokens, output_tokens):
+    """
+    Record the tokens used by one model call
+
+    They are added to the token metrics and to the current request, whose
+    JSON log line lists them.
+
+    Args:
+        input_tokens (int): Tokens of the prompt and system instruction
+        output_tokens (int): Tokens of the reply
+    """
+    PROMPT_TOKENS.observe(input_tokens)
+    RESPONSE_TOKENS.observe(output_tokens)
+    MODEL_TOKENS.inc("input", amount=input_tokens)
+    MODEL_TOKENS.inc("output", amount=output_tokens)
+    context = _current_request.get()
+    if context is not None:
+        context.tokens = {"input": input_tokens, "output": output_tokens}
+
+
+class _Stage:
+    """Times one stage of the current request"""
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.name)
+        context = _current_request.get()
+        if context is not None:
+            context.stages[self.name] = context.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+class _NoStage:
+    """Stage timer used when metrics are turned off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """
+    Time a stage of the current request
+
+    Usage:
+        with stage("prompt"):
+            prompt = build_prompt()
+
+    Args:
+        name (str): Stage name, used as the metrics label
+
+    Returns:
+        A context manager
+    """
+    return _Stage(name) if METRICS_ENABLED else _NO_STAGE
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as one JSON object per line
+
+    The ID of the current request is added, as are the fields passed with
+    extra={"fields": {...}}.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        context = _current_request.get()
+        if context is not None:
+            entry["request_id"] = context.request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Configure the root logger in the format chosen by LOG_FORMAT
+
+    Args:
+        level (int): Logging level
+    """
+    if LOG_FORMAT == 'json':
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logging.basicConfig(level=level, handlers=[handler])
+    else:
+        logging.basicConfig(level=level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
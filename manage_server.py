@@ -3,48 +3,76 @@ Tarot Bot Server Management Script
 
 This script provides commands to start, stop, and check the status of the tarot bot server.
 It helps users manage the server without needing to use the command line directly.
+
+On Unix the server runs under supervisor.py, a pre-fork pool of uvicorn
+workers; "reload" asks it to reload the card data and replace its workers
+one at a time without dropping requests. On Windows it runs under uvicorn's
+own --workers mode. With more than one worker, RATE_LIMIT_BACKEND defaults to
+"sqlite" so the workers share the rate limits (see admission.py).
+
+The commands do not import the web app (tarot_bot.py) or the Gemini client,
+only "run" does, and requests is imported by the commands that talk to the
+server, so stop and reload return without loading them.
 """
 
 import os
 import sys
 import time
 import subprocess
-import requests
+import importlib.util
 import signal
 import psutil
 from dotenv import load_dotenv
-from tarot_bot import app
 
 # Constants
 SERVER_PORT = 5000
 SERVER_URL = f"http://localhost:{SERVER_PORT}/api/tarot-reading"
+READY_URL = f"http://localhost:{SERVER_PORT}/api/ready"
 PID_FILE = ".server_pid.txt"
+LOG_FILE = ".server.log"
+
+# Number of ASGI worker processes started by "start" (override with SERVER_WORKERS)
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
 
 def check_dependencies():
-    """Check if all required dependencies are installed"""
-    try:
-        import psutil
-        import requests
-        import dotenv
-        return True
-    except ImportError as e:
-        print(f"Missing dependency: {e}")
+    """Check if all required dependencies are installed, without importing them"""
+    missing = [name for name in ('psutil', 'requests', 'dotenv') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"Missing dependency: {', '.join(missing)}")
         print("Please install required packages with: pip install psutil requests python-dotenv")
         return False
+    return True
 
 def is_server_running():
     """Check if the server is running by making a request to the health check endpoint"""
+    import requests
     try:
         response = requests.head(SERVER_URL, timeout=2)
         return response.status_code != 404
     except requests.exceptions.RequestException:
         return False
 
+def check_readiness():
+    """
+    Ask the server whether it can serve readings
+
+    Returns:
+        dict or None: The readiness report of the worker that answered, or
+            None if the server did not answer
+    """
+    import requests
+    try:
+        return requests.get(READY_URL, timeout=5).json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
 def find_server_process():
     """Find the server process by checking running Python processes"""
     for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
         try:
             cmdline = proc.info.get('cmdline', [])
+            if cmdline and ('asgi_app:app' in cmdline or any(part.endswith('supervisor.py') for part in cmdline)):
+                return proc
             if cmdline and len(cmdline) > 1:
                 if 'python' in cmdline[0].lower() and 'manage_server.py' in cmdline[1]:
                     if len(cmdline) > 2 and cmdline[2] == 'start':
@@ -68,8 +96,13 @@ def load_pid():
                 return None
     return None
 
-def start_server():
-    """Start the tarot bot server"""
+def start_server(workers=SERVER_WORKERS):
+    """
+    Start the tarot bot server in the background
+
+    The API runs the asynchronous serving mode (asgi_app.py) in the given
+    number of worker processes, under supervisor.py where os.fork exists.
+    """
     if is_server_running():
         print("Server is already running!")
         return
@@ -87,31 +120,77 @@ def start_server():
         print("WARNING: GEMINI_API_KEY not found in .env file. Please add it.")
         return
 
-    print("Starting Tarot Bot server...")
+    # Each worker keeps its own in-memory rate limit buckets, which would give
+    # a client N times the allowance; share them in SQLite unless set otherwise
+    if workers > 1:
+        os.environ.setdefault("RATE_LIMIT_BACKEND", "sqlite")
+
+    print(f"Starting Tarot Bot server with {workers} worker(s)...")
+
+    if hasattr(os, 'fork'):
+        command = [
+            sys.executable, 'supervisor.py',
+            '--host', '127.0.0.1',
+            '--port', str(SERVER_PORT),
+            '--workers', str(workers),
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+            '--host', '127.0.0.1',
+            '--port', str(SERVER_PORT),
+            '--workers', str(workers),
+        ]
 
     if os.name == 'nt':  # Windows
         process = subprocess.Popen(
-            ['python', 'manage_server.py', 'start', 'direct'],
+            command,
             creationflags=subprocess.CREATE_NEW_CONSOLE
         )
     else:  # Unix/Linux/Mac
-        process = subprocess.Popen(
-            ['python', 'manage_server.py', 'start', 'direct'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            start_new_session=True
-        )
+        # Send server output to a log file; an unread pipe would eventually block the server
+        with open(LOG_FILE, 'a') as log:
+            process = subprocess.Popen(
+                command,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
 
     save_pid(process.pid)
 
     print("Waiting for server to start...")
-    for _ in range(10):
-        if is_server_running():
+    report = None
+    for _ in range(20):
+        report = check_readiness()
+        if report and report.get("ready"):
             print(f"Server started successfully! Running on http://localhost:{SERVER_PORT}")
             return
         time.sleep(1)
 
-    print("Server may not have started properly. Please check for errors.")
+    if report:
+        print(f"Server is running but not ready: {report.get('checks')}")
+    else:
+        print("Server may not have started properly. Please check for errors.")
+
+def reload_server():
+    """Reload the card data and replace the server's workers without downtime"""
+    if not hasattr(signal, 'SIGHUP'):
+        print("Reload is not supported on this platform; use restart instead.")
+        return
+    pid = load_pid()
+    process = None
+    if pid:
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            process = None
+    process = process or find_server_process()
+    if not process or not any(part.endswith('supervisor.py') for part in process.cmdline()):
+        print("No running supervisor found. Start the server with: python manage_server.py start")
+        return
+    process.send_signal(signal.SIGHUP)
+    print(f"Rolling restart requested (supervisor PID: {process.pid}). See {LOG_FILE} for progress.")
 
 def stop_server():
     """Stop the tarot bot server"""
@@ -145,6 +224,19 @@ def check_status():
         if process:
             print(f"Process ID: {process.pid}")
             print(f"Running for: {time.time() - process.create_time():.1f} seconds")
+            try:
+                workers = process.children()
+            except psutil.Error:
+                workers = []
+            if workers:
+                print(f"Workers: {', '.join(str(worker.pid) for worker in workers)}")
+        report = check_readiness()
+        if report:
+            state = "ready" if report.get("ready") else "NOT ready"
+            print(f"Worker {report.get('pid')} is {state}:")
+            for name, check in (report.get("checks") or {}).items():
+                details = ", ".join(f"{key}={value}" for key, value in check.items() if key != "ok")
+                print(f"  {name}: {'ok' if check.get('ok') else 'FAILED'} ({details})")
         return True
     else:
         print("Server is not running.")
@@ -155,15 +247,18 @@ def print_help():
     print("Tarot Bot Server Management Script")
     print("----------------------------------")
     print("Commands:")
-    print("  start   - Start the tarot bot server in the background")
-    print("  run     - Run the tarot bot server in the current terminal")
-    print("  stop    - Stop the tarot bot server")
-    print("  status  - Check if the server is running")
-    print("  restart - Restart the tarot bot server")
-    print("  help    - Show this help message")
+    print("  start [N] - Start the tarot bot server in the background with N workers")
+    print("  run       - Run the tarot bot debug server in the current terminal")
+    print("  stop      - Stop the tarot bot server")
+    print("  status    - Check if the server is running")
+    print("  restart   - Restart the tarot bot server")
+    print("  reload    - Reload the card data and replace the workers one at a time")
+    print("  help      - Show this help message")
 
 def run_server_directly():
     """Run the Flask server directly in the current process"""
+    from tarot_bot import app
+
     print("Starting Tarot Bot API server...")
 
     if not os.path.exists('.env'):
@@ -195,12 +290,16 @@ def main():
     if command == "start":
         if len(sys.argv) > 2 and sys.argv[2] == "direct":
             run_server_directly()
+        elif len(sys.argv) > 2 and sys.argv[2].isdigit():
+            start_server(int(sys.argv[2]))
         else:
             start_server()
     elif command == "stop":
         stop_server()
     elif command == "status":
         check_status()
+    elif command == "reload":
+        reload_server()
     elif command == "restart":
         stop_server()
         time.sleep(2)
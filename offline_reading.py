@@ -0,0 +1,185 @@
+"""
+Offline Tarot Reading Engine
+
+This module composes a complete Thai reading from the card database alone,
+without calling Gemini. Everything that does not depend on the spread
+(meaning excerpts for each domain, journaling prompts and quotes) is
+prepared once per card and orientation, and suggested combinations come from
+the combination index, so composing a reading is a handful of lookups and a
+join and takes well under a millisecond.
+
+The engine is used:
+- for every reading when READING_MODE=offline, or per request with "mode": "offline"
+- as a fallback when the model is slow, rate-limited or down
+
+Readings are deterministic: the same spread always produces the same text.
+"""
+
+import re
+import zlib
+from combination_index import CombinationIndex
+
+# Meaning domains in newtarot.json and how they are introduced in a reading
+DOMAIN_LABELS = {
+    'relationships_love': "ด้านความรัก",
+    'career_work_finances': "ด้านการงานและการเงิน",
+    'well_being_health': "ด้านสุขภาพ",
+    'spirituality': "ด้านจิตวิญญาณ",
+    'personality_types': "ด้านบุคลิกภาพ",
+}
+
+# Domains covered by a reading that has no particular focus
+DEFAULT_DOMAINS = ('relationships_love', 'career_work_finances', 'well_being_health')
+
+# Card table columns the engine reads (see CardTable.card_data)
+OFFLINE_COLUMNS = ('keywords', 'meanings:general', *(f'meanings:{domain}' for domain in DOMAIN_LABELS),
+                   'quotes', 'journaling_prompts')
+
+# Longest meaning excerpt kept per card, in characters
+EXCERPT_LENGTH = 280
+
+# Most combinations mentioned in one reading
+MAX_COMBINATIONS = 4
+
+# Source citations such as "[cite: 970]" left in the card data
+_CITATION = re.compile(r'\s*\[cite:[^\]]*\]')
+
+OPENINGS = (
+    "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ ดวงดาวได้เรียงตัวและไพ่ได้เผยสารถึงคุณแล้ว",
+    "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล พลังงานจากไพ่ที่คุณเลือกส่งมาถึงหมออย่างชัดเจน มาดูกันค่ะว่าดวงของคุณบอกอะไร",
+    "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ไพ่ทาโร่ที่ถูกเปิดในวันนี้มีเรื่องราวสำคัญที่อยากบอกคุณค่ะ",
+)
+
+CLOSINGS = (
+    "สุดท้ายนี้ หมอขอฝากไว้ว่า จงเชื่อมั่นในตัวเองและฟังเสียงหัวใจ ดวงดาวอยู่เคียงข้างคุณเสมอค่ะ",
+    "ขอให้พลังแห่งไพ่ทาโร่นำทางคุณไปสู่สิ่งที่ดีงาม ทุกอุปสรรคคือบทเรียนที่จะทำให้คุณเติบโตค่ะ",
+    "หมอขอให้คุณก้าวเดินด้วยความหวังและความกล้าหาญ จักรวาลกำลังส่งพลังงานดีๆ มาให้คุณค่ะ",
+)
+
+
+def excerpt(text, limit=EXCERPT_LENGTH):
+    """
+    Shorten a meaning to its opening clauses
+
+    Thai separates clauses with spaces, so the text is cut at the last space
+    before the limit. Source citations are removed.
+
+    Args:
+        text (str): Full meaning text
+        limit (int): Maximum length in characters
+
+    Returns:
+        str: The excerpt
+    """
+    text = ' '.join(_CITATION.sub('', text).split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(' ', 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip()
+
+
+class CardEntry:
+    """
+    Pre-rendered reading text for one card in one orientation
+    """
+
+    __slots__ = ('name', 'status', 'meaning', 'domains', 'prompts', 'quotes')
+
+    def __init__(self, card, is_reversed):
+        """
+        Args:
+            card (Mapping): Raw card data
+            is_reversed (bool): Orientation of the card
+        """
+        orientation = 'reversed' if is_reversed else 'upright'
+        meanings = card.get(f'{orientation}_meanings') or {}
+        keywords = card.get('keywords') or {}
+
+        self.name = card['name']
+        self.status = "กลับหัว" if is_reversed else "หงายขึ้น"
+        self.meaning = excerpt(meanings.get('general') or keywords.get(orientation) or '')
+        self.domains = {domain: excerpt(meanings[domain]) for domain in DOMAIN_LABELS if meanings.get(domain)}
+        self.prompts = tuple(card.get('journaling_prompts') or ())
+        self.quotes = tuple(card.get('quotes') or ())
+
+
+class OfflineReadingEngine:
+    """
+    Composes readings from the card database without a language model
+    """
+
+    def __init__(self, cards, combinations=None):
+        """
+        Prepare the text for every card in both orientations
+
+        Args:
+            cards (Mapping): Card data indexed by card name (CardStore.cards)
+            combinations (CombinationIndex): Suggested combinations
+                Default is built from the cards
+        """
+        self.entries = {
+            (name, is_reversed): CardEntry(card, is_reversed)
+            for name, card in cards.items()
+            for is_reversed in (False, True)
+        }
+        self.combinations = combinations or CombinationIndex.from_cards(cards.values())
+
+    def compose(self, cards_data, focus=None):
+        """
+        Compose a reading for a spread
+
+        Args:
+            cards_data (list): Cards with name, position and isReversed
+            focus (str): Meaning domain to concentrate on (a DOMAIN_LABELS key)
+                Default covers love, career and health
+
+        Returns:
+            str or None: The reading, or None if no card in the spread is known
+        """
+        drawn, positions = [], []
+        for card in cards_data:
+            entry = self.entries.get((card.get('name'), bool(card.get('isReversed', False))))
+            if entry is not None:
+                drawn.append(entry)
+                positions.append(card.get('position'))
+        if not drawn:
+            return None
+
+        # Stable across processes, unlike hash()
+        seed = zlib.crc32('|'.join(f"{entry.name}:{entry.status}" for entry in drawn).encode('utf-8'))
+
+        paragraphs = [OPENINGS[seed % len(OPENINGS)]]
+
+        lines = []
+        for entry, position in zip(drawn, positions):
+            where = f"ในตำแหน่ง '{position}' " if position else ""
+            lines.append(f"{where}ไพ่ {entry.name} ({entry.status}) บ่งบอกว่า {entry.meaning}")
+        paragraphs.append("\n".join(lines))
+
+        matches = self.combinations.find(cards_data)[:MAX_COMBINATIONS]
+        if matches:
+            paragraphs.append("\n".join(
+                f"ไพ่ {match['cards'][0]} และ {match['cards'][1]} ที่ปรากฏคู่กันบ่งบอกถึง {excerpt(match['meanings'][0])}"
+                for match in matches
+            ))
+
+        domains = (focus,) if focus in DOMAIN_LABELS else DEFAULT_DOMAINS
+        lines = []
+        for offset, domain in enumerate(domains):
+            entry = drawn[(seed + offset) % len(drawn)]
+            if domain in entry.domains:
+                lines.append(f"{DOMAIN_LABELS[domain]} ไพ่ {entry.name} บอกว่า {entry.domains[domain]}")
+        if lines:
+            paragraphs.append("\n".join(lines))
+
+        # Advice from the last card of the spread, usually the outcome
+        outcome = drawn[-1]
+        advice = []
+        if outcome.quotes:
+            advice.append(f"ไพ่ {outcome.name} ฝากข้อคิดไว้ว่า \"{outcome.quotes[seed % len(outcome.quotes)]}\"")
+        if outcome.prompts:
+            advice.append(f"ลองถามตัวเองดูนะคะว่า {outcome.prompts[seed % len(outcome.prompts)]}")
+        advice.append(CLOSINGS[seed % len(CLOSINGS)])
+        paragraphs.append(" ".join(advice))
+
+        return "\n\n".join(paragraphs)
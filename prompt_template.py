@@ -0,0 +1,332 @@
+"""
+Tarot Prompt Template
+
+This module builds the Gemini prompt for a spread from precompiled parts.
+The static preamble and postamble are module constants, and the text for each
+(card, orientation) pair is rendered once when the template is built. A
+prompt is then assembled with a single join.
+
+The static instructions can also be sent to the model as a system
+instruction, so only the drawn cards change from request to request.
+
+A reading can focus on one meaning section (love, career, health, ...). The
+cards are then described with that section's meanings instead of the
+general ones, which are also much longer, and the model is asked to
+concentrate on it. The text for a section is rendered the first time a
+reading asks for it.
+
+Prompts can be kept under a token budget (see token_budget.py). When a
+spread's prompt would go over it, every card's meaning is shortened to an
+equal share of the tokens left by the rest of the prompt, and if that is not
+enough, the last suggested combinations are left out. Shortened card texts
+are cached per share, in steps of MEANING_TOKEN_STEP tokens.
+"""
+
+import hashlib
+import threading
+from token_budget import estimate_tokens, truncate_to_tokens, PROMPT_MIN_MEANING_TOKENS
+
+# Bump when the wording of the template changes so prompt hashes change too
+TEMPLATE_VERSION = 1
+
+PROMPT_PREAMBLE = """
+        คุณคือหมอดูไพ่ทาโร่ที่มีประสบการณ์สูง พูดจาด้วยน้ำเสียงลึกลับ มีความรู้เรื่องโหราศาสตร์และไพ่ทาโร่อย่างลึกซึ้ง
+        ใช้คำพูดแบบหมอดูไทย เช่น "ดวงของคุณ..." "ไพ่บ่งบอกว่า..." "พลังงานที่ส่งมา..." "ดวงดาวกำลังบอกว่า..."
+
+        ห้ามพูดถึงเรื่องเบื้องหลังหรือ Backend หรือการรอข้อมูล หรือการประมวลผล ให้พูดเหมือนหมอดูจริงๆ ที่มีความรู้เรื่องไพ่ทาโร่อย่างลึกซึ้ง
+
+        โปรดวิเคราะห์ไพ่ทาโร่ต่อไปนี้และให้คำทำนายโดยรวมที่เชื่อมโยงความหมายของไพ่ทั้งหมดเข้าด้วยกัน
+        ใช้ภาษาไทยในการตอบและพยายามให้คำทำนายที่มีความหวังและเป็นประโยชน์ต่อผู้ถาม
+
+        ไพ่ที่ถูกเปิดในการทำนายครั้งนี้:
+        """
+
+PROMPT_POSTAMBLE = """
+
+        โปรดสรุปคำทำนายทั้งหมดในรูปแบบของหมอดูไทย โดยเชื่อมโยงความหมายของไพ่แต่ละใบเข้าด้วยกัน
+        และให้คำแนะนำที่เป็นประโยชน์แก่ผู้ถาม ความยาวประมาณ 3-4 ย่อหน้า
+
+        ห้ามพูดถึงเรื่องเบื้องหลังหรือ Backend หรือการรอข้อมูล หรือการประมวลผล ให้พูดเหมือนหมอดูจริงๆ ที่มีความรู้เรื่องไพ่ทาโร่อย่างลึกซึ้ง
+
+        เริ่มต้นด้วยคำทักทายแบบหมอดู และจบด้วยคำแนะนำหรือกำลังใจ
+        """
+
+# Opening line of the per-request prompt when the instructions are sent separately
+CARDS_HEADER = "ไพ่ที่ถูกเปิดในการทำนายครั้งนี้:"
+
+# Introduces the suggested combinations found among the drawn cards
+COMBINATIONS_HEADER = "\n\n        ไพ่ที่ปรากฏคู่กันและความหมายร่วม:"
+
+# Static instructions sent as a system instruction when the client supports it
+SYSTEM_INSTRUCTION = PROMPT_PREAMBLE.replace(CARDS_HEADER, "") + PROMPT_POSTAMBLE
+
+# How each focused meaning section is named in the prompt
+FOCUS_LABELS = {
+    'relationships_love': "ความรักและความสัมพันธ์",
+    'career_work_finances': "การงานและการเงิน",
+    'well_being_health': "สุขภาพ",
+    'spirituality': "จิตวิญญาณ",
+    'personality_types': "บุคลิกภาพ",
+}
+
+# Asks the model to concentrate on the focus, after the cards
+FOCUS_INSTRUCTION = "\n\n        ผู้ถามต้องการทราบเรื่อง{label}เป็นพิเศษ โปรดเน้นคำทำนายในด้านนี้"
+
+# Shortened meanings are cut to a multiple of this many tokens, so a handful
+# of variants of each card's text cover every spread
+MEANING_TOKEN_STEP = 25
+
+
+def _render_card(name, is_reversed, meaning, keywords, label=None):
+    """
+    Render the lines describing one card, after its position
+
+    Args:
+        name (str): Card name
+        is_reversed (bool): Whether the card is reversed
+        meaning (str): Meaning of the card in this orientation
+        keywords (str): Keywords of the card in this orientation, or None
+        label (str): Name of the meaning section, or None for the general meaning
+
+    Returns:
+        str: The card's text in the prompt
+    """
+    card_status = "กลับหัว" if is_reversed else "หงายขึ้น"
+    heading = f"ความหมายด้าน{label}" if label else "ความหมาย"
+    text = f"ไพ่ {name} ({card_status})\n  {heading}: {meaning}"
+    if keywords is not None:
+        text += f"\n  คำสำคัญ: {keywords}"
+    return text
+
+
+def _render_combination(match):
+    """
+    Render one suggested combination found in the spread
+
+    Args:
+        match (dict): Match from CombinationIndex.find
+
+    Returns:
+        str: The combination's line in the prompt
+    """
+    cards = " และ ".join(
+        f"ไพ่ {name} ({'กลับหัว' if is_reversed else 'หงายขึ้น'})"
+        for name, is_reversed in zip(match['cards'], match['reversed'])
+    )
+    return f"\n- {cards}: {' / '.join(match['meanings'])}"
+
+
+def prompt_hash(prompt):
+    """
+    Return a stable hash identifying a prompt
+
+    Args:
+        prompt (str): The prompt text
+
+    Returns:
+        str: Hex SHA-256 digest of the template version and prompt
+    """
+    return hashlib.sha256(f"{TEMPLATE_VERSION}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+class PromptTemplate:
+    """
+    Precompiled prompt template for one card table
+    """
+
+    def __init__(self, card_table, include_instructions=True):
+        """
+        Render the text for every card in both orientations
+
+        Args:
+            card_table (CardTable): Compiled card meanings and keywords
+            include_instructions (bool): Whether prompts include the preamble
+                and postamble. Set to False when they are sent to the model
+                as a system instruction instead.
+        """
+        self.card_table = card_table
+        self.include_instructions = include_instructions
+        self.fragments = self._render_section('general')
+        self._sections = {'general': self.fragments}
+        self._meaning_tokens = {}
+        self._lock = threading.Lock()
+        # Tokens of the system instruction sent alongside prompts without it
+        self.instruction_tokens = 0 if include_instructions else estimate_tokens(SYSTEM_INSTRUCTION)
+        self.truncated = {"meanings": 0, "combinations": 0}
+
+    def _render_section(self, section, meaning_tokens=None):
+        """
+        Render the text for every card in both orientations for one section
+
+        Args:
+            section (str): Meaning section (see card_table.MEANING_SECTIONS)
+            meaning_tokens (int): Shorten each meaning to this many tokens
+                Default keeps the meanings whole
+
+        Returns:
+            list: Card texts indexed by card_id * 2 + is_reversed
+        """
+        table = self.card_table
+        meanings = table.section_meanings(section)
+        if meaning_tokens is not None:
+            meanings = [truncate_to_tokens(meaning, meaning_tokens) for meaning in meanings]
+        label = FOCUS_LABELS.get(section)
+        return [
+            _render_card(name, is_reversed, meanings[card_id * 2 + is_reversed],
+                         table.keywords[card_id * 2 + is_reversed], label)
+            for card_id, name in enumerate(table.names)
+            for is_reversed in (0, 1)
+        ]
+
+    def section_fragments(self, section, meaning_tokens=None):
+        """
+        Return the card texts for a section, rendering them on first use
+
+        Args:
+            section (str): Meaning section (see card_table.MEANING_SECTIONS)
+            meaning_tokens (int): Shorten each meaning to this many tokens
+                Default keeps the meanings whole
+
+        Returns:
+            list: Card texts indexed by card_id * 2 + is_reversed
+        """
+        key = section if meaning_tokens is None else (section, meaning_tokens)
+        fragments = self._sections.get(key)
+        if fragments is None:
+            with self._lock:
+                fragments = self._sections.get(key)
+                if fragments is None:
+                    fragments = self._sections[key] = self._render_section(section, meaning_tokens)
+        return fragments
+
+    def meaning_tokens(self, section):
+        """
+        Return the estimated token count of every meaning in a section
+
+        Args:
+            section (str): Meaning section (see card_table.MEANING_SECTIONS)
+
+        Returns:
+            list: Token counts indexed by card_id * 2 + is_reversed
+        """
+        tokens = self._meaning_tokens.get(section)
+        if tokens is None:
+            tokens = [estimate_tokens(meaning) for meaning in self.card_table.section_meanings(section)]
+            self._meaning_tokens[section] = tokens
+        return tokens
+
+    def input_tokens(self, prompt):
+        """
+        Estimate the input tokens of a model call with this prompt
+
+        Args:
+            prompt (str): A prompt from render
+
+        Returns:
+            int: Estimated tokens of the prompt and the system instruction
+        """
+        return self.instruction_tokens + estimate_tokens(prompt)
+
+    def _fragment_index(self, card):
+        """Index of a drawn card in the section fragments, or None for an unknown card"""
+        card_id = self.card_table.card_id(card.get('name'))
+        if card_id is None:
+            return None
+        return card_id * 2 + bool(card.get("isReversed"))
+
+    def card_fragment(self, card, section='general'):
+        """
+        Return the prompt text for one drawn card, after its position
+
+        Args:
+            card (dict): Card information (name, isReversed, meaning)
+            section (str): Meaning section the reading focuses on
+
+        Returns:
+            str: The card's text in the prompt
+        """
+        return self._card_text(card, self.section_fragments(section))
+
+    def _card_text(self, card, fragments):
+        """Text of one drawn card from a list of section fragments"""
+        index = self._fragment_index(card)
+        if index is None:
+            # Unknown card: render it on the fly
+            return _render_card(card.get('name'), card.get("isReversed"), card.get('meaning'), None)
+        return fragments[index]
+
+    def render(self, cards_data, combinations=None, section='general', budget=None):
+        """
+        Assemble the prompt for a spread
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            combinations (list): Suggested combinations found in the spread
+                (from CombinationIndex.find), listed after the cards
+            section (str): Meaning section the reading focuses on
+                Default is the general meaning with no focus
+            budget (int): Most input tokens (see input_tokens). Card meanings
+                are shortened, then combinations dropped, to fit.
+                Default is no limit
+
+        Returns:
+            str: The prompt
+        """
+        combinations = [_render_combination(match) for match in combinations or ()]
+        prompt = self._assemble(cards_data, combinations, section, self.section_fragments(section))
+        # No character costs more than a third of a token, so most prompts
+        # are known to fit without counting
+        if not budget or self.instruction_tokens + len(prompt) // 3 + 2 <= budget:
+            return prompt
+        tokens = self.input_tokens(prompt)
+        if tokens <= budget:
+            return prompt
+
+        # Give every known card an equal share of the tokens the rest leaves
+        meaning_tokens = self.meaning_tokens(section)
+        indexes = [index for index in map(self._fragment_index, cards_data) if index is not None]
+        if indexes:
+            rest = tokens - sum(meaning_tokens[index] for index in indexes)
+            share = (budget - rest) // len(indexes)
+            share = max(PROMPT_MIN_MEANING_TOKENS, share - share % MEANING_TOKEN_STEP)
+            fragments = self.section_fragments(section, share)
+            prompt = self._assemble(cards_data, combinations, section, fragments)
+            tokens = self.input_tokens(prompt)
+            self.truncated["meanings"] += 1
+        else:
+            fragments = self.section_fragments(section)
+
+        # Still too long: leave out combinations from the end
+        if tokens > budget and combinations:
+            excess = tokens - budget
+            while combinations and excess > 0:
+                excess -= estimate_tokens(combinations.pop())
+            prompt = self._assemble(cards_data, combinations, section, fragments)
+            self.truncated["combinations"] += 1
+        return prompt
+
+    def _assemble(self, cards_data, combinations, section, fragments):
+        """
+        Join the parts of a prompt
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            combinations (list): Rendered combination lines
+            section (str): Meaning section the reading focuses on
+            fragments (list): Card texts of the section
+
+        Returns:
+            str: The prompt
+        """
+        parts = [PROMPT_PREAMBLE if self.include_instructions else CARDS_HEADER]
+        for card in cards_data:
+            parts.append(f"\n- ตำแหน่ง '{card.get('position')}': ")
+            parts.append(self._card_text(card, fragments))
+        if combinations:
+            parts.append(COMBINATIONS_HEADER)
+            parts.extend(combinations)
+        if section in FOCUS_LABELS:
+            parts.append(FOCUS_INSTRUCTION.format(label=FOCUS_LABELS[section]))
+        if self.include_instructions:
+            parts.append(PROMPT_POSTAMBLE)
+        return ''.join(parts)
@@ -0,0 +1,384 @@
+"""
+Tarot Reading Cache
+
+This module caches generated readings so that a spread which was read recently
+does not need another call to the Gemini API. Entries are keyed on a canonical
+hash of the prompt inputs and are evicted by age (TTL) and by least recent use
+(LRU). Several readings can be kept for the same key so repeat visitors get a
+different wording instead of the exact same text.
+
+Two backends are available:
+- MemoryBackend: a per-process dictionary, fastest but not shared
+- SqliteBackend: an on-disk database shared by all worker processes
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from data_dir import data_path, ensure_parent
+
+logger = logging.getLogger('tarot_bot')
+
+# Default cache settings, overridable through environment variables
+DEFAULT_TTL = 6 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_VARIANTS = 3
+DEFAULT_SQLITE_PATH = data_path('reading_cache.sqlite3')
+
+
+def make_cache_key(*parts):
+    """
+    Build a canonical cache key from the inputs of a reading
+
+    Args:
+        *parts: JSON-serialisable values that fully determine the prompt
+            (e.g. model name and prompt text)
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical JSON encoding
+    """
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process LRU cache with TTL expiry
+    """
+
+    # Calls return without waiting on the disk or other processes
+    blocking = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        """
+        Args:
+            max_entries (int): Maximum number of keys kept before LRU eviction
+            ttl (float): Seconds an entry stays valid after it was created
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached variants for a key
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            list: Cached readings for the key (empty if missing or expired)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return []
+
+            created_at, variants = entry
+            if time.time() - created_at > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                return []
+
+            self._entries.move_to_end(key)
+            return list(variants)
+
+    def add(self, key, value, max_variants):
+        """
+        Store another variant for a key
+
+        Args:
+            key (str): Cache key
+            value (str): Reading text
+            max_variants (int): Maximum number of variants kept per key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = (time.time(), [value])
+            elif len(entry[1]) < max_variants and value not in entry[1]:
+                entry[1].append(value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """
+    On-disk LRU cache with TTL expiry, shared between worker processes
+    """
+
+    # Calls can wait up to the busy timeout for another worker's write lock
+    blocking = True
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            max_entries (int): Maximum number of keys kept before LRU eviction
+            ttl (float): Seconds an entry stays valid after it was created
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                " key TEXT NOT NULL,"
+                " variant INTEGER NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (key, variant))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS readings_accessed ON readings (accessed_at)")
+
+    def _connect(self):
+        """
+        Return this thread's connection, opening it on first use
+
+        Returns:
+            sqlite3.Connection: Connection to the cache database
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            ensure_parent(self.path)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Return the cached variants for a key
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            list: Cached readings for the key (empty if missing or expired)
+        """
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM readings WHERE key = ? AND created_at < ?",
+                (key, now - self.ttl)
+            ).rowcount
+            if expired:
+                self.evictions += 1
+                return []
+
+            rows = conn.execute(
+                "SELECT value FROM readings WHERE key = ? ORDER BY variant",
+                (key,)
+            ).fetchall()
+            if rows:
+                conn.execute("UPDATE readings SET accessed_at = ? WHERE key = ?", (now, key))
+        return [row[0] for row in rows]
+
+    def add(self, key, value, max_variants):
+        """
+        Store another variant for a key
+
+        Args:
+            key (str): Cache key
+            value (str): Reading text
+            max_variants (int): Maximum number of variants kept per key
+        """
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            rows = conn.execute(
+                "SELECT variant, value, created_at FROM readings WHERE key = ?",
+                (key,)
+            ).fetchall()
+            if len(rows) >= max_variants or any(row[1] == value for row in rows):
+                return
+
+            created_at = rows[0][2] if rows else now
+            conn.execute(
+                "INSERT OR IGNORE INTO readings (key, variant, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, len(rows), value, created_at, now)
+            )
+
+            if not rows:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """
+        Drop expired keys and the least recently used keys over the size limit
+
+        Args:
+            conn (sqlite3.Connection): Open connection inside a transaction
+            now (float): Current time
+        """
+        expired = conn.execute(
+            "SELECT COUNT(DISTINCT key) FROM readings WHERE created_at < ?",
+            (now - self.ttl,)
+        ).fetchone()[0]
+        if expired:
+            conn.execute("DELETE FROM readings WHERE created_at < ?", (now - self.ttl,))
+            self.evictions += expired
+
+        overflow = conn.execute("SELECT COUNT(DISTINCT key) FROM readings").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM readings WHERE key IN ("
+                " SELECT key FROM readings GROUP BY key ORDER BY MAX(accessed_at) LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        """Remove every entry"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM readings")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(DISTINCT key) FROM readings").fetchone()[0]
+
+
+class ReadingCache:
+    """
+    Reading cache with hit/miss/eviction counters and multiple variants per key
+    """
+
+    def __init__(self, backend, variants=DEFAULT_VARIANTS):
+        """
+        Args:
+            backend: MemoryBackend or SqliteBackend instance
+            variants (int): Number of distinct readings to collect per key
+                before cached readings are served. With 1 the first reading
+                is always reused; with more, a miss is reported until that
+                many readings have been generated for the spread.
+        """
+        self.backend = backend
+        self.variants = max(1, variants)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def blocking(self):
+        """bool: Whether calls can wait on the disk, so async callers run them on a thread"""
+        return self.backend.blocking
+
+    def get(self, key):
+        """
+        Return a cached reading for a key
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str or None: One of the cached variants, or None on a miss
+        """
+        variants = self.backend.get(key)
+        if len(variants) < self.variants:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return random.choice(variants)
+
+    def get_any(self, key):
+        """
+        Return any cached reading for a key, even before all variants exist
+
+        Used as a fallback when the model is unavailable. Not counted as a hit.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str or None: One of the cached variants, or None if there are none
+        """
+        variants = self.backend.get(key)
+        return random.choice(variants) if variants else None
+
+    def put(self, key, value):
+        """
+        Store a freshly generated reading
+
+        Args:
+            key (str): Cache key
+            value (str): Reading text
+        """
+        if value:
+            self.backend.add(key, value, self.variants)
+
+    def clear(self):
+        """Remove every cached reading"""
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Report cache counters
+
+        Returns:
+            dict: Backend name, entries, hits, misses and evictions
+        """
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "variants": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+        }
+
+
+def create_reading_cache():
+    """
+    Build the reading cache configured through environment variables
+
+    READING_CACHE_BACKEND: "memory" (default), "sqlite" or "none"
+    READING_CACHE_PATH: SQLite file used by the sqlite backend (default
+        reading_cache.sqlite3 in the data directory, see data_dir.py)
+    READING_CACHE_TTL: Entry lifetime in seconds
+    READING_CACHE_SIZE: Maximum number of cached spreads
+    READING_CACHE_VARIANTS: Readings collected per spread before reuse
+
+    Returns:
+        ReadingCache or None: The cache, or None if caching is disabled
+    """
+    backend_name = os.getenv("READING_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("READING_CACHE_TTL", DEFAULT_TTL))
+    max_entries = int(os.getenv("READING_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    variants = int(os.getenv("READING_CACHE_VARIANTS", DEFAULT_VARIANTS))
+
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        path = os.getenv("READING_CACHE_PATH", DEFAULT_SQLITE_PATH)
+        backend = SqliteBackend(path, max_entries=max_entries, ttl=ttl)
+    else:
+        backend = MemoryBackend(max_entries=max_entries, ttl=ttl)
+
+    logger.info(f"Reading cache enabled ({backend_name}, ttl={ttl:.0f}s, size={max_entries}, variants={variants})")
+    return ReadingCache(backend, variants=variants)
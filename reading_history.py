@@ -0,0 +1,376 @@
+"""
+Reading History Store
+
+Keeps the readings served to visitors in an append-only SQLite database, so
+"show my last reading" and repeat visits are answered from disk instead of
+another model call. Readings are indexed on the visitor's session (the
+X-Session-ID header) and on a hash of the spread, its focus included.
+
+Writes never wait on the disk: record() appends the reading to an in-memory
+buffer and returns, and a background thread commits the buffer in one
+transaction every READING_HISTORY_FLUSH_INTERVAL seconds. Readings still in
+the buffer are included in recent(). If the buffer fills up (the disk is
+stalled), new readings are dropped and counted rather than slowing down
+responses.
+
+The store stays bounded: every READING_HISTORY_COMPACT_INTERVAL seconds the
+writer deletes readings past the retention period and the oldest beyond the
+row limit, returns the freed pages to the file system (incremental vacuum)
+and truncates the write-ahead log. Several worker processes can share one
+database file.
+
+Settings (environment variables):
+    READING_HISTORY: "0" turns the history off (default "1")
+    READING_HISTORY_PATH: SQLite file (default reading_history.sqlite3 in the
+        data directory, see data_dir.py)
+    READING_HISTORY_RETENTION_DAYS: Days a reading is kept (default 30)
+    READING_HISTORY_MAX_ROWS: Most readings kept (default 20000)
+    READING_HISTORY_FLUSH_INTERVAL: Seconds between batched writes (default 0.5)
+    READING_HISTORY_MAX_PENDING: Readings buffered before new ones are dropped (default 10000)
+    READING_HISTORY_COMPACT_INTERVAL: Seconds between compactions (default 3600)
+"""
+
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+from data_dir import data_path, ensure_parent
+from reading_cache import make_cache_key
+
+logger = logging.getLogger('tarot_bot')
+
+DEFAULT_PATH = data_path('reading_history.sqlite3')
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_MAX_ROWS = 20000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_PENDING = 10000
+DEFAULT_COMPACT_INTERVAL = 3600
+
+# Longest session ID stored
+MAX_SESSION_LENGTH = 128
+
+# Most readings returned by recent()
+MAX_RECENT = 50
+
+_COLUMNS = "session, spread_hash, focus, cards, reading, created_at"
+
+
+def clean_session(session):
+    """
+    Accept a client's session ID if it is printable, shortening long ones
+
+    Args:
+        session (str): X-Session-ID header, or None
+
+    Returns:
+        str or None: The session ID to store, or None
+    """
+    if not session or not session.isprintable():
+        return None
+    return session[:MAX_SESSION_LENGTH]
+
+
+def spread_hash(cards_data, section='general'):
+    """
+    Hash a spread by its cards, positions, orientations and focus
+
+    Args:
+        cards_data (list): List of dictionaries containing card information
+        section (str): Meaning section the reading focused on
+
+    Returns:
+        str: Hex digest shared by identical spreads with the same focus
+    """
+    return make_cache_key(section, [
+        (card.get('name'), card.get('position'), bool(card.get('isReversed', False)))
+        for card in cards_data if isinstance(card, dict)
+    ])
+
+
+def _entry(row):
+    """Turn a stored row into the dictionary returned by recent()"""
+    session, digest, focus, cards, reading, created_at = row
+    return {"spread_hash": digest, "focus": focus, "cards": json.loads(cards),
+            "reading": reading, "created_at": created_at}
+
+
+class ReadingHistory:
+    """
+    Append-only reading store with batched background writes
+    """
+
+    def __init__(self, path=DEFAULT_PATH, retention_days=DEFAULT_RETENTION_DAYS, max_rows=DEFAULT_MAX_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_pending=DEFAULT_MAX_PENDING,
+                 compact_interval=DEFAULT_COMPACT_INTERVAL):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            retention_days (float): Days a reading is kept
+            max_rows (int): Most readings kept
+            flush_interval (float): Seconds between batched writes
+            max_pending (int): Readings buffered before new ones are dropped
+            compact_interval (float): Seconds between compactions
+        """
+        self.path = path
+        self.retention = retention_days * 24 * 60 * 60
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.compact_interval = compact_interval
+        self.written = 0
+        self.dropped = 0
+        self.compactions = 0
+        self._pending = []
+        # Batch taken from the buffer that the writer is committing
+        self._writing = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        self._closed = False
+        self._next_compaction = time.monotonic() + compact_interval
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                " id INTEGER PRIMARY KEY,"
+                " session TEXT,"
+                " spread_hash TEXT NOT NULL,"
+                " focus TEXT NOT NULL,"
+                " cards TEXT NOT NULL,"
+                " reading TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS history_session ON history (session, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_spread ON history (spread_hash, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_created ON history (created_at)")
+
+    def _connect(self):
+        """
+        Return this thread's connection, opening it on first use
+
+        Returns:
+            sqlite3.Connection: Connection to the history database
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            ensure_parent(self.path)
+            conn = sqlite3.connect(self.path, timeout=5)
+            # Only takes effect on a new database, before the first table
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, session, cards_data, section, reading):
+        """
+        Queue a served reading to be stored, without waiting for the disk
+
+        Args:
+            session (str): Session ID of the visitor, or None
+            cards_data (list): List of dictionaries containing card information
+            section (str): Meaning section the reading focused on
+            reading (str): The reading
+
+        Returns:
+            bool: False if the reading was dropped because the buffer is full
+        """
+        cards = [
+            {"name": card.get('name'), "position": card.get('position'),
+             "isReversed": bool(card.get('isReversed', False))}
+            for card in cards_data if isinstance(card, dict)
+        ]
+        row = (clean_session(session), spread_hash(cards_data, section), section,
+               json.dumps(cards, ensure_ascii=False), reading, time.time())
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(row)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='reading-history', daemon=True)
+                self._thread.start()
+        return True
+
+    def _run(self):
+        """Writer thread: commit the buffer every flush interval"""
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+                if time.monotonic() >= self._next_compaction:
+                    self.compact()
+            except sqlite3.Error as e:
+                logger.warning(f"Reading history write failed: {type(e).__name__}: {e}")
+            if closed:
+                return
+
+    def flush(self):
+        """
+        Commit every buffered reading now
+
+        Returns:
+            int: Readings written
+        """
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                self._writing = batch
+            if not batch:
+                return 0
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(f"INSERT INTO history ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", batch)
+                self.written += len(batch)
+            except sqlite3.Error:
+                # Keep the batch for the next attempt, unless the buffer is full
+                with self._cond:
+                    self._pending = batch[:max(0, self.max_pending - len(self._pending))] + self._pending
+                raise
+            finally:
+                with self._cond:
+                    self._writing = []
+            return len(batch)
+
+    def _unwritten(self):
+        """Readings not committed yet, oldest first"""
+        with self._cond:
+            return self._writing + self._pending
+
+    def recent(self, session, limit=10):
+        """
+        Return a visitor's most recent readings, newest first
+
+        Args:
+            session (str): Session ID of the visitor
+            limit (int): Most readings returned (capped at MAX_RECENT)
+
+        Returns:
+            list: Dictionaries with spread_hash, focus, cards, reading and created_at
+        """
+        session = clean_session(session)
+        if session is None:
+            return []
+        limit = max(1, min(int(limit), MAX_RECENT))
+        rows = self._connect().execute(
+            f"SELECT {_COLUMNS} FROM history WHERE session = ? ORDER BY created_at DESC LIMIT ?",
+            (session, limit)
+        ).fetchall()
+        # A batch may be committed between the query and this look at the
+        # buffer, so readings are matched on their hash and time
+        seen = {(row[1], row[5]) for row in rows}
+        rows += [row for row in self._unwritten() if row[0] == session and (row[1], row[5]) not in seen]
+        rows.sort(key=lambda row: row[5], reverse=True)
+        return [_entry(row) for row in rows[:limit]]
+
+    def latest(self, digest):
+        """
+        Return the most recent reading of a spread
+
+        Args:
+            digest (str): Value of spread_hash for the spread and focus
+
+        Returns:
+            str or None: The reading, or None if the spread was never read
+        """
+        for row in reversed(self._unwritten()):
+            if row[1] == digest:
+                return row[4]
+        row = self._connect().execute(
+            "SELECT reading FROM history WHERE spread_hash = ? ORDER BY created_at DESC LIMIT 1", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def compact(self):
+        """
+        Delete readings past the retention period or the row limit and
+        return the freed space to the file system
+
+        Returns:
+            int: Readings deleted
+        """
+        with self._write_lock:
+            self._next_compaction = time.monotonic() + self.compact_interval
+            conn = self._connect()
+            with conn:
+                deleted = conn.execute("DELETE FROM history WHERE created_at < ?",
+                                       (time.time() - self.retention,)).rowcount
+                deleted += conn.execute(
+                    "DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.max_rows,)
+                ).rowcount
+            if deleted:
+                conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.compactions += 1
+        if deleted:
+            logger.info(f"Reading history compacted: {deleted} readings removed")
+        return deleted
+
+    def close(self):
+        """Stop the writer thread and commit what is still buffered"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            logger.warning(f"Reading history lost {len(self._pending)} readings: {type(e).__name__}: {e}")
+
+    def stats(self):
+        """
+        Report the store's counters
+
+        Returns:
+            dict: Path, buffered, written, dropped, compactions and file size in bytes
+        """
+        size = 0
+        for suffix in ('', '-wal'):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "path": self.path,
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "compactions": self.compactions,
+            "file_bytes": size,
+        }
+
+
+def create_reading_history():
+    """
+    Build the reading history configured through environment variables
+
+    Returns:
+        ReadingHistory or None: The store, or None if history is turned off
+    """
+    if os.getenv("READING_HISTORY", "1") == "0":
+        return None
+    history = ReadingHistory(
+        path=os.getenv("READING_HISTORY_PATH", DEFAULT_PATH),
+        retention_days=float(os.getenv("READING_HISTORY_RETENTION_DAYS", DEFAULT_RETENTION_DAYS)),
+        max_rows=int(os.getenv("READING_HISTORY_MAX_ROWS", DEFAULT_MAX_ROWS)),
+        flush_interval=float(os.getenv("READING_HISTORY_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+        max_pending=int(os.getenv("READING_HISTORY_MAX_PENDING", DEFAULT_MAX_PENDING)),
+        compact_interval=float(os.getenv("READING_HISTORY_COMPACT_INTERVAL", DEFAULT_COMPACT_INTERVAL)),
+    )
+    atexit.register(history.close)
+    logger.info(f"Reading history enabled ({history.path}, {history.retention / 86400:g} days, "
+                f"{history.max_rows} readings)")
+    return history
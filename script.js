@@ -5,6 +5,16 @@
 
 // Application state
 let tarotData = [];
+
+// Full card data fetched on demand, keyed by shard URL
+const cardDetailCache = new Map();
+
+// Modern image formats offered through <picture>, in order of preference
+const IMAGE_SOURCE_FORMATS = ['avif', 'webp'];
+
+// Rendered card image widths, for the sizes attribute of responsive images
+const SPREAD_IMAGE_SIZES = '(min-width: 768px) 130px, 110px';
+const DETAIL_IMAGE_SIZES = '180px';
 let isDrawing = false;
 let soundEnabled = true;
 
@@ -121,7 +131,97 @@ function cacheElements() {
 }
 
 /**
- * Load tarot card data from JSON file
+ * Fetch the card index, falling back to the full JSON file if it has not been built
+ * The index (cards/index.json) holds names, keywords and image paths only;
+ * the rest of each card is fetched on demand with fetchCardDetails
+ * @returns {Promise<Array>} - Card list
+ */
+function fetchCardIndex() {
+  return fetch('cards/index.json')
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`HTTP error! Status: ${response.status}`);
+      }
+      return response.json();
+    })
+    .catch(() => fetch('newtarot.json').then(response => {
+      if (!response.ok) {
+        throw new Error(`HTTP error! Status: ${response.status}`);
+      }
+      return response.json();
+    }));
+}
+
+/**
+ * Fetch the full data of a card from its shard
+ * @param {Object} card - Card from the index
+ * @returns {Promise<Object>} - The card with all of its details
+ */
+function fetchCardDetails(card) {
+  if (!card.detail) {
+    return Promise.resolve(card);
+  }
+
+  if (!cardDetailCache.has(card.detail)) {
+    const request = fetch(card.detail)
+      .then(response => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+        return response.json();
+      })
+      .then(details => ({ ...card, ...details }))
+      .catch(error => {
+        // Allow a later retry
+        cardDetailCache.delete(card.detail);
+        throw error;
+      });
+    cardDetailCache.set(card.detail, request);
+  }
+  return cardDetailCache.get(card.detail);
+}
+
+/**
+ * Point an image at the resized variants of a card image
+ * The <source> elements of an enclosing <picture> offer AVIF and WebP; the
+ * image itself falls back to JPEG. Without variants the plain src is used.
+ * @param {HTMLImageElement} img - The image element
+ * @param {Object} images - Variants from the card index ({width, height, srcset})
+ * @param {string} sizes - Rendered width of the image, for the sizes attribute
+ */
+function setImageSources(img, images, sizes) {
+  const picture = img.parentNode && img.parentNode.tagName === 'PICTURE' ? img.parentNode : null;
+  if (picture) {
+    picture.querySelectorAll('source').forEach(source => source.remove());
+  }
+
+  if (!images || !images.srcset) {
+    img.removeAttribute('srcset');
+    img.removeAttribute('sizes');
+    return;
+  }
+
+  if (picture) {
+    IMAGE_SOURCE_FORMATS.forEach(format => {
+      if (!images.srcset[format]) return;
+      const source = document.createElement('source');
+      source.type = `image/${format}`;
+      source.srcset = images.srcset[format];
+      source.sizes = sizes;
+      picture.insertBefore(source, img);
+    });
+  }
+
+  img.sizes = sizes;
+  if (images.srcset.jpeg) {
+    img.srcset = images.srcset.jpeg;
+  } else {
+    img.removeAttribute('srcset');
+  }
+}
+
+/**
+ * Load tarot card data
  */
 function loadTarotData() {
   document.body.classList.add('loading');
@@ -147,13 +247,7 @@ function loadTarotData() {
     }
   }
 
-  fetch('newtarot.json')
-    .then(response => {
-      if (!response.ok) {
-        throw new Error(`HTTP error! Status: ${response.status}`);
-      }
-      return response.json();
-    })
+  fetchCardIndex()
     .then(data => {
       tarotData = data;
 
@@ -261,12 +355,24 @@ function resetReading() {
 function showCardDetails(card, isReversed, _meaning, imageSrc, positionLabel) {
   if (!domElements.detailPanel) return;
 
+  // Cards from the index need their details fetched first
+  if (card.detail && !card.description) {
+    fetchCardDetails(card)
+      .then(details => showCardDetails(details, isReversed, _meaning, imageSrc, positionLabel))
+      .catch(error => {
+        console.error('Error loading card details:', error);
+        showError('Error loading card details. Please try again.');
+      });
+    return;
+  }
+
   // Update the panel content
   if (domElements.cardName) {
     domElements.cardName.textContent = `${card.name} ${isReversed ? "(Reversed)" : ""} - ${positionLabel}`;
   }
 
   if (domElements.cardImage) {
+    setImageSources(domElements.cardImage, card.images, DETAIL_IMAGE_SIZES);
     domElements.cardImage.src = imageSrc;
     domElements.cardImage.alt = card.name;
     domElements.cardImage.className = isReversed ? 'detail-card-image reversed' : 'detail-card-image';
@@ -274,6 +380,7 @@ function showCardDetails(card, isReversed, _meaning, imageSrc, positionLabel) {
     // Handle error for image loading
     domElements.cardImage.onerror = function() {
       this.onerror = null;
+      setImageSources(this, null);
       // Create a fallback SVG image if the card image fails to load
       this.src = createFallbackCardImage(card.name);
     };
@@ -941,12 +1048,15 @@ function drawCards() {
     // Get card data
     const card = selectedCards[index];
     const isReversed = Math.random() < 0.5;
-    const meaning = isReversed ? card.reversed_meanings.general : card.upright_meanings.general;
+    const meaning = isReversed ? card.keywords.reversed : card.keywords.upright;
+
+    // Start fetching the card's details so the panel opens instantly
+    fetchCardDetails(card).catch(() => {});
 
     // Get image path
     const imageName = getImageFileName(card);
     const extension = imageName === 'TheLovers' ? 'jpg' : 'jpeg';
-    const imageSrc = `image/${imageName}.${extension}`;
+    const imageSrc = card.image || `image/${imageName}.${extension}`;
 
     // Get position data
     const position = spreadPositions[index];
@@ -1207,6 +1317,7 @@ function createCardElements(card, isReversed, imageSrc, positionLabel) {
   // Set up error handler before setting src to avoid race conditions
   img.onerror = function() {
     this.onerror = null;
+    setImageSources(this, null);
     this.src = createFallbackCardImage(card.name);
   };
 
@@ -1219,6 +1330,15 @@ function createCardElements(card, isReversed, imageSrc, positionLabel) {
   // Add a low-quality placeholder while the image loads
   img.style.backgroundColor = 'rgba(45, 20, 65, 0.3)';
 
+  // Resized AVIF/WebP/JPEG variants, when the card index lists them
+  let imageEl = img;
+  if (card.images) {
+    imageEl = document.createElement('picture');
+    imageEl.className = 'contents';
+    imageEl.appendChild(img);
+    setImageSources(img, card.images, SPREAD_IMAGE_SIZES);
+  }
+
   // Set src last to start loading after all handlers are in place
   img.src = imageSrc;
 
@@ -1228,7 +1348,7 @@ function createCardElements(card, isReversed, imageSrc, positionLabel) {
   nameLabel.textContent = card.name;
 
   // Append elements to card front
-  imageContainer.appendChild(img);
+  imageContainer.appendChild(imageEl);
   cardFront.appendChild(imageContainer);
   cardFront.appendChild(nameLabel);
 
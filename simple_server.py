@@ -3,44 +3,661 @@ Simple HTTP Server for Tarot Project
 
 This script starts a simple HTTP server to serve the tarot project files.
 This helps avoid CORS issues when making requests to the tarot bot API.
+
+The server handles each connection on its own thread and keeps connections
+alive (HTTP/1.1). For every file it:
+- serves .br/.gz variants when the browser accepts them. Card data uses the
+  files built by card_assets.py; small text assets are compressed once in
+  memory.
+- sends a content-hash ETag and Last-Modified, and answers If-None-Match and
+  If-Modified-Since with 304 Not Modified
+- supports single byte-range requests (Range / If-Range)
+- marks content-hashed files (card shards, image variants) immutable
+- keeps small, frequently requested files in an in-memory cache
+- sends large files with sendfile, without copying them through Python
+
+Dotfiles and directories (.env, .git), SQLite databases and the runtime
+data directory (data_dir.py) are never served; they answer 404.
+
+Requests are logged as JSON lines, buffered and written about once a second.
+
+Usage:
+    python simple_server.py [port] [--no-browser]
+
+Settings (environment variables):
+    STATIC_ACCESS_LOG: Access log file, "-" for stdout (default) or "off"
+    STATIC_CACHE_SIZE: Memory for cached files in MiB (default 64)
+    STATIC_CACHE_FILE_LIMIT: Largest file kept in memory in KiB (default 512)
 """
 
 import http.server
-import socketserver
 import os
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
 import webbrowser
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from card_assets import ENCODINGS, DEFAULT_OUTPUT_DIR, ensure_built, compress
+from data_dir import DATA_DIR
+import image_assets
 
 # Configuration
 PORT = 8000
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 
+STATIC_ACCESS_LOG = os.getenv("STATIC_ACCESS_LOG", "-")
+STATIC_CACHE_SIZE = int(os.getenv("STATIC_CACHE_SIZE", 64)) * 1024 * 1024
+STATIC_CACHE_FILE_LIMIT = int(os.getenv("STATIC_CACHE_FILE_LIMIT", 512)) * 1024
+
+# Files whose names contain a content hash never change
+IMMUTABLE_FILE = re.compile(r'\.[0-9a-f]{12}\.(json|avif|webp|jpeg)$')
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Content types worth compressing in memory (images are already compressed)
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Don't keep a compressed variant that saves less than this fraction
+MIN_COMPRESSION_SAVING = 0.1
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# ETags keyed on (path, size, mtime), primed from the card asset manifest
+_etags = {}
+
+
+def is_private(path, root=DIRECTORY):
+    """
+    Check whether a file must not be sent to browsers
+
+    Args:
+        path (str): File system path the request maps to
+        root (str): Directory being served
+
+    Returns:
+        bool: True for dotfiles and anything in a dot-directory (.env, .git),
+            SQLite databases and their journals, and the runtime data directory
+    """
+    path = os.path.realpath(path)
+    if path == DATA_DIR or path.startswith(DATA_DIR + os.sep):
+        return True
+    relative = os.path.relpath(path, os.path.realpath(root))
+    if relative == os.curdir:
+        return False
+    parts = relative.split(os.sep)
+    return any(part.startswith('.') for part in parts) or '.sqlite3' in parts[-1]
+
+
+def prime_etags(manifest, output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Reuse the ETags recorded by card_assets.py instead of hashing the files again
+
+    Args:
+        manifest (dict): Manifest returned by ensure_built
+        output_dir (str): Directory of the card assets
+    """
+    for name, info in manifest.get("files", {}).items():
+        path = os.path.join(output_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.st_size == info.get("size"):
+            _etags[(path, stat.st_size, stat.st_mtime_ns)] = info["etag"]
+
+
+def accepted_encodings(header):
+    """
+    Parse an Accept-Encoding header
+
+    Args:
+        header (str): Header value, e.g. "gzip, deflate, br;q=0.5"
+
+    Returns:
+        set: Encodings the client accepts (q > 0)
+    """
+    accepted = set()
+    for part in (header or '').split(','):
+        name, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def file_etag(path, stat):
+    """
+    Return a content-hash ETag for a file, hashing it only when it changes
+
+    Args:
+        path (str): File path
+        stat (os.stat_result): Result of os.stat for the file
+
+    Returns:
+        str: Quoted ETag
+    """
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    etag = _etags.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 16), b''):
+                digest.update(block)
+        etag = f'"{digest.hexdigest()[:16]}"'
+        _etags[key] = etag
+    return etag
+
+
+def parse_range(header, size):
+    """
+    Parse a single byte range
+
+    Args:
+        header (str): Range header value, e.g. "bytes=0-499" or "bytes=-500"
+        size (int): Size of the file
+
+    Returns:
+        tuple or None: (start, end) inclusive, None to send the whole file
+            (missing, malformed or multi-range headers)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    match = _RANGE.match((header or '').strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class Representation:
+    """
+    One encoding of a file: either bytes held in memory or a file on disk
+    """
+
+    __slots__ = ('encoding', 'etag', 'size', 'body', 'path')
+
+    def __init__(self, encoding, etag, size, body=None, path=None):
+        self.encoding = encoding
+        self.etag = etag
+        self.size = size
+        self.body = body
+        self.path = path
+
+
+class StaticFile:
+    """
+    Metadata of a file and its available representations
+    """
+
+    __slots__ = ('key', 'content_type', 'last_modified', 'mtime', 'identity', 'variants', 'has_variants', 'cost')
+
+    def __init__(self, key, content_type, mtime, identity, variants):
+        """
+        Args:
+            key (tuple): (path, size, mtime_ns) used to detect changes
+            content_type (str): MIME type of the uncompressed file
+            mtime (float): Modification time of the file
+            identity (Representation): The uncompressed file
+            variants (dict): Compressed Representations by encoding
+        """
+        self.key = key
+        self.content_type = content_type
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.identity = identity
+        self.variants = variants
+        self.has_variants = bool(variants)
+        self.cost = sum(rep.size for rep in (identity, *variants.values()) if rep.body is not None)
+
+    def select(self, accepted):
+        """
+        Pick the representation to send
+
+        Args:
+            accepted (set): Encodings the client accepts
+
+        Returns:
+            Representation: Brotli, then gzip, then the uncompressed file
+        """
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return self.variants[encoding]
+        return self.identity
+
+
+class FileCache:
+    """
+    LRU cache of small files held in memory with their compressed variants
+    """
+
+    def __init__(self, max_bytes=STATIC_CACHE_SIZE, file_limit=STATIC_CACHE_FILE_LIMIT):
+        """
+        Args:
+            max_bytes (int): Memory budget for cached bodies
+            file_limit (int): Largest file kept in memory
+        """
+        self.max_bytes = max_bytes
+        self.file_limit = file_limit
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, content_type):
+        """
+        Return a file's metadata and representations, loading it if needed
+
+        Args:
+            path (str): File path
+            content_type (str): MIME type of the file
+
+        Returns:
+            StaticFile: The file
+
+        Raises:
+            OSError: If the file cannot be read
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached.key == key:
+                self._files.move_to_end(path)
+                self.hits += 1
+                return cached
+        self.misses += 1
+
+        static_file = self._load(path, stat, key, content_type)
+        if static_file.cost:
+            with self._lock:
+                previous = self._files.pop(path, None)
+                if previous is not None:
+                    self.used -= previous.cost
+                self._files[path] = static_file
+                self.used += static_file.cost
+                while self.used > self.max_bytes and self._files:
+                    _, evicted = self._files.popitem(last=False)
+                    self.used -= evicted.cost
+        return static_file
+
+    def _load(self, path, stat, key, content_type):
+        """
+        Read a file's representations
+
+        Files on disk with .br/.gz siblings (e.g. the card assets) use those.
+        Other small compressible files are compressed once in memory. Large
+        files are left on disk and sent with sendfile.
+        """
+        in_memory = stat.st_size <= self.file_limit
+        etag = file_etag(path, stat)
+        body = None
+        if in_memory:
+            with open(path, 'rb') as file:
+                body = file.read()
+        identity = Representation(None, etag, stat.st_size, body=body, path=path)
+
+        variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant_path = path + suffix
+            try:
+                variant_stat = os.stat(variant_path)
+            except OSError:
+                continue
+            variant_body = None
+            if variant_stat.st_size <= self.file_limit:
+                with open(variant_path, 'rb') as file:
+                    variant_body = file.read()
+            variants[encoding] = Representation(
+                encoding, file_etag(variant_path, variant_stat), variant_stat.st_size,
+                body=variant_body, path=variant_path
+            )
+
+        if not variants and body is not None and content_type.startswith(COMPRESSIBLE_TYPES):
+            for suffix, compressed in compress(body).items():
+                if len(compressed) <= len(body) * (1 - MIN_COMPRESSION_SAVING):
+                    encoding = 'br' if suffix == '.br' else 'gzip'
+                    variants[encoding] = Representation(
+                        encoding, f'{etag[:-1]}{suffix.replace(".", "-")}"', len(compressed), body=compressed
+                    )
+
+        return StaticFile(key, content_type, stat.st_mtime, identity, variants)
+
+    def stats(self):
+        """
+        Report cache counters
+
+        Returns:
+            dict: Cached files, bytes used, hits and misses
+        """
+        return {"files": len(self._files), "bytes": self.used, "hits": self.hits, "misses": self.misses}
+
+
+class AccessLog:
+    """
+    Buffered access log writing one JSON object per line
+    """
+
+    def __init__(self, target=STATIC_ACCESS_LOG, flush_interval=1.0, max_lines=1000):
+        """
+        Args:
+            target (str): File path, "-" for stdout or "off" to disable logging
+            flush_interval (float): Seconds between background flushes
+            max_lines (int): Buffered lines that trigger an immediate flush
+        """
+        self.enabled = target != "off"
+        self.stream = sys.stdout if target == "-" else (open(target, 'a', encoding='utf-8') if self.enabled else None)
+        self.max_lines = max_lines
+        self._lines = []
+        self._lock = threading.Lock()
+        if self.enabled:
+            flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+            flusher.start()
+
+    def write(self, record):
+        """
+        Queue one log record
+
+        Args:
+            record (dict): JSON-serialisable fields of the entry
+        """
+        if not self.enabled:
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._lines.append(line)
+            full = len(self._lines) >= self.max_lines
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write out the buffered lines"""
+        with self._lock:
+            lines, self._lines = self._lines, []
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    def _flush_periodically(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except (OSError, ValueError):
+                pass
+
+
+file_cache = FileCache()
+access_log = AccessLog()
+
+
 class MyHttpRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are separate writes; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    # Image formats missing from older mimetypes tables
+    extensions_map = {
+        **http.server.SimpleHTTPRequestHandler.extensions_map,
+        '.avif': 'image/avif',
+        '.webp': 'image/webp',
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
 
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def log_request(self, code='-', size='-'):
+        # Requests are logged once the response has been sent, in _serve
+        pass
+
     def log_message(self, format, *args):
-        # Custom logging to make it more user-friendly
-        if len(args) >= 3:
-            print(f"[Web Server] {args[0]} {args[1]} {args[2]}")
-        else:
-            # Fall back to the original format if we don't have enough args
-            print(f"[Web Server] {format % args}")
+        access_log.write({"time": time.time(), "client": self.client_address[0], "message": format % args})
+
+    def _serve(self, send_body):
+        """
+        Handle a GET or HEAD request and log it
+
+        Args:
+            send_body (bool): False for HEAD requests
+        """
+        started = time.perf_counter()
+        self._status = None
+        self._sent = 0
+        try:
+            path = self.translate_path(self.path)
+            if is_private(path):
+                self.send_error(404, "File not found")
+                return
+            if os.path.isdir(path) and self.path.split('?', 1)[0].endswith('/'):
+                index = os.path.join(path, 'index.html')
+                if os.path.isfile(index):
+                    path = index
 
-def start_server():
-    """Start the HTTP server and open the browser"""
+            if os.path.isfile(path):
+                self._serve_file(path, send_body)
+            else:
+                # Directory redirects and listings, and 404s
+                file = super().send_head()
+                if file:
+                    try:
+                        if send_body:
+                            self.copyfile(file, self.wfile)
+                    finally:
+                        file.close()
+        finally:
+            access_log.write({
+                "time": time.time(),
+                "client": self.client_address[0],
+                "method": self.command,
+                "path": self.path,
+                "status": self._status,
+                "bytes": self._sent,
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+            })
+
+    def _serve_file(self, path, send_body):
+        """
+        Send a file, honouring conditional, range and encoding headers
+
+        Args:
+            path (str): Path of the requested file
+            send_body (bool): False for HEAD requests
+        """
+        try:
+            static_file = file_cache.get(path, self.guess_type(path))
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') not in (None, static_file.identity.etag):
+            # The client's copy is outdated; send the whole file instead
+            range_header = None
+
+        # Ranges refer to the uncompressed bytes
+        accepted = set() if range_header else accepted_encodings(self.headers.get('Accept-Encoding'))
+        representation = static_file.select(accepted)
+
+        if self._not_modified(static_file, representation):
+            self.send_response(304)
+            self._send_cache_headers(path, static_file, representation)
+            self.end_headers()
+            return
+
+        start, end = 0, representation.size - 1
+        status = 200
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, representation.size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{representation.size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header("Content-Type", static_file.content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Last-Modified", static_file.last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{representation.size}")
+        if representation.encoding:
+            self.send_header("Content-Encoding", representation.encoding)
+        self._send_cache_headers(path, static_file, representation)
+        self.end_headers()
+
+        if send_body and length > 0:
+            if representation.body is not None:
+                self.wfile.write(representation.body[start:end + 1])
+            else:
+                with open(representation.path, 'rb') as file:
+                    # Zero-copy from the page cache to the socket where supported
+                    self.connection.sendfile(file, start, length)
+            self._sent = length
+
+    def _not_modified(self, static_file, representation):
+        """
+        Check the If-None-Match and If-Modified-Since headers
+
+        Args:
+            static_file (StaticFile): The requested file
+            representation (Representation): The representation that would be sent
+
+        Returns:
+            bool: True if the client's copy is current
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # Weak comparison: W/"x" matches "x"
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in tags or representation.etag in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return static_file.mtime <= since
+        return False
+
+    def _send_cache_headers(self, path, static_file, representation):
+        """
+        Send the ETag, Cache-Control and Vary headers of a file
+
+        Args:
+            path (str): Path of the requested (uncompressed) file
+            static_file (StaticFile): The requested file
+            representation (Representation): The representation being sent
+        """
+        self.send_header("ETag", representation.etag)
+        self.send_header(
+            "Cache-Control",
+            IMMUTABLE_CACHE_CONTROL if IMMUTABLE_FILE.search(path) else REVALIDATE_CACHE_CONTROL
+        )
+        if static_file.has_variants:
+            self.send_header("Vary", "Accept-Encoding")
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP server, one thread per connection"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def build_image_assets():
+    """Encode changed card images and rebuild the card index to list them"""
+    try:
+        images = image_assets.build()
+        if images:
+            prime_etags(images, image_assets.DEFAULT_IMAGE_OUTPUT_DIR)
+            manifest = ensure_built(images=images)
+            if manifest:
+                prime_etags(manifest)
+    except Exception as e:
+        print(f"Could not build the card image variants: {e}")
+
+
+def start_server(port=PORT, open_browser=True):
+    """
+    Start the HTTP server and open the browser
+
+    Args:
+        port (int): Port to listen on
+        open_browser (bool): Whether to open index.html in the browser
+    """
+
+    # Split newtarot.json into the index and per-card shards if it changed,
+    # listing the image variants of the last build
+    manifest = ensure_built(images=image_assets.load_manifest())
+    if manifest:
+        prime_etags(manifest)
+
+    # Encoding every image takes a while the first time; serve what exists
+    # meanwhile
+    threading.Thread(target=build_image_assets, name="image-assets", daemon=True).start()
 
     handler = MyHttpRequestHandler
-    with socketserver.TCPServer(("", PORT), handler) as httpd:
-        print(f"Serving at http://localhost:{PORT}")
-        print(f"Opening browser to http://localhost:{PORT}/index.html")
+    with StaticServer(("", port), handler) as httpd:
+        print(f"Serving at http://localhost:{port}")
 
-        webbrowser.open(f"http://localhost:{PORT}/index.html")
+        if open_browser:
+            print(f"Opening browser to http://localhost:{port}/index.html")
+            webbrowser.open(f"http://localhost:{port}/index.html")
 
         print("Server is running. Press Ctrl+C to stop.")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\nServer stopped.")
+        finally:
+            access_log.flush()
+
 
 if __name__ == "__main__":
-    start_server()
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    start_server(int(args[0]) if args else PORT, open_browser='--no-browser' not in sys.argv)
@@ -0,0 +1,425 @@
+"""
+Pre-fork Worker Supervisor for the Tarot Bot API
+
+Runs the ASGI app (asgi_app.py) in a pool of worker processes that share one
+listening socket, the way `manage_server.py start` serves the API on Unix:
+- the app, the card store and the Gemini client library are loaded once in
+  the supervisor before the workers are forked, and the garbage collector's objects are frozen, so
+  the card index stays in copy-on-write pages shared by every worker
+- each worker runs uvicorn and reports to the supervisor, over a pipe, once
+  it has started and its readiness checks (tarot_bot.readiness) pass
+- workers that exit unexpectedly are replaced, with a growing delay while
+  they keep failing right after starting
+- SIGHUP reloads the card data and replaces the workers one at a time: a
+  new worker must be ready before the old one is asked to finish its
+  requests and exit, so the socket is always served. A new worker that
+  does not become ready stops the rollout and the old workers keep running.
+- SIGTERM or SIGINT stops the workers gracefully and exits
+
+Code changes are not picked up by SIGHUP, as workers are forked from the
+supervisor's copy of the app; restart the server for those.
+
+Settings (environment variables):
+    SERVER_WORKERS: Worker processes (default: the number of CPU cores)
+    SUPERVISOR_GRACEFUL_TIMEOUT: Seconds a stopping worker may spend finishing
+        its requests before it is killed (default 30)
+    SUPERVISOR_READY_TIMEOUT: Seconds a new worker may take to become ready (default 60)
+
+Usage:
+    python supervisor.py [--host 127.0.0.1] [--port 5000] [--workers N]
+"""
+
+import os
+import gc
+import sys
+import time
+import select
+import signal
+import socket
+import logging
+import argparse
+
+logger = logging.getLogger('tarot_bot')
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
+GRACEFUL_TIMEOUT = float(os.getenv("SUPERVISOR_GRACEFUL_TIMEOUT", 30))
+READY_TIMEOUT = float(os.getenv("SUPERVISOR_READY_TIMEOUT", 60))
+
+# A worker that exits sooner than this after starting counts as failing to boot
+MIN_WORKER_LIFETIME = 5.0
+
+# Longest wait before replacing a worker that keeps failing to boot
+MAX_RESPAWN_DELAY = 30.0
+
+# Messages sent by a worker on its readiness pipe
+READY, NOT_READY = b'1', b'0'
+
+
+class Worker:
+    """
+    A forked worker process as seen by the supervisor
+    """
+
+    __slots__ = ('pid', 'started', 'ready_fd', 'state')
+
+    def __init__(self, pid, ready_fd):
+        """
+        Args:
+            pid (int): Process ID
+            ready_fd (int): Read end of the worker's readiness pipe
+        """
+        self.pid = pid
+        self.started = time.monotonic()
+        self.ready_fd = ready_fd
+        # "starting", "ready", "not_ready" or "stopping"
+        self.state = "starting"
+
+
+def _serve(app, sock, ready_fd, graceful_timeout):
+    """
+    Run uvicorn in a forked worker and report when it is ready
+
+    Args:
+        app: The ASGI application
+        sock (socket.socket): The shared listening socket
+        ready_fd (int): Write end of the readiness pipe
+        graceful_timeout (float): Seconds to finish requests after SIGTERM
+    """
+    import uvicorn
+    from tarot_bot import readiness
+
+    class WorkerServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if self.started:
+                ok, checks = readiness()
+                if not ok:
+                    logger.warning(f"Worker {os.getpid()} is not ready: {checks}")
+                os.write(ready_fd, READY if ok else NOT_READY)
+            os.close(ready_fd)
+
+    config = uvicorn.Config(app, lifespan='on', log_level='warning', access_log=False,
+                            timeout_graceful_shutdown=graceful_timeout)
+    WorkerServer(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Forks, watches and replaces the worker processes
+    """
+
+    def __init__(self, host='127.0.0.1', port=5000, workers=SERVER_WORKERS,
+                 graceful_timeout=GRACEFUL_TIMEOUT, ready_timeout=READY_TIMEOUT):
+        """
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on
+            workers (int): Worker processes to keep running
+            graceful_timeout (float): Seconds a stopping worker may take
+            ready_timeout (float): Seconds a new worker may take to become ready
+        """
+        self.host = host
+        self.port = port
+        self.size = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.workers = {}
+        self.app = None
+        self.sock = None
+        self._respawns = []
+        self._respawn_delay = 1.0
+        self._reload = False
+        self._stop = False
+        self._wakeup = None
+
+    def preload(self):
+        """
+        Load the app, the card data and the libraries workers import when
+        they start (uvicorn, and the Gemini client unless GEMINI_FAKE=1 or
+        no API key is set) in the supervisor, before forking
+        """
+        started = time.perf_counter()
+        import uvicorn
+        import asgi_app
+        from card_store import get_card_store
+        from tarot_bot import gemini_module
+
+        self.app = asgi_app.app
+        store = get_card_store()
+        if os.getenv("GEMINI_API_KEY") and os.getenv("GEMINI_FAKE") != "1":
+            gemini_module()
+        # Keep the preloaded objects out of future collections, so workers
+        # don't write to (and copy) the pages holding them
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Preloaded the app and {len(store.names)} cards in "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def bind(self):
+        """Open the listening socket shared by the workers"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+    def spawn(self):
+        """
+        Fork a new worker
+
+        Returns:
+            Worker: The new worker
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # In the worker: the supervisor's signal handling does not apply
+            os.close(read_fd)
+            for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            status = 0
+            try:
+                _serve(self.app, self.sock, write_fd, self.graceful_timeout)
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} crashed")
+                status = 1
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        worker = Worker(pid, read_fd)
+        self.workers[pid] = worker
+        logger.info(f"Started worker {pid}")
+        return worker
+
+    def _read_ready(self, worker):
+        """Read a worker's readiness message (or the end of its pipe)"""
+        try:
+            message = os.read(worker.ready_fd, 1)
+        except OSError:
+            message = b''
+        os.close(worker.ready_fd)
+        worker.ready_fd = None
+        if message == READY:
+            worker.state = "ready"
+            self._respawn_delay = 1.0
+            logger.info(f"Worker {worker.pid} is ready")
+        elif worker.state == "starting":
+            worker.state = "not_ready"
+            if message == NOT_READY:
+                logger.warning(f"Worker {worker.pid} started but failed its readiness checks")
+
+    def wait_ready(self, worker, timeout):
+        """
+        Wait for a new worker to report that it is ready
+
+        Args:
+            worker (Worker): A worker from spawn
+            timeout (float): Seconds to wait
+
+        Returns:
+            bool: True if the worker is ready
+        """
+        deadline = time.monotonic() + timeout
+        while worker.ready_fd is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([worker.ready_fd], [], [], remaining)
+            if readable:
+                self._read_ready(worker)
+        return worker.state == "ready"
+
+    def _reap(self):
+        """Collect exited workers and schedule replacements for unexpected exits"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+                worker.ready_fd = None
+            if worker.state == "stopping" or self._stop:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            lifetime = time.monotonic() - worker.started
+            if lifetime < MIN_WORKER_LIFETIME:
+                delay = self._respawn_delay
+                self._respawn_delay = min(MAX_RESPAWN_DELAY, self._respawn_delay * 2)
+            else:
+                delay = 0.0
+            logger.error(f"Worker {pid} exited with status {code} after {lifetime:.1f}s; "
+                         f"replacing it in {delay:.0f}s")
+            self._respawns.append(time.monotonic() + delay)
+
+    def _stop_worker(self, worker, timeout):
+        """
+        Ask a worker to finish its requests and exit, killing it after a timeout
+
+        Args:
+            worker (Worker): The worker
+            timeout (float): Seconds to wait before SIGKILL
+        """
+        worker.state = "stopping"
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + timeout
+        while worker.pid in self.workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._reap()
+        if worker.pid in self.workers:
+            logger.warning(f"Worker {worker.pid} did not stop in {timeout:.0f}s; killing it")
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(worker.pid, 0)
+            self.workers.pop(worker.pid, None)
+
+    def rolling_restart(self):
+        """
+        Reload the card data and replace every worker, one at a time
+
+        Returns:
+            bool: True if every worker was replaced
+        """
+        from card_store import reload_card_store
+
+        logger.info("Rolling restart of the workers")
+        try:
+            gc.unfreeze()
+            reload_card_store()
+            gc.collect()
+            gc.freeze()
+        except Exception as e:
+            logger.error(f"Card data reload failed, keeping the running workers: {type(e).__name__}: {e}")
+            return False
+
+        for old in [worker for worker in self.workers.values() if worker.state != "stopping"]:
+            if self._stop:
+                return False
+            new = self.spawn()
+            if not self.wait_ready(new, self.ready_timeout):
+                logger.error(f"New worker {new.pid} did not become ready; stopping the rolling restart")
+                self._stop_worker(new, self.graceful_timeout)
+                return False
+            self._stop_worker(old, self.graceful_timeout)
+        logger.info("Rolling restart finished")
+        return True
+
+    def _on_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        elif signum in (signal.SIGTERM, signal.SIGINT):
+            self._stop = True
+
+    def run(self):
+        """
+        Preload, start the workers and supervise them until stopped
+        """
+        self.preload()
+        self.bind()
+
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        self._wakeup = read_fd
+        signal.set_wakeup_fd(write_fd)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+
+        logger.info(f"Supervisor {os.getpid()} listening on http://{self.host}:{self.port} "
+                    f"with {self.size} worker(s)")
+        for _ in range(self.size):
+            self.spawn()
+
+        try:
+            while not self._stop:
+                watched = [self._wakeup] + [w.ready_fd for w in self.workers.values() if w.ready_fd is not None]
+                timeout = 1.0
+                if self._respawns:
+                    timeout = max(0.0, min(timeout, min(self._respawns) - time.monotonic()))
+                try:
+                    readable, _, _ = select.select(watched, [], [], timeout)
+                except InterruptedError:
+                    readable = []
+                if self._wakeup in readable:
+                    try:
+                        os.read(self._wakeup, 4096)
+                    except BlockingIOError:
+                        pass
+                for worker in list(self.workers.values()):
+                    if worker.ready_fd is not None and worker.ready_fd in readable:
+                        self._read_ready(worker)
+
+                self._reap()
+                now = time.monotonic()
+                due = [when for when in self._respawns if when <= now]
+                if due:
+                    self._respawns = [when for when in self._respawns if when > now]
+                    for _ in due:
+                        if len(self.workers) < self.size:
+                            self.spawn()
+
+                if self._reload and not self._stop:
+                    self._reload = False
+                    self.rolling_restart()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop every worker gracefully and close the socket"""
+        logger.info(f"Stopping {len(self.workers)} worker(s)")
+        self._stop = True
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.state = "stopping"
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._reap()
+        for worker in list(self.workers.values()):
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+                os.waitpid(worker.pid, 0)
+            except OSError:
+                pass
+        self.workers.clear()
+        if self.sock is not None:
+            self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the tarot bot API from a pool of pre-forked workers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        print("The supervisor needs os.fork; run uvicorn asgi_app:app --workers N instead")
+        return 1
+    # Share the rate limits between the workers (see manage_server.start_server)
+    if args.workers > 1:
+        os.environ.setdefault("RATE_LIMIT_BACKEND", "sqlite")
+    Supervisor(args.host, args.port, args.workers).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,18 +9,45 @@ tarot card meanings from a comprehensive database.
 
 import os
 import json
+import time
+import asyncio
+import inspect
 import logging
-import google.generativeai as genai
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from text_utils import remove_special_characters
-from flask import Flask, request, jsonify
+from text_utils import remove_special_characters, StreamingSanitizer
+from card_store import get_card_store, reload_card_store
+from card_table import resolve_focus
+from reading_cache import create_reading_cache, make_cache_key
+from reading_history import create_reading_history, spread_hash
+from prompt_template import PromptTemplate, SYSTEM_INSTRUCTION, prompt_hash
+from token_budget import PROMPT_TOKEN_BUDGET, estimate_tokens, output_token_limit, reported_usage, hit_output_limit
+from gemini_client import ResilientModel, BlockingModelAdapter
+from fake_gemini import FakeGenerativeModel
+from offline_reading import OfflineReadingEngine, OFFLINE_COLUMNS
+from admission import create_admission_control, client_key, AdmissionRejected
+from instrumentation import (
+    configure_logging,
+    registry as metrics_registry,
+    render_metrics,
+    start_request,
+    finish_request,
+    record_tokens,
+    stage,
+    METRICS_CONTENT_TYPE,
+    READING_ERRORS,
+    FALLBACKS,
+    CACHE_LOOKUPS,
+    ADMISSION_DECISIONS,
+    PROMPT_CHARS,
+    RESPONSE_CHARS,
+)
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (plain text, or JSON lines with LOG_FORMAT=json)
+configure_logging()
 logger = logging.getLogger('tarot_bot')
 
 # Load environment variables
@@ -32,8 +59,44 @@ app = Flask(__name__)
 # Enable CORS for all routes
 CORS(app)
 
+# Mystical messages returned instead of a reading, without mentioning backend issues
+GREETING = "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\n"
+NO_CARDS_MESSAGE = GREETING + "หมอต้องการไพ่เพื่อทำนาย โปรดกดปุ่มสุ่มไพ่เพื่อให้หมอได้ดูดวงให้คุณนะคะ"
+NOT_ENOUGH_CARDS_MESSAGE = GREETING + "หมอต้องการไพ่อย่างน้อย 3 ใบเพื่อทำนาย โปรดลองสุ่มไพ่ใหม่อีกครั้งนะคะ เพื่อที่หมอจะได้ดูดวงให้คุณได้อย่างแม่นยำค่ะ"
+STARS_MISALIGNED_MESSAGE = GREETING + "ดวงดาวกำลังเคลื่อนตัวในตำแหน่งที่ไม่เอื้ออำนวยต่อการทำนาย หมอขอแนะนำให้คุณลองใหม่อีกครั้งในเวลาที่พลังจักรวาลเป็นใจนะคะ"
+COSMIC_DISTURBANCE_MESSAGE = GREETING + "พลังงานจักรวาลกำลังแปรปรวน ทำให้หมอไม่สามารถเชื่อมต่อกับพลังแห่งไพ่ทาโร่ได้อย่างสมบูรณ์ หมอขอแนะนำให้คุณลองใหม่อีกครั้งในภายหลังนะคะ เมื่อดวงดาวเรียงตัวในตำแหน่งที่เหมาะสม"
+FALLBACK_MESSAGES = frozenset({
+    NO_CARDS_MESSAGE,
+    NOT_ENOUGH_CARDS_MESSAGE,
+    STARS_MISALIGNED_MESSAGE,
+    COSMIC_DISTURBANCE_MESSAGE,
+})
+
+# Where a reading came from, reported with it as "source": the model, the
+# reading cache or the offline engine when that was the mode asked for.
+# Otherwise the model failed or was not allowed and a fallback was served
+# ("fallback_cache", "fallback_history", "fallback_offline"), a streamed
+# reading broke off part way ("partial"), the model stopped at
+# max_output_tokens ("truncated"), or the reply is one of the mystical
+# messages ("message")
+READING_SOURCES = frozenset({"model", "cache", "offline"})
+
+# Readings that stop short; they are neither cached nor kept in the history
+INCOMPLETE_SOURCES = frozenset({"partial", "truncated"})
+
+# Batch generation settings
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", 4))
+BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", 5))
+BATCH_MAX_SPREADS = int(os.getenv("BATCH_MAX_SPREADS", 1000))
+
+# How readings are produced: "gemini" (the model, with the offline engine as
+# fallback) or "offline" (composed locally from the card data)
+READING_MODES = ("gemini", "offline")
+READING_MODE = os.getenv("READING_MODE", "gemini").lower()
+
 class TarotBot:
-    def __init__(self, model="gemini-2.0-flash"):
+    def __init__(self, model="gemini-2.0-flash", card_store=None, reading_cache=None, generative_model=None,
+                 mode=READING_MODE, admission=None, prompt_budget=PROMPT_TOKEN_BUDGET, history=None):
         """
         Initialize the tarot bot with Google Gemini API and load tarot card data
 
@@ -43,73 +106,154 @@ class TarotBot:
                 Other options include:
                 - "gemini-1.5-pro" (more powerful but slower)
                 - "gemini-2.0-flash" (newer model with improved capabilities)
+            card_store (CardStore): Card store to read from
+                Default is the process-wide store shared by all bots
+            reading_cache (ReadingCache): Cache for generated readings
+                Default is built from the READING_CACHE_* environment variables
+            generative_model: Model object to use instead of Gemini (e.g. a
+                FakeGenerativeModel). Default is Gemini, or the fake when
+                GEMINI_FAKE=1.
+            mode (str): Default reading mode, "gemini" or "offline"
+                Default comes from the READING_MODE environment variable
+            admission (AdmissionControl): Rate limits, model call slots and
+                coalescing of identical readings. Default is built from the
+                RATE_LIMIT_* and ADMISSION_* environment variables
+            prompt_budget (int): Most input tokens per reading; card meanings
+                are shortened to fit. 0 turns this off.
+                Default comes from the PROMPT_TOKEN_BUDGET environment variable
+            history (ReadingHistory): Store of the readings served
+                Default is built from the READING_HISTORY_* environment variables
         """
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY environment variable not set")
-
-        genai.configure(api_key=self.api_key)
+        started = time.perf_counter()
         self.model = model
+        self.mode = mode if mode in READING_MODES else "gemini"
+
+        if generative_model is None and os.getenv("GEMINI_FAKE") == "1":
+            logger.info("Using the fake Gemini model (GEMINI_FAKE=1)")
+            generative_model = FakeGenerativeModel.from_env()
+
+        if generative_model is not None:
+            self.api_key = None
+            self.uses_system_instruction = False
+        elif self.mode == "offline" and not os.getenv("GEMINI_API_KEY"):
+            # Offline readings do not need the model at all
+            self.api_key = None
+            self.uses_system_instruction = False
+        else:
+            self.api_key = os.getenv("GEMINI_API_KEY")
+            if not self.api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set")
 
-        # Initialize the model with fortune teller persona
-        self.fortune_teller = genai.GenerativeModel(self.model)
+            # GEMINI_API_ENDPOINT points the client at another server, such as
+            # the local fake_gemini_server.py, over the REST transport
+            endpoint = os.getenv("GEMINI_API_ENDPOINT")
+            genai = gemini_module()
+            if endpoint:
+                genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=self.api_key)
+
+            # Initialize the model with fortune teller persona. When the client
+            # library supports it, the static instructions are sent once as a
+            # system instruction instead of being repeated in every prompt.
+            self.uses_system_instruction = _supports_system_instruction(genai)
+            if self.uses_system_instruction:
+                generative_model = genai.GenerativeModel(self.model, system_instruction=SYSTEM_INSTRUCTION)
+            else:
+                generative_model = genai.GenerativeModel(self.model)
+            if endpoint:
+                logger.info(f"Using the Gemini API at {endpoint}")
+                generative_model = BlockingModelAdapter(generative_model)
+
+        # Retries, deadline, hedging and circuit breaker around the model
+        self.fortune_teller = ResilientModel(generative_model) if generative_model is not None else None
 
         # Load tarot card data
-        self.tarot_data = self._load_tarot_data()
+        self.card_store = card_store or get_card_store()
+        self.card_table = self.card_store.table
+
+        # Prompt text for every card is rendered once up front
+        self.prompt_template = PromptTemplate(self.card_table, include_instructions=not self.uses_system_instruction)
+        self.prompt_budget = prompt_budget
+
+        # Local reading engine, used in offline mode and when the model fails.
+        # Built on first use, as it reads every meaning section of the table
+        self._offline_engine = None
+        self._offline_lock = threading.Lock()
+
+        # Cache of generated readings keyed on the prompt inputs
+        self.reading_cache = reading_cache or create_reading_cache()
+
+        # Decides which cache misses may call the model
+        self.admission = admission or create_admission_control()
+
+        # Readings served to visitors, kept for their history and as a fallback
+        self.history = history or create_reading_history()
+
+        self.init_time = time.perf_counter() - started
 
     def _load_tarot_data(self):
         """
-        Load tarot card data from JSON file
+        Load tarot card data from the shared card store
 
         Returns:
-            dict: Dictionary of tarot card data indexed by card name
+            Mapping: Read-only mapping of tarot card data indexed by card name
         """
-        try:
-            with open('newtarot.json', 'r', encoding='utf-8') as file:
-                tarot_cards = json.load(file)
+        return self.card_store.cards
 
-            # Create a dictionary indexed by card name for easy lookup
-            tarot_dict = {}
-            for card in tarot_cards:
-                tarot_dict[card['name']] = card
+    @property
+    def tarot_data(self):
+        """Mapping: Full card data indexed by card name (parsed on first use)"""
+        return self._load_tarot_data()
 
-            return tarot_dict
-        except Exception as e:
-            logger.error(f"Error loading tarot data: {e}")
-            return {}
+    @property
+    def offline_engine(self):
+        """OfflineReadingEngine: The local reading engine, built on first use"""
+        if self._offline_engine is None:
+            with self._offline_lock:
+                if self._offline_engine is None:
+                    cards = self.card_table.card_data(OFFLINE_COLUMNS)
+                    self._offline_engine = OfflineReadingEngine(cards, self.card_store.combinations)
+        return self._offline_engine
 
-    def _get_card_meaning(self, card_name, is_reversed):
+    def stats(self):
+        """
+        Describe the cost of this bot instance and its card store
+
+        Returns:
+            dict: Model name, initialization time, card store and cache statistics
+        """
+        return {
+            "model": self.model,
+            "mode": self.mode,
+            "init_time_ms": round(self.init_time * 1000, 3),
+            "card_store": self.card_store.stats(),
+            "reading_cache": self.reading_cache.stats() if self.reading_cache else None,
+            "model_client": self.fortune_teller.stats() if self.fortune_teller else None,
+            "admission": self.admission.stats(),
+            "history": self.history.stats() if self.history else None,
+            "prompt": {
+                "token_budget": self.prompt_budget,
+                "truncated": dict(self.prompt_template.truncated),
+            },
+        }
+
+    def _get_card_meaning(self, card_name, is_reversed, section='general'):
         """
         Get the meaning of a tarot card based on its orientation
 
         Args:
             card_name (str): The name of the tarot card
             is_reversed (bool): Whether the card is reversed
+            section (str): Meaning section of the reading focus
+                Default is the general meaning
 
         Returns:
             str: The meaning of the card
         """
-        if not self.tarot_data or card_name not in self.tarot_data:
-            return "ไม่พบข้อมูลไพ่"
-
-        card_data = self.tarot_data[card_name]
+        return self.card_table.meaning(card_name, is_reversed, section)
 
-        if is_reversed:
-            # Get reversed meaning
-            if 'reversed_meanings' in card_data and 'general' in card_data['reversed_meanings']:
-                return card_data['reversed_meanings']['general']
-            elif 'keywords' in card_data and 'reversed' in card_data['keywords']:
-                return card_data['keywords']['reversed']
-        else:
-            # Get upright meaning
-            if 'upright_meanings' in card_data and 'general' in card_data['upright_meanings']:
-                return card_data['upright_meanings']['general']
-            elif 'keywords' in card_data and 'upright' in card_data['keywords']:
-                return card_data['keywords']['upright']
-
-        return "ไม่พบความหมายของไพ่"
-
-    def generate_reading_summary(self, cards_data):
+    def generate_reading_summary(self, cards_data, mode=None, client=None, focus=None):
         """
         Generate a summary of the tarot reading based on the drawn cards
 
@@ -119,87 +263,910 @@ class TarotBot:
                 - name: Card name
                 - position: Position in the spread (e.g., "Present", "Challenge")
                 - isReversed: Boolean indicating if card is reversed
+            mode (str): "gemini" or "offline" for this reading
+                Default is the bot's mode
+            client (str): Rate limit key of the requester (see admission.client_key)
+                Default is no per-client limit
+            focus (str): What the reading concentrates on, e.g. "love",
+                "career" or "health" (see card_table.FOCUS_SECTIONS)
+                Default is a general reading
 
         Returns:
             str: A mystical interpretation of the tarot reading
         """
+        return self.generate_reading(cards_data, mode, client, focus)[0]
+
+    def generate_reading(self, cards_data, mode=None, client=None, focus=None):
+        """
+        Generate a reading and tell where it came from
+
+        Same arguments as generate_reading_summary.
+
+        Returns:
+            tuple: (reading, source), source as described at READING_SOURCES
+        """
+        cache_key = None
+        section = resolve_focus(focus)
         try:
             # Ensure we have enough cards for a reading
             if len(cards_data) < 3:
-                return "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nหมอต้องการไพ่อย่างน้อย 3 ใบเพื่อทำนาย โปรดลองสุ่มไพ่ใหม่อีกครั้งนะคะ เพื่อที่หมอจะได้ดูดวงให้คุณได้อย่างแม่นยำค่ะ"
+                return NOT_ENOUGH_CARDS_MESSAGE, "message"
+
+            if self._use_offline(mode):
+                return self._offline_with_source(cards_data, section, "offline")
+
+            prompt, cache_key = self._prepare_reading(cards_data, section)
+
+            # Serve a cached reading for the same spread if we have one
+            cached = self._get_cached_reading(cache_key)
+            if cached:
+                return cached, "cache"
+
+            # Share the model call of an identical reading already in progress
+            flight, leader = self._admit(cache_key, client)
+            if not leader:
+                reading = flight.result()
+                return reading, "truncated" if flight.truncated else "model"
+
+            # Generate content
+            with self.admission.lead(cache_key, flight):
+                with self.admission.gate.slot(), stage("model"):
+                    response = self.fortune_teller.generate_content(prompt, **self._generation_options(cards_data))
+                self._record_tokens(prompt, response.text, response)
+                summary = self._clean_reading(response.text)
+                flight.truncated = self._check_truncated(response)
+                if not flight.truncated:
+                    self._cache_reading(cache_key, summary)
+                flight.publish(summary)
+            return summary, "truncated" if flight.truncated else "model"
+
+        except ValueError:
+            # Create a mystical error message without mentioning backend issues
+            return STARS_MISALIGNED_MESSAGE, "message"
+
+        except AdmissionRejected as e:
+            # Too many readings for the model right now: answer without it
+            return self._rejected_reading(cache_key, cards_data, e, section)
+
+        except Exception as e:
+            # Serve a cached or offline reading without mentioning backend issues
+            logger.warning(f"Reading generation failed: {type(e).__name__}: {e}")
+            return self._fallback_reading(cache_key, cards_data, e, section)
+
+    async def generate_reading_summary_async(self, cards_data, mode=None, client=None, focus=None):
+        """
+        Generate a summary of the tarot reading without blocking the event loop
+
+        Same as generate_reading_summary, but awaits the Gemini call so one
+        worker can serve many readings concurrently. Cancelling the awaiting
+        task (e.g. when the client disconnects) cancels the model call.
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            mode (str): "gemini" or "offline" for this reading
+            client (str): Rate limit key of the requester
+            focus (str): What the reading concentrates on, e.g. "love"
+
+        Returns:
+            str: A mystical interpretation of the tarot reading
+        """
+        return (await self.generate_reading_async(cards_data, mode, client, focus))[0]
+
+    async def generate_reading_async(self, cards_data, mode=None, client=None, focus=None):
+        """
+        Asynchronous version of generate_reading
+
+        Returns:
+            tuple: (reading, source), source as described at READING_SOURCES
+        """
+        cache_key = None
+        section = resolve_focus(focus)
+        try:
+            if len(cards_data) < 3:
+                return NOT_ENOUGH_CARDS_MESSAGE, "message"
+
+            if self._use_offline(mode):
+                return self._offline_with_source(cards_data, section, "offline")
+
+            prompt, cache_key = self._prepare_reading(cards_data, section)
+
+            cached = await self._get_cached_reading_async(cache_key)
+            if cached:
+                return cached, "cache"
+
+            flight, leader = await self._admit_async(cache_key, client)
+            if not leader:
+                reading = await flight.result_async()
+                return reading, "truncated" if flight.truncated else "model"
+
+            with self.admission.lead(cache_key, flight):
+                async with self.admission.gate.slot_async():
+                    with stage("model"):
+                        response = await self.fortune_teller.generate_content_async(
+                            prompt, **self._generation_options(cards_data))
+                self._record_tokens(prompt, response.text, response)
+                summary = self._clean_reading(response.text)
+                flight.truncated = self._check_truncated(response)
+                if not flight.truncated:
+                    await self._cache_reading_async(cache_key, summary)
+                flight.publish(summary)
+            return summary, "truncated" if flight.truncated else "model"
+
+        except ValueError:
+            return STARS_MISALIGNED_MESSAGE, "message"
+
+        except AdmissionRejected as e:
+            return await asyncio.to_thread(self._rejected_reading, cache_key, cards_data, e, section)
+
+        except Exception as e:
+            logger.warning(f"Reading generation failed: {type(e).__name__}: {e}")
+            return await asyncio.to_thread(self._fallback_reading, cache_key, cards_data, e, section)
+
+    def stream_reading_summary(self, cards_data, mode=None, client=None, focus=None, outcome=None):
+        """
+        Generate a summary of the tarot reading, yielding text as the model writes it
+
+        Requests for a spread that is already being streamed receive the same
+        pieces as they are generated.
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            mode (str): "gemini" or "offline" for this reading
+            client (str): Rate limit key of the requester
+            focus (str): What the reading concentrates on, e.g. "love"
+            outcome (dict): If given, its "source" is set to where the
+                reading came from (see READING_SOURCES)
+
+        Yields:
+            str: Cleaned pieces of the reading, in order
+        """
+        started = False
+        cache_key = None
+        section = resolve_focus(focus)
+        outcome = {} if outcome is None else outcome
+        outcome["source"] = "message"
+        try:
+            if len(cards_data) < 3:
+                yield NOT_ENOUGH_CARDS_MESSAGE
+                return
+
+            if self._use_offline(mode):
+                reading, outcome["source"] = self._offline_with_source(cards_data, section, "offline")
+                yield reading
+                return
+
+            prompt, cache_key = self._prepare_reading(cards_data, section)
+
+            cached = self._get_cached_reading(cache_key)
+            if cached:
+                outcome["source"] = "cache"
+                yield cached
+                return
+
+            flight, leader = self._admit(cache_key, client)
+            outcome["source"] = "model"
+            if not leader:
+                for piece in flight.follow():
+                    started = True
+                    yield piece
+                if flight.truncated:
+                    outcome["source"] = "truncated"
+                return
+
+            # The model stage covers the whole stream, including the time the
+            # caller takes to send each piece on
+            with self.admission.lead(cache_key, flight), self.admission.gate.slot(), stage("model"):
+                response = self.fortune_teller.generate_content(prompt, stream=True,
+                                                                **self._generation_options(cards_data))
+
+                sanitizer = StreamingSanitizer()
+                pieces = []
+                chunk = None
+                for chunk in response:
+                    piece = sanitizer.feed(chunk.text)
+                    if piece:
+                        started = True
+                        pieces.append(piece)
+                        flight.publish(piece)
+                        yield piece
+                piece = sanitizer.flush()
+                if piece:
+                    pieces.append(piece)
+                    flight.publish(piece)
+                    yield piece
+                flight.truncated = self._check_truncated(chunk)
+
+            self._record_tokens(prompt, ''.join(pieces), chunk)
+            if flight.truncated:
+                outcome["source"] = "truncated"
+            else:
+                self._cache_reading(cache_key, ''.join(pieces))
+            RESPONSE_CHARS.observe(sum(len(piece) for piece in pieces))
+
+        except ValueError:
+            if not started:
+                yield STARS_MISALIGNED_MESSAGE
+
+        except AdmissionRejected as e:
+            reading, outcome["source"] = self._rejected_reading(cache_key, cards_data, e, section)
+            yield reading
+
+        except Exception as e:
+            logger.error(f"Error while streaming reading: {type(e).__name__}: {e}")
+            if not started:
+                reading, outcome["source"] = self._fallback_reading(cache_key, cards_data, e, section)
+                yield reading
+            else:
+                outcome["source"] = "partial"
+                READING_ERRORS.inc(type(e).__name__)
+
+    async def stream_reading_summary_async(self, cards_data, mode=None, client=None, focus=None, outcome=None):
+        """
+        Asynchronous version of stream_reading_summary
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            mode (str): "gemini" or "offline" for this reading
+            client (str): Rate limit key of the requester
+            focus (str): What the reading concentrates on, e.g. "love"
+            outcome (dict): If given, its "source" is set to where the
+                reading came from (see READING_SOURCES)
+
+        Yields:
+            str: Cleaned pieces of the reading, in order
+        """
+        started = False
+        cache_key = None
+        section = resolve_focus(focus)
+        outcome = {} if outcome is None else outcome
+        outcome["source"] = "message"
+        try:
+            if len(cards_data) < 3:
+                yield NOT_ENOUGH_CARDS_MESSAGE
+                return
+
+            if self._use_offline(mode):
+                reading, outcome["source"] = self._offline_with_source(cards_data, section, "offline")
+                yield reading
+                return
+
+            prompt, cache_key = self._prepare_reading(cards_data, section)
+
+            cached = await self._get_cached_reading_async(cache_key)
+            if cached:
+                outcome["source"] = "cache"
+                yield cached
+                return
+
+            flight, leader = await self._admit_async(cache_key, client)
+            outcome["source"] = "model"
+            if not leader:
+                async for piece in flight.follow_async():
+                    started = True
+                    yield piece
+                if flight.truncated:
+                    outcome["source"] = "truncated"
+                return
+
+            with self.admission.lead(cache_key, flight):
+                async with self.admission.gate.slot_async():
+                    with stage("model"):
+                        response = await self.fortune_teller.generate_content_async(
+                            prompt, stream=True, **self._generation_options(cards_data))
+
+                        sanitizer = StreamingSanitizer()
+                        pieces = []
+                        chunk = None
+                        async for chunk in response:
+                            piece = sanitizer.feed(chunk.text)
+                            if piece:
+                                started = True
+                                pieces.append(piece)
+                                flight.publish(piece)
+                                yield piece
+                        piece = sanitizer.flush()
+                        if piece:
+                            pieces.append(piece)
+                            flight.publish(piece)
+                            yield piece
+                        flight.truncated = self._check_truncated(chunk)
+
+            self._record_tokens(prompt, ''.join(pieces), chunk)
+            if flight.truncated:
+                outcome["source"] = "truncated"
+            else:
+                await self._cache_reading_async(cache_key, ''.join(pieces))
+            RESPONSE_CHARS.observe(sum(len(piece) for piece in pieces))
+
+        except ValueError:
+            if not started:
+                yield STARS_MISALIGNED_MESSAGE
+
+        except AdmissionRejected as e:
+            reading, outcome["source"] = await asyncio.to_thread(self._rejected_reading, cache_key, cards_data, e,
+                                                                 section)
+            yield reading
+
+        except Exception as e:
+            logger.error(f"Error while streaming reading: {type(e).__name__}: {e}")
+            if not started:
+                reading, outcome["source"] = await asyncio.to_thread(self._fallback_reading, cache_key, cards_data, e,
+                                                                     section)
+                yield reading
+            else:
+                outcome["source"] = "partial"
+                READING_ERRORS.inc(type(e).__name__)
+
+    def generate_readings_batch(self, spreads, max_workers=BATCH_MAX_WORKERS, rate_limit=BATCH_RATE_LIMIT, mode=None,
+                                focus=None):
+        """
+        Generate readings for many spreads, yielding each result as it completes
+
+        Identical spreads are generated once and their reading is reported for
+        every index they appear at. Model calls run on a bounded thread pool and
+        are started no faster than rate_limit per second.
+
+        Args:
+            spreads (list): List of spreads, each a list of card dictionaries
+                as accepted by generate_reading_summary
+            max_workers (int): Maximum number of concurrent model calls
+            rate_limit (float): Maximum model calls started per second (0 for no limit)
+            mode (str): "gemini" or "offline" for every reading in the batch
+            focus (str): What every reading in the batch concentrates on
+
+        Yields:
+            dict: {"index": position in spreads, "reading": text, "source":
+                where the reading came from (see READING_SOURCES), "ok": False
+                if it is a fallback or one of the mystical messages}
+        """
+        # Group identical spreads so each is only generated once
+        groups = {}
+        for index, cards_data in enumerate(spreads):
+            groups.setdefault(_spread_key(cards_data), []).append(index)
+
+        # Offline readings take microseconds and need no spacing
+        if self._use_offline(mode):
+            rate_limit = 0
+        interval = 1.0 / rate_limit if rate_limit else 0.0
+        next_start = [time.monotonic()]
+        start_lock = threading.Lock()
+
+        def generate(index):
+            # Reserve the next start slot so calls are spaced by the rate limit
+            with start_lock:
+                start_at = max(next_start[0], time.monotonic())
+                next_start[0] = start_at + interval
+            delay = start_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            cards_data = spreads[index]
+            if not isinstance(cards_data, list) or not all(isinstance(card, dict) for card in cards_data):
+                return STARS_MISALIGNED_MESSAGE, "message"
+            # Copy the cards; generate_reading adds their meanings
+            return self.generate_reading([dict(card) for card in cards_data], mode=mode, focus=focus)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            futures = {pool.submit(generate, indices[0]): indices for indices in groups.values()}
+            for future in as_completed(futures):
+                try:
+                    reading, source = future.result()
+                except Exception:
+                    reading, source = COSMIC_DISTURBANCE_MESSAGE, "message"
+                for index in futures[future]:
+                    yield {"index": index, "reading": reading, "source": source, "ok": source in READING_SOURCES}
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            # Enhance cards with detailed meanings from our database
+    def _prepare_reading(self, cards_data, section='general'):
+        """
+        Enrich the cards with their meanings and build the prompt
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            section (str): Meaning section of the reading focus
+
+        Returns:
+            tuple: (prompt, cache_key)
+        """
+        # Enhance cards with detailed meanings from our database
+        with stage("enrich"):
             for card in cards_data:
                 card_name = card.get('name')
                 is_reversed = card.get('isReversed', False)
 
                 # Add detailed meaning from our database
-                card['meaning'] = self._get_card_meaning(card_name, is_reversed)
+                card['meaning'] = self._get_card_meaning(card_name, is_reversed, section)
 
-            # Create prompt with enhanced card data
-            prompt = self._create_tarot_prompt(cards_data)
+        # Create prompt with enhanced card data
+        with stage("prompt"):
+            prompt = self._create_tarot_prompt(cards_data, section)
+            cache_key = make_cache_key(self.model, prompt_hash(prompt))
+        PROMPT_CHARS.observe(len(prompt))
+        return prompt, cache_key
 
-            # Generate content
-            response = self.fortune_teller.generate_content(prompt)
+    def _get_cached_reading(self, cache_key):
+        """
+        Look up a cached reading
 
-            # Clean and return the response
-            summary = remove_special_characters(response.text)
-            return summary
+        Args:
+            cache_key (str): Key returned by _prepare_reading
 
-        except ValueError:
-            # Create a mystical error message without mentioning backend issues
-            return "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nดวงดาวกำลังเคลื่อนตัวในตำแหน่งที่ไม่เอื้ออำนวยต่อการทำนาย หมอขอแนะนำให้คุณลองใหม่อีกครั้งในเวลาที่พลังจักรวาลเป็นใจนะคะ"
+        Returns:
+            str or None: A cached reading, or None if there is none
+        """
+        if not self.reading_cache:
+            return None
+        with stage("cache"):
+            cached = self.reading_cache.get(cache_key)
+        CACHE_LOOKUPS.inc("hit" if cached else "miss")
+        return cached
 
-        except Exception:
-            # Create a mystical error message without mentioning backend issues
-            return "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nพลังงานจักรวาลกำลังแปรปรวน ทำให้หมอไม่สามารถเชื่อมต่อกับพลังแห่งไพ่ทาโร่ได้อย่างสมบูรณ์ หมอขอแนะนำให้คุณลองใหม่อีกครั้งในภายหลังนะคะ เมื่อดวงดาวเรียงตัวในตำแหน่งที่เหมาะสม"
+    async def _get_cached_reading_async(self, cache_key):
+        """
+        Asynchronous version of _get_cached_reading; an on-disk cache is read
+        on a worker thread so the event loop is not held up
+        """
+        if self.reading_cache and self.reading_cache.blocking:
+            return await asyncio.to_thread(self._get_cached_reading, cache_key)
+        return self._get_cached_reading(cache_key)
+
+    def _admit(self, cache_key, client):
+        """
+        Decide how a reading that missed the cache is produced
+
+        Args:
+            cache_key (str): Key returned by _prepare_reading
+            client (str): Rate limit key of the requester, or None
+
+        Returns:
+            tuple: (Flight, leader). The leader makes the model call and
+                publishes the reading to the flight; others follow it.
+
+        Raises:
+            AdmissionRejected: If the client is over its rate limit
+        """
+        flight, leader = self.admission.begin(cache_key, client)
+        if not leader:
+            ADMISSION_DECISIONS.inc("coalesced")
+        return flight, leader
+
+    async def _admit_async(self, cache_key, client):
+        """
+        Asynchronous version of _admit (see AdmissionControl.begin_async)
+        """
+        flight, leader = await self.admission.begin_async(cache_key, client)
+        if not leader:
+            ADMISSION_DECISIONS.inc("coalesced")
+        return flight, leader
+
+    def _rejected_reading(self, cache_key, cards_data, rejection, section='general'):
+        """
+        Answer a reading that may not call the model right now
+
+        Args:
+            cache_key (str): Key returned by _prepare_reading
+            cards_data (list): List of dictionaries containing card information
+            rejection (AdmissionRejected): Why the model was not called
+            section (str): Meaning section of the reading focus
+
+        Returns:
+            tuple: (reading, source), see _fallback_reading
+        """
+        ADMISSION_DECISIONS.inc(rejection.reason)
+        logger.info(f"Reading not sent to the model ({rejection.reason}): {rejection}")
+        return self._fallback_reading(cache_key, cards_data, section=section)
+
+    def _use_offline(self, mode):
+        """
+        Decide whether a reading is composed locally instead of by the model
+
+        Args:
+            mode (str): Mode requested for this reading, or None for the bot's mode
+
+        Returns:
+            bool: True for offline readings (or when there is no model)
+        """
+        return (mode or self.mode) == "offline" or self.fortune_teller is None
 
-    def _create_tarot_prompt(self, cards_data):
+    def offline_reading(self, cards_data, focus=None):
+        """
+        Compose a reading with the offline engine
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            focus (str): Focus or meaning section the reading concentrates on
+
+        Returns:
+            str: The reading, or the mystical error message if it cannot be composed
+        """
+        try:
+            with stage("offline"):
+                section = resolve_focus(focus)
+                reading = self.offline_engine.compose(cards_data, focus=None if section == 'general' else section)
+        except (AttributeError, TypeError) as e:
+            logger.warning(f"Offline reading failed: {type(e).__name__}: {e}")
+            reading = None
+        return reading or COSMIC_DISTURBANCE_MESSAGE
+
+    def _offline_with_source(self, cards_data, section, source):
+        """
+        Compose an offline reading and tell where it came from
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+            section (str): Meaning section of the reading focus
+            source (str): Source reported for the reading
+
+        Returns:
+            tuple: (reading, source), or "message" as the source if no
+                reading could be composed
+        """
+        reading = self.offline_reading(cards_data, section)
+        return reading, "message" if reading in FALLBACK_MESSAGES else source
+
+    def _fallback_reading(self, cache_key, cards_data, error=None, section='general'):
+        """
+        Choose what to show when the model could not produce a reading
+
+        A previously generated reading for the same spread is served if the
+        cache or the reading history has one, otherwise a reading from the
+        offline engine.
+
+        Args:
+            cache_key (str): Key returned by _prepare_reading, or None
+            cards_data (list): List of dictionaries containing card information
+            error (Exception): The failure, counted in the metrics
+            section (str): Meaning section of the reading focus
+
+        Returns:
+            tuple: (reading, source), the source being "fallback_cache",
+                "fallback_history" or "fallback_offline" ("message" if the
+                offline engine could not compose one either)
+        """
+        if error is not None:
+            READING_ERRORS.inc(type(error).__name__)
+        if cache_key and self.reading_cache:
+            cached = self.reading_cache.get_any(cache_key)
+            if cached:
+                FALLBACKS.inc("cache")
+                return cached, "fallback_cache"
+        if self.history:
+            try:
+                previous = self.history.latest(spread_hash(cards_data, section))
+            except Exception as e:
+                logger.warning(f"Reading history lookup failed: {type(e).__name__}: {e}")
+                previous = None
+            if previous:
+                FALLBACKS.inc("history")
+                return previous, "fallback_history"
+        FALLBACKS.inc("offline")
+        return self._offline_with_source(cards_data, section, "fallback_offline")
+
+    def remember_reading(self, session, cards_data, focus, reading, source=None):
+        """
+        Add a served reading to the history, without waiting for the disk
+
+        Messages that are not readings (too few cards, errors) and readings
+        that stop short (see INCOMPLETE_SOURCES) are skipped.
+
+        Args:
+            session (str): X-Session-ID of the visitor, or None
+            cards_data (list): List of dictionaries containing card information
+            focus (str): Focus the reading was asked for
+            reading (str): The reading sent to the visitor
+            source (str): Where the reading came from (see READING_SOURCES)
+        """
+        if not self.history or not reading or reading in FALLBACK_MESSAGES or reading == NOT_ENOUGH_CARDS_MESSAGE:
+            return
+        if source in INCOMPLETE_SOURCES:
+            return
+        self.history.record(session, cards_data, resolve_focus(focus), reading)
+
+    def _generation_options(self, cards_data):
+        """
+        Build the generation settings of a model call for a spread
+
+        Args:
+            cards_data (list): List of dictionaries containing card information
+
+        Returns:
+            dict: Keyword arguments for generate_content, limiting the reply
+                to a length that suits the size of the spread
+        """
+        limit = output_token_limit(len(cards_data))
+        if limit is None:
+            return {}
+        return {"generation_config": {"max_output_tokens": limit}}
+
+    def _record_tokens(self, prompt, text, response=None):
+        """
+        Record the tokens a model call used
+
+        The counts reported by the API are used when the response has them,
+        and estimated from the text otherwise.
+
+        Args:
+            prompt (str): The prompt sent to the model
+            text (str): The reply
+            response: The response, or the last chunk of a stream
+        """
+        usage = reported_usage(response) if response is not None else None
+        if usage is None:
+            usage = (self.prompt_template.input_tokens(prompt), estimate_tokens(text))
+        record_tokens(*usage)
+
+    def _check_truncated(self, response):
+        """
+        Tell whether the model cut a reply off at max_output_tokens, and log it
+
+        Args:
+            response: The response, or the last chunk of a stream
+
+        Returns:
+            bool: True if the reply was cut off
+        """
+        if response is None or not hit_output_limit(response):
+            return False
+        logger.warning("Reading cut off at max_output_tokens; it will not be cached or kept")
+        return True
+
+    def _clean_reading(self, text):
+        """
+        Clean the model output
+
+        Args:
+            text (str): Raw text returned by the model
+
+        Returns:
+            str: The cleaned reading
+        """
+        with stage("sanitize"):
+            summary = remove_special_characters(text)
+        RESPONSE_CHARS.observe(len(summary))
+        return summary
+
+    def _cache_reading(self, cache_key, summary):
+        """
+        Store a finished reading in the cache, if caching is enabled
+
+        Args:
+            cache_key (str): Key returned by _prepare_reading
+            summary (str): The cleaned reading
+        """
+        if self.reading_cache:
+            self.reading_cache.put(cache_key, summary)
+
+    async def _cache_reading_async(self, cache_key, summary):
+        """
+        Asynchronous version of _cache_reading; an on-disk cache is written
+        on a worker thread so the event loop is not held up
+        """
+        if self.reading_cache and self.reading_cache.blocking:
+            await asyncio.to_thread(self._cache_reading, cache_key, summary)
+        else:
+            self._cache_reading(cache_key, summary)
+
+    def _create_tarot_prompt(self, cards_data, section='general'):
         """
         Create a detailed prompt for the Gemini model based on the tarot cards
 
         Args:
             cards_data (list): List of dictionaries containing card information
+            section (str): Meaning section of the reading focus
 
         Returns:
             str: A formatted prompt for the Gemini model
         """
-        prompt = """
-        คุณคือหมอดูไพ่ทาโร่ที่มีประสบการณ์สูง พูดจาด้วยน้ำเสียงลึกลับ มีความรู้เรื่องโหราศาสตร์และไพ่ทาโร่อย่างลึกซึ้ง
-        ใช้คำพูดแบบหมอดูไทย เช่น "ดวงของคุณ..." "ไพ่บ่งบอกว่า..." "พลังงานที่ส่งมา..." "ดวงดาวกำลังบอกว่า..."
+        return self.prompt_template.render(cards_data, self.find_combinations(cards_data), section, self.prompt_budget)
 
-        ห้ามพูดถึงเรื่องเบื้องหลังหรือ Backend หรือการรอข้อมูล หรือการประมวลผล ให้พูดเหมือนหมอดูจริงๆ ที่มีความรู้เรื่องไพ่ทาโร่อย่างลึกซึ้ง
+    def find_combinations(self, cards_data):
+        """
+        Find the suggested card combinations present in a spread
 
-        โปรดวิเคราะห์ไพ่ทาโร่ต่อไปนี้และให้คำทำนายโดยรวมที่เชื่อมโยงความหมายของไพ่ทั้งหมดเข้าด้วยกัน
-        ใช้ภาษาไทยในการตอบและพยายามให้คำทำนายที่มีความหวังและเป็นประโยชน์ต่อผู้ถาม
+        Args:
+            cards_data (list): List of dictionaries containing card information
 
-        ไพ่ที่ถูกเปิดในการทำนายครั้งนี้:
+        Returns:
+            list: Matches from CombinationIndex.find (empty for malformed input)
         """
+        try:
+            return self.card_store.combinations.find(cards_data)
+        except (AttributeError, TypeError):
+            return []
 
-        for card in cards_data:
-            card_status = "กลับหัว" if card.get("isReversed") else "หงายขึ้น"
-            prompt += f"\n- ตำแหน่ง '{card.get('position')}': ไพ่ {card.get('name')} ({card_status})"
-            prompt += f"\n  ความหมาย: {card.get('meaning')}"
+def gemini_module():
+    """
+    Import the Gemini client library on first use
 
-            # Add keywords if available
-            if card.get('name') in self.tarot_data:
-                card_data = self.tarot_data[card.get('name')]
-                if card.get("isReversed") and 'keywords' in card_data and 'reversed' in card_data['keywords']:
-                    prompt += f"\n  คำสำคัญ: {card_data['keywords']['reversed']}"
-                elif not card.get("isReversed") and 'keywords' in card_data and 'upright' in card_data['keywords']:
-                    prompt += f"\n  คำสำคัญ: {card_data['keywords']['upright']}"
+    google.generativeai (with grpc and protobuf) takes most of the time to
+    import this module, and offline readings, the fake model and tools that
+    only need the card data never use it, so it is imported when the first
+    real client is built.
 
-        prompt += """
+    Returns:
+        module: google.generativeai
+    """
+    import google.generativeai as genai
+    return genai
 
-        โปรดสรุปคำทำนายทั้งหมดในรูปแบบของหมอดูไทย โดยเชื่อมโยงความหมายของไพ่แต่ละใบเข้าด้วยกัน
-        และให้คำแนะนำที่เป็นประโยชน์แก่ผู้ถาม ความยาวประมาณ 3-4 ย่อหน้า
+def _supports_system_instruction(genai):
+    """
+    Check whether the installed Gemini client accepts a system instruction
 
-        ห้ามพูดถึงเรื่องเบื้องหลังหรือ Backend หรือการรอข้อมูล หรือการประมวลผล ให้พูดเหมือนหมอดูจริงๆ ที่มีความรู้เรื่องไพ่ทาโร่อย่างลึกซึ้ง
+    Args:
+        genai (module): google.generativeai
 
-        เริ่มต้นด้วยคำทักทายแบบหมอดู และจบด้วยคำแนะนำหรือกำลังใจ
-        """
+    Returns:
+        bool: True if GenerativeModel takes a system_instruction argument
+    """
+    try:
+        return 'system_instruction' in inspect.signature(genai.GenerativeModel).parameters
+    except (TypeError, ValueError):
+        return False
 
-        return prompt
+
+def _spread_key(cards_data):
+    """
+    Build a key identifying a spread by its cards, positions and orientations
+
+    Args:
+        cards_data (list): List of dictionaries containing card information
+
+    Returns:
+        str: Key shared by identical spreads
+    """
+    if not isinstance(cards_data, list):
+        return make_cache_key(repr(cards_data))
+    return make_cache_key([
+        (card.get('name'), card.get('position'), bool(card.get('isReversed', False)))
+        if isinstance(card, dict) else repr(card)
+        for card in cards_data
+    ])
+
+
+_bot = None
+_bot_lock = threading.Lock()
+
+
+def get_tarot_bot():
+    """
+    Return the process-wide TarotBot, creating it on first use
+
+    The bot (Gemini client and card store) is shared by all requests handled
+    by this worker process instead of being rebuilt for every reading.
+
+    Returns:
+        TarotBot: The shared tarot bot
+    """
+    global _bot
+    if _bot is None:
+        with _bot_lock:
+            if _bot is None:
+                _bot = TarotBot()
+                logger.info(f"Tarot bot ready in {_bot.init_time * 1000:.1f} ms")
+    return _bot
+
+
+def close_tarot_bot():
+    """
+    Write out what the process-wide TarotBot still buffers (the reading
+    history) before the process exits; does nothing if it was never created
+    """
+    bot = _bot
+    if bot is not None and bot.history:
+        bot.history.close()
+
+
+def reload_tarot_bot():
+    """
+    Reload the card data and replace the process-wide TarotBot
+
+    Returns:
+        TarotBot: The new shared tarot bot
+    """
+    global _bot
+    store = reload_card_store()
+    # The reading history outlives the bot, so readings still buffered are kept
+    bot = TarotBot(card_store=store, history=_bot.history if _bot is not None else None)
+    with _bot_lock:
+        _bot = bot
+    logger.info("Tarot bot reloaded")
+    return bot
+
+def readiness():
+    """
+    Check that this process can serve readings
+
+    Creates the shared bot if needed. The model client counts as ready while
+    its circuit breaker is open, as readings are then served from the
+    fallbacks; without a model client only offline mode is ready.
+
+    Returns:
+        tuple: (ready, checks) where checks maps "card_store" and
+            "model_client" to a dict with an "ok" flag and details
+    """
+    checks = {}
+    try:
+        store = get_card_store()
+        checks["card_store"] = {"ok": bool(store.names) and store.combinations is not None, "cards": len(store.names)}
+    except Exception as e:
+        checks["card_store"] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    try:
+        bot = get_tarot_bot()
+        if bot.fortune_teller is not None:
+            checks["model_client"] = {"ok": True, "mode": bot.mode, "breaker": bot.fortune_teller.stats()["breaker"]}
+        else:
+            checks["model_client"] = {"ok": bot.mode == "offline", "mode": bot.mode}
+    except Exception as e:
+        checks["model_client"] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return all(check["ok"] for check in checks.values()), checks
+
+
+def _bot_metrics():
+    """
+    Report the reading cache and model client counters on /metrics
+
+    Yields:
+        tuple: (name, kind, help, samples) as expected by Registry.add_collector
+    """
+    bot = _bot
+    if bot is None:
+        return
+    if bot.reading_cache:
+        cache = bot.reading_cache.stats()
+        yield ("tarot_reading_cache_entries", "gauge", "Readings held in the cache",
+               [({"backend": cache["backend"]}, cache["entries"])])
+        yield ("tarot_reading_cache_evictions_total", "counter", "Readings evicted from the cache",
+               [({"backend": cache["backend"]}, cache["evictions"])])
+    if bot.fortune_teller:
+        client = bot.fortune_teller.stats()
+        yield ("tarot_model_calls_total", "counter", "Model client events (calls, retries, hedges, failures, timeouts, rejected)",
+               [({"event": event}, client[event]) for event in ("calls", "retries", "hedges", "failures", "timeouts", "rejected")])
+        yield ("tarot_model_breaker_open", "gauge", "1 while the model circuit breaker is open",
+               [({}, 1 if client["breaker"] == "open" else 0)])
+    admission = bot.admission.stats()
+    yield ("tarot_admission_active", "gauge", "Model call slots in use",
+           [({}, admission["active"])])
+    yield ("tarot_admission_waiting", "gauge", "Readings queued for a model call slot",
+           [({}, admission["waiting"])])
+    if bot.history:
+        history = bot.history.stats()
+        yield ("tarot_history_readings_total", "counter", "Readings sent to the history, by outcome (written, dropped)",
+               [({"outcome": outcome}, history[outcome]) for outcome in ("written", "dropped")])
+        yield ("tarot_history_pending", "gauge", "Readings waiting to be written to the history",
+               [({}, history["pending"])])
+        yield ("tarot_history_file_bytes", "gauge", "Size of the reading history database",
+               [({}, history["file_bytes"])])
+    yield ("tarot_prompts_truncated_total", "counter",
+           "Prompts shortened to fit the token budget, by what was cut (meanings, combinations)",
+           [({"part": part}, count) for part, count in bot.prompt_template.truncated.items()])
+
+
+metrics_registry.add_collector(_bot_metrics)
+
+
+@app.before_request
+def start_request_timing():
+    """Start timing the request and assign it an ID"""
+    g.request_context = start_request(request.endpoint or "unknown", request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def add_request_id(response):
+    """Send the request ID back to the client"""
+    context = g.get('request_context')
+    if context is not None:
+        context.status = response.status_code
+        response.headers['X-Request-ID'] = context.request_id
+    return response
+
+
+@app.teardown_request
+def finish_request_timing(exc=None):
+    """Record the request duration (after streamed bodies have been sent)"""
+    finish_request(g.pop('request_context', None))
 
 # Health check endpoint
 @app.route('/api/tarot-reading', methods=['HEAD'])
@@ -210,36 +1177,212 @@ def health_check():
     """
     return "", 200
 
+# Readiness probe
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once this worker's card store and model client are
+    initialized, 503 with the failing checks otherwise
+    """
+    ok, checks = readiness()
+    return jsonify({"ready": ok, "pid": os.getpid(), "checks": checks}), 200 if ok else 503
+
+# Status endpoint
+@app.route('/api/status', methods=['GET'])
+def status():
+    """
+    Report the load time and memory footprint of the shared tarot bot
+    """
+    if _bot is None:
+        return jsonify({"ready": False, "card_store": get_card_store().stats()})
+    return jsonify({"ready": True, **_bot.stats()})
+
+# Reading history endpoint
+@app.route('/api/readings/recent', methods=['GET'])
+def recent_readings():
+    """
+    Return the most recent readings of the visitor identified by the
+    X-Session-ID header, newest first (?limit=N, at most 50)
+    """
+    session = request.headers.get('X-Session-ID')
+    if not session:
+        return jsonify({"error": "X-Session-ID header required"}), 400
+    bot = get_tarot_bot()
+    if not bot.history:
+        return jsonify({"readings": []})
+    limit = request.args.get('limit', default=10, type=int)
+    return jsonify({"readings": bot.history.recent(session, limit)})
+
+# Metrics endpoint
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Report request, stage, cache and model metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 # API endpoint for tarot reading
 @app.route('/api/tarot-reading', methods=['POST'])
 def tarot_reading():
     try:
-        data = request.json
-        cards_data = data.get('cards', [])
+        with stage("parse"):
+            data = request.json
+            cards_data = data.get('cards', [])
 
         if not cards_data:
             # Mystical error message for no cards
             return jsonify({
-                "reading": "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nหมอต้องการไพ่เพื่อทำนาย โปรดกดปุ่มสุ่มไพ่เพื่อให้หมอได้ดูดวงให้คุณนะคะ"
+                "reading": NO_CARDS_MESSAGE,
+                "source": "message"
             })
 
-        # Initialize tarot bot with card data
-        bot = TarotBot()
-        reading = bot.generate_reading_summary(cards_data)
+        # Use the shared tarot bot for this worker process
+        bot = get_tarot_bot()
+        reading, source = bot.generate_reading(cards_data, mode=data.get('mode'), client=_request_client(),
+                                               focus=data.get('focus'))
+        bot.remember_reading(request.headers.get('X-Session-ID'), cards_data, data.get('focus'), reading, source)
 
-        return jsonify({"reading": reading})
+        with stage("serialize"):
+            return jsonify({"reading": reading, "source": source, "combinations": bot.find_combinations(cards_data)})
 
     except ValueError:
         # Mystical error message without mentioning backend issues
         return jsonify({
-            "reading": "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nดวงดาวกำลังเคลื่อนตัวในตำแหน่งที่ไม่เอื้ออำนวยต่อการทำนาย หมอขอแนะนำให้คุณลองใหม่อีกครั้งในเวลาที่พลังจักรวาลเป็นใจนะคะ"
+            "reading": STARS_MISALIGNED_MESSAGE,
+            "source": "message"
         })
     except Exception:
         # Mystical error message without mentioning backend issues
         return jsonify({
-            "reading": "สวัสดีค่ะคุณผู้ชม ดิฉันหมอดูพรพิมล ยินดีที่ได้อ่านไพ่ทาโร่ให้คุณในวันนี้ค่ะ\n\nพลังงานจักรวาลกำลังแปรปรวน ทำให้หมอไม่สามารถเชื่อมต่อกับพลังแห่งไพ่ทาโร่ได้อย่างสมบูรณ์ หมอขอแนะนำให้คุณลองใหม่อีกครั้งในภายหลังนะคะ เมื่อดวงดาวเรียงตัวในตำแหน่งที่เหมาะสม"
+            "reading": COSMIC_DISTURBANCE_MESSAGE,
+            "source": "message"
         })
 
+def _request_client():
+    """
+    Rate limit key of the client making the current request
+
+    Returns:
+        str: See admission.client_key
+    """
+    forwarded_for = ','.join(request.headers.getlist('X-Forwarded-For'))
+    return client_key(request.remote_addr, request.headers.get('X-Session-ID'), forwarded_for or None)
+
+
+def format_sse(data, event=None):
+    """
+    Format one Server-Sent Event
+
+    Args:
+        data (dict): JSON payload of the event
+        event (str): Optional event name
+
+    Returns:
+        str: The encoded event, terminated by a blank line
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_reading_events(bot, cards_data, mode=None, client=None, focus=None, session=None):
+    """
+    Turn a streamed reading into Server-Sent Events
+
+    Each piece of text is sent as a data event. A final "done" event reports
+    the time to the first piece, the total generation time in milliseconds,
+    where the reading came from (see READING_SOURCES) and the suggested card
+    combinations found in the spread.
+
+    Args:
+        bot (TarotBot): The bot generating the reading
+        cards_data (list): Cards sent by the client
+        mode (str): "gemini" or "offline", or None for the bot's mode
+        client (str): Rate limit key of the requester
+        focus (str): What the reading concentrates on, e.g. "love"
+        session (str): X-Session-ID of the visitor, for the reading history
+
+    Yields:
+        str: Encoded events
+    """
+    started = time.perf_counter()
+    first_chunk_ms = None
+    pieces = []
+    outcome = {}
+
+    for piece in bot.stream_reading_summary(cards_data, mode=mode, client=client, focus=focus, outcome=outcome):
+        if first_chunk_ms is None:
+            first_chunk_ms = (time.perf_counter() - started) * 1000
+        pieces.append(piece)
+        yield format_sse({"text": piece})
+    bot.remember_reading(session, cards_data, focus, ''.join(pieces), outcome.get("source"))
+
+    total_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Streamed reading: first chunk {first_chunk_ms or 0:.0f} ms, total {total_ms:.0f} ms")
+    yield format_sse({
+        "first_chunk_ms": round(first_chunk_ms or 0, 1),
+        "total_ms": round(total_ms, 1),
+        "source": outcome.get("source"),
+        "combinations": bot.find_combinations(cards_data),
+    }, event="done")
+
+# Streaming API endpoint for tarot reading
+@app.route('/api/tarot-reading/stream', methods=['POST'])
+def tarot_reading_stream():
+    """
+    Stream the reading as Server-Sent Events while the model generates it
+    """
+    data = request.get_json(silent=True) or {}
+    cards_data = data.get('cards', [])
+
+    if not cards_data:
+        events = [format_sse({"text": NO_CARDS_MESSAGE}), format_sse({"source": "message"}, event="done")]
+    else:
+        try:
+            bot = get_tarot_bot()
+            events = stream_with_context(stream_reading_events(bot, cards_data, data.get('mode'), _request_client(),
+                                                               data.get('focus'), request.headers.get('X-Session-ID')))
+        except ValueError:
+            events = [format_sse({"text": STARS_MISALIGNED_MESSAGE}), format_sse({"source": "message"}, event="done")]
+
+    return Response(events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+# Batch API endpoint for tarot readings
+@app.route('/api/tarot-reading/batch', methods=['POST'])
+def tarot_reading_batch():
+    """
+    Generate readings for many spreads, streamed back as NDJSON
+
+    The body is {"spreads": [[card, ...], ...]} (each spread may also be given
+    as {"cards": [...]}). One JSON line is sent per spread as soon as its
+    reading is ready: {"index": ..., "reading": ..., "source": ..., "ok": ...},
+    with "ok" false when a fallback or a mystical message was served instead
+    of the reading asked for.
+    """
+    data = request.get_json(silent=True) or {}
+    spreads = data.get('spreads', [])
+    if not isinstance(spreads, list):
+        spreads = []
+    if len(spreads) > BATCH_MAX_SPREADS:
+        return jsonify({"error": f"At most {BATCH_MAX_SPREADS} spreads per batch"}), 413
+
+    spreads = [spread.get('cards', []) if isinstance(spread, dict) else spread for spread in spreads]
+
+    def lines():
+        try:
+            bot = get_tarot_bot()
+        except ValueError:
+            for index in range(len(spreads)):
+                yield json.dumps({"index": index, "reading": STARS_MISALIGNED_MESSAGE, "source": "message", "ok": False},
+                                 ensure_ascii=False) + "\n"
+            return
+
+        for result in bot.generate_readings_batch(spreads, mode=data.get('mode'), focus=data.get('focus')):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
 # Run the Flask app if executed directly
 if __name__ == "__main__":
+    # Load the card store before serving so the first reading doesn't pay for it
+    get_card_store()
     app.run(debug=True, port=5000)
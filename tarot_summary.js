@@ -14,6 +14,13 @@ let currentReadingCards = [];
 // Debug mode flag - set to true for troubleshooting
 const DEBUG = true;
 
+// localStorage key of the visitor's session ID, sent as X-Session-ID so the
+// server keeps the visitor's readings together in its reading history
+const SESSION_STORAGE_KEY = 'tarotSessionId';
+
+// Session ID for this page when localStorage is unavailable
+let pageSessionId = null;
+
 /**
  * Custom logger function that only logs in debug mode
  * @param {string} message - The message to log
@@ -29,6 +36,110 @@ function debugLog(message, data) {
   }
 }
 
+/**
+ * Create a random session ID
+ * @returns {string} A UUID, or 32 random hex digits where randomUUID is unavailable
+ */
+function createSessionId() {
+  if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+    return window.crypto.randomUUID();
+  }
+  const bytes = new Uint8Array(16);
+  window.crypto.getRandomValues(bytes);
+  return Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+/**
+ * Return the visitor's session ID, creating and storing it on first use
+ * @returns {string} The session ID
+ */
+function getSessionId() {
+  try {
+    let sessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+    if (!sessionId) {
+      sessionId = createSessionId();
+      localStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+    }
+    return sessionId;
+  } catch (error) {
+    // Storage is blocked (e.g. private browsing): keep an ID for this page only
+    if (!pageSessionId) {
+      pageSessionId = createSessionId();
+    }
+    return pageSessionId;
+  }
+}
+
+/**
+ * Return the URL of the reading API
+ * @returns {string} The /api/tarot-reading URL for the current page
+ */
+function getReadingApiUrl() {
+  if (!window.tarotApiUrl) {
+    window.tarotApiUrl = window.location.protocol === 'file:'
+      ? 'http://localhost:5000/api/tarot-reading'
+      : window.location.protocol === 'http:' && window.location.port === '8000'
+        ? 'http://localhost:5000/api/tarot-reading'
+        : '/api/tarot-reading';
+  }
+  return window.tarotApiUrl;
+}
+
+/**
+ * Fetch the visitor's most recent readings from the reading history
+ * @param {number} limit - Number of readings to fetch
+ * @returns {Promise<Array>} Readings, newest first (empty if there are none)
+ */
+async function fetchRecentReadings(limit = 1) {
+  const url = getReadingApiUrl().replace(/\/api\/tarot-reading$/, '/api/readings/recent');
+  const response = await fetch(`${url}?limit=${limit}`, {
+    headers: { 'X-Session-ID': getSessionId() },
+    cache: 'no-store',
+  });
+  if (!response.ok) {
+    throw new Error('Network response was not ok: ' + response.status);
+  }
+  const data = await response.json();
+  return data.readings || [];
+}
+
+/**
+ * Show the "last reading" button if the visitor has a reading in the history
+ */
+function updateLastReadingButton() {
+  if (window.location.protocol === 'file:') return;
+
+  fetchRecentReadings(1)
+    .then(readings => {
+      const button = document.getElementById('lastReadingBtn');
+      if (button && readings.length > 0) {
+        button.classList.remove('hidden');
+      }
+    })
+    .catch(error => debugLog('Could not check for a previous reading', { error: error.message }));
+}
+
+/**
+ * Show the visitor's most recent reading in the summary panel
+ */
+function showLastReading() {
+  debugLog('Showing the last reading');
+  showSummaryPanel();
+
+  fetchRecentReadings(1)
+    .then(readings => {
+      if (readings.length > 0) {
+        displaySummary(readings[0].reading);
+      } else {
+        displaySummaryError("ยังไม่มีคำทำนายครั้งก่อนค่ะ โปรดสุ่มไพ่และกด 'สรุปคำทำนาย' เพื่อให้หมอดูทำนายให้คุณ");
+      }
+    })
+    .catch(error => {
+      console.error('Error fetching the last reading:', error);
+      displaySummaryError("ไม่สามารถเรียกคำทำนายครั้งก่อนได้ โปรดตรวจสอบว่าเซิร์ฟเวอร์ Python กำลังทำงานอยู่");
+    });
+}
+
 /**
  * Initialize the tarot summary functionality
  */
@@ -41,6 +152,7 @@ function initTarotSummary() {
   createSummaryButton();
   summaryElementsCreated = true;
   debugLog('Summary elements created on initialization');
+  updateLastReadingButton();
 
   function lazyCreateSummaryElements() {
     if (summaryElementsCreated) {
@@ -130,6 +242,18 @@ function createSummaryButton() {
   // Add the button to the container
   buttonContainer.appendChild(summaryButton);
 
+  // Button that shows the visitor's previous reading, revealed once the
+  // reading history has one
+  const lastReadingButton = document.createElement('button');
+  lastReadingButton.id = 'lastReadingBtn';
+  lastReadingButton.className = 'hidden ml-3 px-4 py-3 bg-mystic-purple/40 text-gold/80 rounded-xl border border-gold/30 hover:text-light-gold hover:bg-mystic-purple/60 transition-all duration-300 font-cinzel text-sm flex items-center';
+  lastReadingButton.innerHTML = `
+    <i class="fas fa-history mr-2 text-xs"></i>
+    <span>คำทำนายครั้งล่าสุด</span>
+  `;
+  lastReadingButton.addEventListener('click', showLastReading);
+  buttonContainer.appendChild(lastReadingButton);
+
   // Try multiple insertion strategies to ensure the button is added to the DOM
   let buttonAdded = false;
 
@@ -448,21 +572,18 @@ function requestReadingSummary(retryCount = 0, maxRetries = 3, retryDelay = 2000
 
     debugLog('Sending API request to backend', { cards });
 
-    if (!window.tarotApiUrl) {
-      window.tarotApiUrl = window.location.protocol === 'file:'
-        ? 'http://localhost:5000/api/tarot-reading'
-        : window.location.protocol === 'http:' && window.location.port === '8000'
-          ? 'http://localhost:5000/api/tarot-reading'
-          : '/api/tarot-reading';
-    }
-
-    const apiUrl = window.tarotApiUrl;
+    const apiUrl = getReadingApiUrl();
     debugLog(`Using API URL: ${apiUrl}`);
 
-    fetch(apiUrl, {
+    // Prefer the streaming endpoint so the reading appears while it is written
+    const useStreaming = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+    const requestUrl = useStreaming ? `${apiUrl}/stream` : apiUrl;
+
+    fetch(requestUrl, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-Session-ID': getSessionId(),
       },
       body: JSON.stringify({ cards: cards }),
       cache: 'no-cache',
@@ -474,12 +595,17 @@ function requestReadingSummary(retryCount = 0, maxRetries = 3, retryDelay = 2000
       if (!response.ok) {
         throw new Error('Network response was not ok: ' + response.status);
       }
+      if (useStreaming && response.body) {
+        return readReadingStream(response).then(reading => ({ reading }));
+      }
       return response.json();
     })
     .then(data => {
       debugLog('Successfully received reading data', data);
       requestAnimationFrame(() => {
         displaySummary(data.reading);
+        const lastReadingButton = document.getElementById('lastReadingBtn');
+        if (lastReadingButton) lastReadingButton.classList.remove('hidden');
       });
     })
     .catch(error => {
@@ -520,6 +646,64 @@ function requestReadingSummary(retryCount = 0, maxRetries = 3, retryDelay = 2000
   }, 0); // End of setTimeout - use 0 to defer but execute as soon as possible
 }
 
+/**
+ * Read a Server-Sent Events reading stream, showing the text as it arrives
+ * @param {Response} response The fetch response from the streaming endpoint
+ * @returns {Promise<string>} The complete reading text
+ */
+async function readReadingStream(response) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+  let reading = '';
+  let renderScheduled = false;
+
+  const scheduleRender = () => {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+      renderScheduled = false;
+      displaySummary(reading);
+    });
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (eventName === 'done') {
+        debugLog('Reading stream finished', payload);
+      } else if (payload.text) {
+        reading += payload.text;
+        scheduleRender();
+      }
+    }
+  }
+
+  if (!reading) {
+    throw new Error('Empty reading stream');
+  }
+  return reading;
+}
+
 /**
  * Display the reading summary in the panel
  * @param {string} summary The reading summary text
@@ -0,0 +1,6 @@
+"""
+Tests for the Tarot Bot
+
+Run them from the project root:
+    python -m pytest
+"""
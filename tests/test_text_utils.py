@@ -0,0 +1,89 @@
+"""
+Tests for text_utils: the sanitizer against the original implementation, and
+StreamingSanitizer against the one-shot result however the text is split
+"""
+
+import random
+
+import pytest
+
+from text_utils import remove_special_characters, StreamingSanitizer
+from benchmarks.sanitizer import reference_remove_special_characters, SPECIAL_PIECES, PLAIN_PIECES
+
+# Partial tokens, and tokens broken up by characters that are removed first
+PARTIAL_PIECES = [
+    '<|im_', '<|end', 'oftext|>', '_start|>', 'im_sep|>', '_end|>',
+    '<|im_\u200b', '\u200bend|>', '<|\u200dim_sep|>', '<\ufffd|endoftext|>', '<|im_\u0000end|>',
+]
+PIECES = SPECIAL_PIECES + PLAIN_PIECES + PARTIAL_PIECES
+
+
+def random_text(rng, pieces=40):
+    return ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, pieces)))
+
+
+def stream(text, sizes):
+    """Feed text to a StreamingSanitizer in chunks of the given sizes"""
+    sanitizer = StreamingSanitizer()
+    output = []
+    position = 0
+    for size in sizes:
+        if position >= len(text):
+            break
+        output.append(sanitizer.feed(text[position:position + size]))
+        position += size
+    output.append(sanitizer.feed(text[position:]))
+    output.append(sanitizer.flush())
+    return ''.join(output)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', ''),
+    ('ไพ่ทาโร่', 'ไพ่ทาโร่'),
+    ('ดวง\u200bดาว<|im_end|>', 'ดวงดาว'),
+    ('a b c', 'a b c'),
+    ('<|im_\u200bend|>', ''),
+    ('<|im_<|im_start|>end|>', ''),
+    ('<|im_\u0000end|>', '<|im_end|>'),
+    ('a < b | c > d', 'a < b | c > d'),
+])
+def test_remove_special_characters(text, expected):
+    assert remove_special_characters(text) == expected
+
+
+def test_matches_original_implementation():
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = random_text(rng)
+        assert remove_special_characters(text) == reference_remove_special_characters(text), text
+
+
+def test_token_split_by_zero_width_character():
+    sanitizer = StreamingSanitizer()
+    output = sanitizer.feed("abc<|im_\u200b") + sanitizer.feed("end|>def") + sanitizer.flush()
+    assert output == remove_special_characters("abc<|im_\u200bend|>def") == "abcdef"
+
+
+def test_token_joined_by_removing_another():
+    # Removing <|im_start|> joins "<|im_" and "end|>" into a token
+    text = "ดวง<|im_<|im_start|>end|>ดาว"
+    for split in range(len(text) + 1):
+        assert stream(text, [split]) == "ดวงดาว"
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_streaming_matches_one_shot(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        text = random_text(rng)
+        sizes = [rng.randint(1, 8) for _ in range(len(text))]
+        assert stream(text, sizes) == remove_special_characters(text), text
+
+
+def test_streaming_sends_plain_text_straight_away():
+    sanitizer = StreamingSanitizer()
+    assert sanitizer.feed("ไพ่ใบนี้ ") == "ไพ่ใบนี้ "
+    assert sanitizer.feed("a < b") == "a < b"
+    assert sanitizer.feed("<|im") == ""
+    assert sanitizer.feed("_end|>ค่ะ") == "ค่ะ"
+    assert sanitizer.flush() == ""
@@ -0,0 +1,134 @@
+"""
+Token Budgeting for Gemini Calls
+
+Estimates how many tokens a text costs without asking the model, so a
+prompt can be measured (and shortened) before it is sent, and sizes the
+reply limit (max_output_tokens) to the spread.
+
+The estimate counts ASCII and other characters separately: Gemini's
+tokenizer averages about four characters of English or whitespace per
+token, and about three of Thai. It is meant for budgeting and metrics, and
+is usually within 15% of the real count. When the client library reports
+the real usage with a response, that is recorded instead.
+
+A three-card reading of three or four paragraphs runs to about 3000 Thai
+characters, roughly 1000 tokens, so the defaults leave room for that and
+more. A reply the model still cuts off at the limit (finish reason
+MAX_TOKENS, see hit_output_limit) is served but not cached or kept.
+
+Settings (environment variables):
+    PROMPT_TOKEN_BUDGET: Most input tokens per reading, system instruction
+        included. Card meanings are shortened to fit; 0 turns this off (default 4000)
+    PROMPT_MIN_MEANING_TOKENS: Fewest tokens kept of each card's meaning (default 40)
+    OUTPUT_TOKENS_BASE: Reply tokens allowed for any spread (default 1024)
+    OUTPUT_TOKENS_PER_CARD: Extra reply tokens for each card in the spread (default 128)
+    MAX_OUTPUT_TOKENS: Upper limit of the reply; 0 leaves it to the model (default 4096)
+"""
+
+import os
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 4000))
+PROMPT_MIN_MEANING_TOKENS = int(os.getenv("PROMPT_MIN_MEANING_TOKENS", 40))
+OUTPUT_TOKENS_BASE = int(os.getenv("OUTPUT_TOKENS_BASE", 1024))
+OUTPUT_TOKENS_PER_CARD = int(os.getenv("OUTPUT_TOKENS_PER_CARD", 128))
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", 4096))
+
+# FinishReason.MAX_TOKENS of the Gemini API
+MAX_TOKENS_FINISH = 2
+
+# Average characters per token
+ASCII_CHARS_PER_TOKEN = 4
+OTHER_CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many tokens the model counts for a text
+
+    Args:
+        text (str): The text
+
+    Returns:
+        int: Estimated token count (0 for empty text)
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    other_chars = len(text) - ascii_chars
+    return -(-ascii_chars // ASCII_CHARS_PER_TOKEN) + -(-other_chars // OTHER_CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Shorten a text to its opening clauses so it fits in a number of tokens
+
+    Thai separates clauses with spaces, so the text is cut at the last space
+    before the limit.
+
+    Args:
+        text (str): The text
+        max_tokens (int): Most tokens to keep
+
+    Returns:
+        str: The text, or its beginning if it was too long
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    limit = len(text) * max(0, max_tokens) // tokens
+    cut = text.rfind(' ', 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip()
+
+
+def output_token_limit(card_count):
+    """
+    Choose max_output_tokens for a spread
+
+    A reading covers every card, so the reply may grow with the spread, up
+    to MAX_OUTPUT_TOKENS.
+
+    Args:
+        card_count (int): Cards in the spread
+
+    Returns:
+        int or None: The reply limit, or None to leave it to the model
+    """
+    if MAX_OUTPUT_TOKENS <= 0:
+        return None
+    return min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_BASE + OUTPUT_TOKENS_PER_CARD * card_count)
+
+
+def hit_output_limit(response):
+    """
+    Tell whether the model stopped a reply because it reached max_output_tokens
+
+    Args:
+        response: A GenerateContentResponse, or the last chunk of a stream
+
+    Returns:
+        bool: True if the reply was cut off at the token limit
+    """
+    candidates = getattr(response, 'candidates', None)
+    if not candidates:
+        return False
+    reason = getattr(candidates[0], 'finish_reason', None)
+    return getattr(reason, 'name', reason) == "MAX_TOKENS" or reason == MAX_TOKENS_FINISH
+
+
+def reported_usage(response):
+    """
+    Read the token usage the API reported with a response, if any
+
+    Newer client libraries expose usage_metadata on responses (and on the
+    last chunk of a stream); older ones and the in-process fake do not.
+
+    Args:
+        response: A GenerateContentResponse or stream chunk
+
+    Returns:
+        tuple or None: (input tokens, output tokens), or None if not reported
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage or not getattr(usage, 'prompt_token_count', 0):
+        return None
+    return usage.prompt_token_count, getattr(usage, 'candidates_token_count', 0) or 0